@@ -1,18 +1,33 @@
 import asyncio
+import shlex
+import tempfile
+import time
 
-from aiogram.client.session import aiohttp
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
-from typing import Dict
-from aiogram import Bot, Dispatcher, Router, types
+from aiogram import Bot, Dispatcher, F, Router, types
 import environ
 import logging
 from pathlib import Path
-from aiogram.fsm.storage.memory import MemoryStorage
 from django.utils.text import slugify
-import requests
+from api_client import ShopAPIClient, ShopAPIError
+from catalog_cache import CatalogCache
+from catalog_import import (
+    ImportReport,
+    RowError,
+    category_lookup,
+    import_catalog,
+    read_rows,
+    validate_row,
+)
+from delivery import SendQueue, send_products
+from fsm_storage import make_storage
+from order_digest import OrderDigest
+from photo_cache import PhotoCache
 from urls import urls
+from webhook import WebhookConfig, serve_webhook
 from aiogram.fsm.context import FSMContext
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,6 +36,20 @@ env = environ.Env()
 env.read_env(BASE_DIR / ".env")
 
 TOKEN = env("TG_ADMIN_BOT_TOKEN")
+FSM_STORAGE = env("BOT_FSM_STORAGE", default="sqlite:///bot_state.sqlite3")
+
+IMPORT_PROGRESS_INTERVAL = 2
+"""Seconds between edits of the import progress message."""
+
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+"""Largest file the Bot API lets a bot download."""
+
+DIGEST_CHATS = env.list("ADMIN_BOT_DIGEST_CHATS", cast=int, default=[])
+DIGEST_INTERVAL = env.float("ADMIN_BOT_DIGEST_INTERVAL", default=60)
+DIGEST_MAX_ORDERS = env.int("ADMIN_BOT_DIGEST_MAX_ORDERS", default=20)
+ORDER_FEED_TOKEN = env("ORDER_FEED_TOKEN", default="")
+
+PRODUCT_EXAMPLE = 'title="Nike Air Max" price=99.90 category=Shoes'
 
 logging.basicConfig(level=logging.INFO)
 
@@ -44,21 +73,35 @@ class AdminPanel(StatesGroup):
 class TelegramAdminBot:
     def __init__(self) -> None:
         self.bot = Bot(token=TOKEN)
-        self.url = ""
-        self.dp = Dispatcher(storage=MemoryStorage())
+        storage, events_isolation = make_storage(FSM_STORAGE)
+        self.dp = Dispatcher(storage=storage, events_isolation=events_isolation)
         self.router = Router()
+        self.send_queue = SendQueue()
+        self.photos = PhotoCache.for_storage(storage)
+        self.api = ShopAPIClient(token=ORDER_FEED_TOKEN or None)
+        self.catalog = CatalogCache(self.api)
+        self.digest = OrderDigest(
+            self.bot,
+            self.api,
+            self.send_queue,
+            DIGEST_CHATS,
+            interval=DIGEST_INTERVAL,
+            max_orders=DIGEST_MAX_ORDERS,
+        )
         self.admin_menu = ReplyKeyboardMarkup(
             keyboard=[
                 [KeyboardButton(text="Change")],
                 [KeyboardButton(text="Delete")],
                 [KeyboardButton(text="Add")],
+                [KeyboardButton(text="Import")],
                 [KeyboardButton(text="List goods")],
             ],
             resize_keyboard=True,
         )
         self.setup_routes()
         self.dp.include_router(self.router)
-        self.catalog: Dict[str, Dict[str, str]] = {}
+        self.dp.startup.register(self.on_startup)
+        self.dp.shutdown.register(self.on_shutdown)
 
     def setup_routes(self) -> None:
         # Admin panel
@@ -71,6 +114,8 @@ class TelegramAdminBot:
             self.delete_product
         )
         self.router.message(lambda message: message.text == "Add")(self.add_product)
+        self.router.message(lambda message: message.text == "Import")(self.ask_import)
+        self.router.message.register(self.import_document, F.document)
 
         self.router.message.register(self.find_goods, AdminPanel.get)
         self.router.message.register(self.send_patch, AdminPanel.patch)
@@ -84,63 +129,98 @@ class TelegramAdminBot:
             reply_markup=self.admin_menu,
         )
 
+    async def on_startup(self) -> None:
+        """Starts the catalog refresh and the paid-order digest."""
+        self.catalog.start()
+        self.digest.start()
+
+    async def on_shutdown(self) -> None:
+        """Stops background work and closes the API connections."""
+        await self.digest.stop()
+        await self.catalog.stop()
+        await self.api.close()
+
     async def run(self) -> None:
         """Start bot"""
+        await self.bot.delete_webhook()
         await self.dp.start_polling(self.bot)
 
     async def list_goods(
-            self, message: types.Message, url: str = urls["products"]
+            self, message: types.Message, url: str = urls["catalog"]
     ) -> None:
-        """Requests the catalog from the API and displays it to the user."""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    ngrok_url = urls["ngrok_url"]
-                    for index, item in enumerate(data, 1):
-                        try:
-                            await message.answer(
-                                f"{index}. {item['title']} - {item['price']} USD"
-                            )
-                            image_url = item["image"].replace(
-                                "http://127.0.0.1:4421", ngrok_url
-                            )
-                            await message.answer_photo(photo=image_url)
-                            self.catalog[item["title"]] = item
-
-                        except Exception as e:
-                            await message.answer(
-                                f"Ошибка при обработке {index}-го элемента: {e}"
-                            )
-
-                else:
-                    await message.answer(
-                        "Failed to fetch the product catalog. Please try again later."
-                    )
+        """Requests the catalog from the API and displays it to the user.
+
+        The product list is cursor-paginated, so pages are followed through
+        their `next` links until the whole catalog has been shown. Products
+        are sent as captioned media groups through the send queue, by
+        `file_id` for photos Telegram already has.
+        """
+        index = 0
+        try:
+            async for items in self.api.iter_products(url):
+                await send_products(
+                    self.send_queue,
+                    self.bot,
+                    message.chat.id,
+                    items,
+                    index + 1,
+                    self.photos,
+                )
+                index += len(items)
+        except ShopAPIError:
+            await message.answer(
+                "Failed to fetch the product catalog. Please try again later."
+            )
+        except TelegramAPIError as e:
+            await message.answer(f"Failed to send the catalog: {e}")
 
     async def edit_product(self, message: types.Message, state: FSMContext) -> None:
         """Prompts the admin to enter the product name for editing."""
-        if not self.catalog:
-            await self.list_goods(message)
+        if not self.catalog.loaded:
+            self.catalog.refresh_soon()
 
         await message.answer("Enter the name of the product you want to edit:")
         await state.set_state(AdminPanel.get)
 
     async def find_goods(self, message: types.Message, state: FSMContext) -> None:
-        """Finds a product by name and prepares for patching."""
-        name = message.text
-        if not self.catalog:
-            await self.list_goods(message)
+        """Finds a product by name and prepares for patching.
+
+        The product id is kept in the admin's FSM data, so the patch can be
+        handled by any bot worker.
+        """
+        product = self.catalog.get(message.text or "")
+        if product is None:
+            await self.suggest_products(message, message.text or "")
             return
-        product_id = self.catalog[name]["id"]
-        self.url = f"{urls['products']}{product_id}/"
-        await self.list_goods(message, self.url)
+        await self.list_goods(message, f"{urls['products']}{product['id']}/")
         await state.clear()
+        await state.update_data(product_id=product["id"])
         await message.answer(
             'Specify the field to update (e.g., title="Nike Air Max").'
         )
         await state.set_state(AdminPanel.patch)
 
+    async def suggest_products(self, message: types.Message, name: str) -> None:
+        """Offers the products whose titles are closest to a name not found.
+
+        The titles are reply buttons, so tapping one sends the exact name.
+        """
+        matches = self.catalog.search(name)
+        if not matches:
+            await message.answer("Product not found, enter the exact product name:")
+            return
+        await message.answer(
+            "Product not found. Choose one of the closest products "
+            "or enter the exact product name:",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard=[
+                    [KeyboardButton(text=product["title"])] for product, _ in matches
+                ],
+                resize_keyboard=True,
+                one_time_keyboard=True,
+            ),
+        )
+
     async def send_patch(self, message: types.Message, state: FSMContext) -> None:
         """Sends a patch request to update product information."""
         if not message.text:
@@ -151,17 +231,20 @@ class TelegramAdminBot:
             return
         name, value = message.text.split("=")
         data = {name.strip(): value.strip()}
-        response = requests.patch(self.url, json=data)
-        if response.status_code == 200:
+        product_id = (await state.get_data())["product_id"]
+        try:
+            await self.api.update_product(product_id, data)
+        except ShopAPIError:
+            await message.answer("An error occurred while updating the product.")
+        else:
+            self.catalog.refresh_soon()
             await message.answer("Product updated successfully.")
             await state.clear()
-        else:
-            await message.answer("An error occurred while updating the product.")
 
     async def delete_product(self, message: types.Message, state: FSMContext) -> None:
         """Prompts the admin to enter the product name for deletion."""
-        if not self.catalog:
-            await self.list_goods(message)
+        if not self.catalog.loaded:
+            self.catalog.refresh_soon()
         await message.answer("Enter the name of the product you want to delete:")
         await state.set_state(AdminPanel.delete)
 
@@ -173,41 +256,143 @@ class TelegramAdminBot:
                 reply_markup=self.admin_menu,
             )
             return
-        name = message.text
-        product_id = self.catalog[name]["id"]
-        self.url = f"{urls['products']}{product_id}/"
-        response = requests.delete(self.url)
-        if response.status_code == 204:
+        product = self.catalog.get(message.text)
+        if product is None:
+            await self.suggest_products(message, message.text)
+            return
+        try:
+            await self.api.delete_product(product["id"])
+        except ShopAPIError:
+            await message.answer("An error occurred while deleting the product.")
+        else:
+            self.catalog.refresh_soon()
             await message.answer("Product deleted successfully.")
             await state.clear()
-        else:
-            await message.answer("An error occurred while deleting the product.")
 
     async def add_product(self, message: types.Message, state: FSMContext) -> None:
         """Prompts the admin to enter details for a new product."""
-        await message.answer("Enter product details (e.g., title=Chanel price=999).")
+        if not self.catalog.loaded:
+            self.catalog.refresh_soon()
+        await message.answer(
+            f"Enter product details (e.g., {PRODUCT_EXAMPLE}). "
+            "The category can be given by name, slug or id."
+        )
         await state.set_state(AdminPanel.post)
 
     async def send_post(self, message: types.Message, state: FSMContext) -> None:
-        """Sends a post request to add a new product to the catalog."""
+        """Sends a post request to add a new product to the catalog.
+
+        The details are `name=value` pairs, with quotes around values that
+        contain spaces, validated like the rows of an imported file.
+        """
         if not message.text:
             await message.answer(
                 "Something went wrong return to the main menu.",
                 reply_markup=self.admin_menu,
             )
             return
-        name, price = message.text.split(" ")
-        title = name.split("=")[-1]
-        price = float(price.split("=")[-1])
-        data = {"title": title, "slug": slugify(title), "price": price, "category": 2}
-        response = requests.post(urls["products"], json=data)
-        if response.status_code == 201:
+        try:
+            fields = {}
+            for part in shlex.split(message.text):
+                if "=" not in part:
+                    raise RowError(f"expected name=value, got '{part}'")
+                name, value = part.split("=", 1)
+                fields[name] = value
+            data = validate_row(
+                fields, category_lookup(list(self.catalog.categories.values()))
+            )
+            if "id" in data:
+                raise RowError("use Change to edit an existing product")
+        except ValueError as e:
+            await message.answer(
+                f"Invalid product details: {e}. Example: {PRODUCT_EXAMPLE}"
+            )
+            return
+        data.setdefault("slug", slugify(data["title"]))
+        try:
+            await self.api.create_product(data)
+        except ShopAPIError:
+            await message.answer("An error occurred while adding the product.")
+        else:
+            self.catalog.refresh_soon()
             await message.answer("New product added successfully.")
             await state.clear()
-        else:
-            await message.answer("An error occurred while adding the product.")
+
+    async def ask_import(self, message: types.Message) -> None:
+        """Explains the file format accepted for bulk imports."""
+        await message.answer(
+            "Send a CSV, XLSX or JSONL file with one product per row and the columns "
+            "title, price, category (name, slug or id) and optionally slug, brand, "
+            "description, discount and is_available. Rows with an id column update "
+            "that product instead of creating one."
+        )
+
+    async def import_document(self, message: types.Message, state: FSMContext) -> None:
+        """Imports the products of an uploaded CSV, XLSX or JSONL file.
+
+        The file is downloaded to a temporary directory and read a batch at a
+        time; each batch goes to the bulk endpoint in one request. Progress is
+        shown by editing a single message at most every
+        `IMPORT_PROGRESS_INTERVAL` seconds.
+        """
+        document = message.document
+        if document is None:
+            return
+        if (document.file_size or 0) > MAX_DOWNLOAD_SIZE:
+            await message.answer(
+                "The file is larger than 20 MB; split it into several files."
+            )
+            return
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "import"
+            try:
+                rows = read_rows(path, document.file_name or "")
+            except RowError as e:
+                await message.answer(str(e))
+                return
+            try:
+                if not self.catalog.loaded:
+                    await self.catalog.refresh()
+            except ShopAPIError:
+                await message.answer(
+                    "Failed to fetch the categories. Please try again later."
+                )
+                return
+            await self.bot.download(document, destination=path)
+
+            status = await message.answer("Importing…")
+            last_edit = 0.0
+
+            async def progress(report: ImportReport, done: bool = False) -> None:
+                nonlocal last_edit
+                if not done and time.monotonic() - last_edit < IMPORT_PROGRESS_INTERVAL:
+                    return
+                last_edit = time.monotonic()
+                text = report.summary(done)
+                try:
+                    await self.send_queue.send(
+                        message.chat.id, lambda: status.edit_text(text)
+                    )
+                except TelegramBadRequest:
+                    # The text did not change since the last edit.
+                    pass
+
+            report = await import_catalog(
+                self.api, rows, list(self.catalog.categories.values()), progress
+            )
+            await progress(report, done=True)
+
+        self.catalog.refresh_soon()
+        await state.clear()
 
 
 if __name__ == "__main__":
-    telegram_bot = TelegramAdminBot()
-    asyncio.run(telegram_bot.run())
+    if env.bool("ADMIN_BOT_WEBHOOK", default=False):
+        serve_webhook(
+            TelegramAdminBot,
+            WebhookConfig.from_env(env, "ADMIN_BOT", "/telegram/admin"),
+        )
+    else:
+        telegram_bot = TelegramAdminBot()
+        asyncio.run(telegram_bot.run())
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, TypedDict
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+import aiohttp
+from urls import urls
+
+RETRY_STATUSES = {502, 503, 504}
+"""Statuses of a server that is restarting or overloaded, worth retrying."""
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE"}
+
+logger = logging.getLogger(__name__)
+
+
+class Product(TypedDict, total=False):
+    """Product as returned by the shop API; `?fields=` may omit keys."""
+
+    id: int
+    title: str
+    slug: str
+    price: str
+    category: int
+    image: Optional[str]
+
+
+class Category(TypedDict):
+    """Category as returned by the shop API; `parent` is None for roots."""
+
+    id: int
+    name: str
+    slug: str
+    parent: Optional[int]
+
+
+class ProductPage(TypedDict):
+    """One cursor page of the product list."""
+
+    next: Optional[str]
+    previous: Optional[str]
+    results: List[Product]
+
+
+class CatalogChanges(TypedDict):
+    """Products changed and removed since a sync token."""
+
+    reset: bool
+    changed: List[Product]
+    deleted: List[int]
+    token: str
+
+
+class BulkResult(TypedDict):
+    """Ids of the products a bulk request created and updated."""
+
+    created: List[int]
+    updated: List[int]
+    deleted: int
+
+
+class CheckoutResult(TypedDict, total=False):
+    """Response of a successful checkout."""
+
+    checkout_url: str
+    api_test_url: Optional[str]
+    order_id: int
+    status_url: str
+
+
+class PaidOrderItem(TypedDict):
+    """Line of a paid order."""
+
+    title: Optional[str]
+    price: str
+    quantity: int
+
+
+class PaidOrder(TypedDict):
+    """Event of the paid-order feed with a summary of the order."""
+
+    id: int
+    order: int
+    amount: str
+    payment_provider: str
+    email: Optional[str]
+    items: List[PaidOrderItem]
+    created: str
+
+
+def page_cursor(url: Optional[str]) -> Optional[str]:
+    """Extracts the `cursor` parameter from a `next` or `previous` page link."""
+    if not url:
+        return None
+    return parse_qs(urlsplit(url).query).get("cursor", [None])[0]
+
+
+class ShopAPIError(Exception):
+    """Raised when the shop API cannot be reached or answers with an error."""
+
+    def __init__(
+        self, message: str, status: Optional[int] = None, data: Any = None
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.data = data
+
+
+class ShopAPIClient:
+    """Pooled async client for the shop API used by the bots.
+
+    One `aiohttp` session with keep-alive connections is shared by every
+    handler, so requests reuse connections instead of opening a session per
+    call. Each request has a timeout; idempotent requests (and POSTs that
+    carry an `Idempotency-Key`) are retried with backoff on connection
+    errors, timeouts and 502/503/504 answers. A `token` is sent as a
+    bearer token, which the paid-order feed requires.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.5,
+        pool_size: int = 100,
+        token: Optional[str] = None,
+    ) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.token = token
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the shared session, opening it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size, keepalive_timeout=30
+                ),
+                headers=(
+                    {"Authorization": f"Bearer {self.token}"} if self.token else None
+                ),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Closes the shared session and its connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        payload: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        """Sends a request and returns the decoded JSON body, or None if empty.
+
+        Raises:
+            ShopAPIError: If the API stays unreachable or answers with 4xx/5xx.
+        """
+        retry = method in IDEMPOTENT_METHODS or bool(
+            headers and "Idempotency-Key" in headers
+        )
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                async with self.session.request(
+                    method, url, json=payload, headers=headers
+                ) as response:
+                    if response.status in RETRY_STATUSES and attempt + 1 < attempts:
+                        logger.info(
+                            "%s %s answered %s, retrying", method, url, response.status
+                        )
+                        continue
+                    body = await response.read()
+                    try:
+                        data = json.loads(body) if body else None
+                    except ValueError:
+                        data = body.decode(errors="replace")
+                        if response.status < 400:
+                            raise ShopAPIError(
+                                f"{method} {url} returned invalid JSON",
+                                status=response.status,
+                            )
+                    if response.status >= 400:
+                        raise ShopAPIError(
+                            f"{method} {url} failed with {response.status}",
+                            status=response.status,
+                            data=data,
+                        )
+                    return data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt + 1 >= attempts:
+                    raise ShopAPIError(f"{method} {url} failed: {e!r}") from e
+                logger.info("%s %s failed with %r, retrying", method, url, e)
+        raise AssertionError("unreachable")
+
+    async def iter_products(
+        self, url: str = urls["catalog"]
+    ) -> AsyncIterator[List[Product]]:
+        """Yields the products of a list URL page by page, following `next` links.
+
+        A product detail URL yields a single page with that product.
+        """
+        next_url: Optional[str] = url
+        while next_url:
+            data = await self.request("GET", next_url)
+            next_url = data.get("next")
+            yield data["results"] if "results" in data else [data]
+
+    async def catalog_changes(self, since: Optional[str] = None) -> CatalogChanges:
+        """Returns the catalog changes since the `token` of an earlier call.
+
+        Without a token, or when the token has expired, `reset` is true and
+        `changed` holds the whole catalog.
+        """
+        url = urls["changes"]
+        if since:
+            url += f"&since={quote(since)}"
+        return await self.request("GET", url)
+
+    async def get_products_page(
+        self,
+        page_size: int,
+        category: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> ProductPage:
+        """Returns one page of products, optionally within a category subtree."""
+        query: Dict[str, Any] = {
+            "fields": "id,title,price,image",
+            "page_size": page_size,
+        }
+        if category:
+            query["category"] = category
+        if cursor:
+            query["cursor"] = cursor
+        return await self.request("GET", f"{urls['products']}?{urlencode(query)}")
+
+    async def list_categories(self) -> List[Category]:
+        """Returns every category."""
+        return await self.request("GET", urls["categories"])
+
+    async def get_product(self, product_id: int) -> Product:
+        """Returns one product."""
+        return await self.request("GET", f"{urls['products']}{product_id}/")
+
+    async def create_product(self, data: Dict[str, Any]) -> Product:
+        """Creates a product and returns it."""
+        return await self.request("POST", urls["products"], payload=data)
+
+    async def update_product(self, product_id: int, data: Dict[str, Any]) -> Product:
+        """Changes the given fields of a product and returns it."""
+        return await self.request(
+            "PATCH", f"{urls['products']}{product_id}/", payload=data
+        )
+
+    async def bulk_products(
+        self,
+        create: List[Dict[str, Any]],
+        update: List[Dict[str, Any]],
+        delete: Optional[List[int]] = None,
+    ) -> BulkResult:
+        """Applies a batch of product changes in one transaction."""
+        return await self.request(
+            "POST",
+            urls["bulk"],
+            payload={"create": create, "update": update, "delete": delete or []},
+        )
+
+    async def delete_product(self, product_id: int) -> None:
+        """Deletes a product."""
+        await self.request("DELETE", f"{urls['products']}{product_id}/")
+
+    async def paid_orders(self, after: int = 0, limit: int = 100) -> List[PaidOrder]:
+        """Returns the unacknowledged paid-order events after event `after`."""
+        return await self.request(
+            "GET",
+            f"{urls['paid_orders']}?{urlencode({'after': after, 'limit': limit})}",
+        )
+
+    async def ack_paid_orders(self, ids: List[int]) -> None:
+        """Acknowledges delivered paid-order events so they are not listed again."""
+        await self.request("POST", urls["paid_orders_ack"], payload={"ids": ids})
+
+    async def checkout(
+        self,
+        shipping_address: Dict[str, Any],
+        cart_items: List[Dict[str, Any]],
+        idempotency_key: str,
+    ) -> CheckoutResult:
+        """Places an order; retries are safe thanks to the idempotency key."""
+        return await self.request(
+            "POST",
+            urls["checkout"],
+            payload={"shipping_address": shipping_address, "cart_items": cart_items},
+            headers={"Idempotency-Key": idempotency_key},
+        )
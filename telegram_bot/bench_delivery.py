@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from api_client import Product
+from delivery import SendQueue, product_caption, public_image_url, send_products
+from fakes import FAKE_TOKEN, FakeTelegramSession, fake_catalog
+from photo_cache import PhotoCache
+
+
+async def send_serially(bot: Bot, chat_id: int, items: List[Product]) -> None:
+    """Sends a text and a photo per product one after another, as the bots did.
+
+    The old loop gave up on flood control; here it waits out `retry_after`
+    so both strategies deliver the whole catalog.
+    """
+    for index, item in enumerate(items, start=1):
+        calls: Tuple[Callable[[], Awaitable[Any]], ...] = (
+            lambda: bot.send_message(chat_id, product_caption(index, item)),
+            lambda: bot.send_photo(
+                chat_id, photo=public_image_url(item["image"] or "")
+            ),
+        )
+        for call in calls:
+            while True:
+                try:
+                    await call()
+                    break
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+
+
+async def run(strategy: str, options: argparse.Namespace) -> None:
+    """Delivers the catalog to every chat at once and prints one result row."""
+    session = FakeTelegramSession(
+        latency=options.latency,
+        chat_rate=options.chat_rate,
+        global_rate=options.global_rate,
+    )
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    items = fake_catalog(options.products)
+    queue = SendQueue(concurrency=options.concurrency)
+    cache = PhotoCache() if strategy == "file_id cache" else None
+
+    async def deliver(chat_id: int) -> None:
+        if strategy == "serial":
+            await send_serially(bot, chat_id, items)
+        else:
+            await send_products(queue, bot, chat_id, items, cache=cache)
+
+    if cache is not None:
+        # An earlier listing left the file_ids of every photo in the cache.
+        await deliver(0)
+        session.calls.clear()
+        session.rejected = session.downloads = 0
+        await asyncio.sleep(1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(deliver(chat_id) for chat_id in range(1, options.chats + 1)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{strategy:<14} {sum(session.calls.values()):>6} {session.rejected:>6} "
+        f"{session.downloads:>9} {elapsed:>9.2f}s"
+    )
+
+
+def main() -> None:
+    """Compares serial sends, media groups and media groups with cached file_ids."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark catalog delivery against a fake Telegram Bot API."
+    )
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.03)
+    parser.add_argument("--chat-rate", type=float, default=10.0)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    options = parser.parse_args()
+
+    print(
+        f"{options.products} products to {options.chats} chats, "
+        f"{options.latency * 1000:.0f}ms per call, limits {options.chat_rate:g}/s "
+        f"per chat and {options.global_rate:g}/s per bot"
+    )
+    print(f"{'strategy':<14} {'calls':>6} {'429s':>6} {'downloads':>9} {'time':>10}")
+    asyncio.run(run("serial", options))
+    asyncio.run(run("media groups", options))
+    asyncio.run(run("file_id cache", options))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import random
+import string
+import time
+from typing import List, Tuple
+
+from fuzzy import TrigramIndex, trigrams
+
+BRANDS = (
+    "Nike Adidas Puma Reebok Asics Converse Vans Fila Chanel Gucci Prada "
+    "Levis Zara Uniqlo Lacoste Diesel"
+).split()
+ADJECTIVES = (
+    "Classic Slim Running Leather Canvas Winter Summer Sport Vintage "
+    "Premium Casual Waterproof Knit Retro"
+).split()
+NOUNS = (
+    "Sneakers Jacket Hoodie Boots Sandals Cap Jeans Shirt Backpack Socks "
+    "Trainers Coat Dress Scarf"
+).split()
+
+
+def fake_titles(size: int, rng: random.Random) -> List[str]:
+    """Builds product titles that share words the way a real catalog does."""
+    return [
+        f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} "
+        f"{rng.choice(string.ascii_uppercase)}{rng.randint(100, 9999)}"
+        for _ in range(size)
+    ]
+
+
+def typo(title: str, rng: random.Random) -> str:
+    """Deletes, replaces or swaps one letter, as a hurried customer would."""
+    i = rng.randrange(len(title) - 1)
+    kind = rng.choice(["delete", "replace", "swap"])
+    if kind == "delete":
+        return title[:i] + title[i + 1 :]
+    if kind == "replace":
+        return title[:i] + rng.choice(string.ascii_lowercase) + title[i + 1 :]
+    return title[:i] + title[i + 1] + title[i] + title[i + 2 :]
+
+
+def linear_search(titles: List[str], query: str, limit: int) -> List[Tuple[int, float]]:
+    """Scores every title against the query, as a scan without an index would."""
+    grams = trigrams(query)
+    scores = []
+    for key, title in enumerate(titles):
+        title_grams = trigrams(title)
+        scores.append(
+            (key, 2 * len(grams & title_grams) / (len(grams) + len(title_grams)))
+        )
+    return sorted(scores, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def run(size: int, queries: int, scans: int, rng: random.Random) -> None:
+    """Indexes `size` titles and prints one result row."""
+    titles = fake_titles(size, rng)
+    start = time.perf_counter()
+    index: TrigramIndex[int] = TrigramIndex()
+    for key, title in enumerate(titles):
+        index.add(key, title)
+    build = time.perf_counter() - start
+
+    samples = [rng.randrange(size) for _ in range(queries)]
+    timings = []
+    top1 = top5 = 0
+    for key in samples:
+        query = typo(titles[key], rng)
+        start = time.perf_counter()
+        matches = index.search(query, limit=5)
+        timings.append(time.perf_counter() - start)
+        keys = [match for match, _ in matches]
+        top1 += keys[:1] == [key]
+        top5 += key in keys
+    timings.sort()
+
+    start = time.perf_counter()
+    for key in samples[:scans]:
+        linear_search(titles, typo(titles[key], rng), 5)
+    scan = (time.perf_counter() - start) / max(1, min(scans, len(samples)))
+
+    print(
+        f"{size:>8} {build:>8.2f}s {sum(timings) / len(timings) * 1000:>8.2f} "
+        f"{timings[int(len(timings) * 0.99)] * 1000:>8.2f} {scan * 1000:>10.1f} "
+        f"{top1 / queries:>7.0%} {top5 / queries:>7.0%}"
+    )
+
+
+def main() -> None:
+    """Measures trigram index lookups of mistyped titles against a linear scan."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark fuzzy product-name matching."
+    )
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument(
+        "--scans", type=int, default=5, help="queries timed with a full scan"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    print(
+        f"{'titles':>8} {'build':>9} {'mean ms':>8} {'p99 ms':>8} {'scan ms':>10} "
+        f"{'top-1':>7} {'top-5':>7}"
+    )
+    for size in map(int, options.sizes.split(",")):
+        run(size, options.queries, options.scans, rng)
+
+
+if __name__ == "__main__":
+    main()
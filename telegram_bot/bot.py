@@ -1,19 +1,26 @@
 import asyncio
 import logging
+import re
+from decimal import Decimal
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, List, Tuple
 
-import aiohttp
 import environ
-import requests
 from aiogram import Bot, Dispatcher, Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+from aiogram.types import InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
-from urls import urls
+from api_client import ShopAPIClient, ShopAPIError, page_cursor
+from catalog_browser import CatalogPage, ProductCard, page_keyboard, page_text
+from catalog_cache import CatalogCache
+from delivery import SendQueue, send_product
+from fsm_storage import make_storage
+from fuzzy import best_match
+from photo_cache import PhotoCache
+from webhook import WebhookConfig, serve_webhook
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,6 +28,14 @@ env = environ.Env()
 env.read_env(BASE_DIR / ".env")
 
 TOKEN = env("TG_BOT_TOKEN")
+CATALOG_TTL = env.int("BOT_CATALOG_TTL", default=60)
+CATALOG_PAGE_SIZE = env.int("BOT_CATALOG_PAGE_SIZE", default=8)
+FSM_STORAGE = env("BOT_FSM_STORAGE", default="sqlite:///bot_state.sqlite3")
+
+ORDER_LINE = re.compile(
+    r"^\s*(?P<name>.+?)\s+-\s+(?P<quantity>\d+)(\s*pcs)?\.?\s*$", re.IGNORECASE
+)
+"""One cart line typed by the customer, e.g. `Product 1 - 2 pcs`."""
 
 logging.basicConfig(level=logging.INFO)
 
@@ -41,9 +56,13 @@ class TelegramBot:
     def __init__(self) -> None:
         """Initializes the bot, dispatcher, router, and main/admin menus."""
         self.bot = Bot(token=TOKEN)
-        self.dp = Dispatcher(storage=MemoryStorage())
+        storage, events_isolation = make_storage(FSM_STORAGE)
+        self.dp = Dispatcher(storage=storage, events_isolation=events_isolation)
         self.router = Router()
-        self.catalog_data: Dict[str, Dict] = {}
+        self.send_queue = SendQueue()
+        self.photos = PhotoCache.for_storage(storage)
+        self.api = ShopAPIClient()
+        self.catalog = CatalogCache(self.api, ttl=CATALOG_TTL)
         self.menu = ReplyKeyboardMarkup(
             keyboard=[
                 [KeyboardButton(text="Catalog")],
@@ -51,72 +70,153 @@ class TelegramBot:
             ],
             resize_keyboard=True,
         )
-        self.cart = []
+        self.order_menu = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="Checkout")]],
+            resize_keyboard=True,
+        )
         self.setup_routes()
+        self.dp.include_router(self.router)
+        self.dp.startup.register(self.on_startup)
+        self.dp.shutdown.register(self.on_shutdown)
 
     def setup_routes(self) -> None:
         """Sets up command and message routes for the bot's functionalities."""
         self.router.message(Command(commands=["start"]))(self.start_command)
-        self.router.message(lambda message: message.text == "Catalog")(self.get_request)
+        self.router.message(lambda message: message.text == "Catalog")(
+            self.show_catalog
+        )
+        self.router.callback_query.register(self.catalog_page, CatalogPage.filter())
+        self.router.callback_query.register(self.product_card, ProductCard.filter())
         self.router.message(lambda message: message.text == "Make Order")(
             self.make_order
         )
+        self.router.message.register(
+            self.checkout_cart,
+            OrderStates.make_order,
+            lambda message: message.text == "Checkout",
+        )
         self.router.message.register(self.process_order_input, OrderStates.make_order)
         self.router.message.register(
             self.process_shipping_input, OrderStates.shipping_address
         )
 
-    async def start_command(self, message: types.Message) -> None:
+    async def start_command(self, message: types.Message, state: FSMContext) -> None:
         """Handles the /start command by displaying a welcome message and catalog."""
         await message.answer(
             "Hello! I am your shop bot. Choose a command: Our goods Here",
             reply_markup=self.menu,
         )
-        await self.get_request(message)
+        await self.show_catalog(message, state)
 
     async def back_to_main_menu(self, message: types.Message) -> None:
         """Returns the user to the main menu."""
         await message.answer("Returning to the main menu.", reply_markup=self.menu)
 
-    async def get_request(
-            self, message: types.Message, url: str = urls["products"]
+    async def show_catalog(self, message: types.Message, state: FSMContext) -> None:
+        """Sends the first catalog page as one message with inline navigation."""
+        try:
+            text, markup = await self.render_page(state, category=0, page=0)
+        except ShopAPIError:
+            await message.answer(
+                "Failed to fetch the product catalog. Please try again later."
+            )
+            return
+        await message.answer(text, reply_markup=markup)
+
+    async def catalog_page(
+            self,
+            callback: types.CallbackQuery,
+            callback_data: CatalogPage,
+            state: FSMContext,
     ) -> None:
-        """Requests the product catalog from the API and displays it to the user."""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    ngrok_url = urls["ngrok_url"]
-                    for index, item in enumerate(data, 1):
-                        try:
-                            await message.answer(
-                                f"{index}. {item['title']} - {item['price']} USD"
-                            )
-                            image_url = item["image"].replace(
-                                "http://127.0.0.1:4421", ngrok_url
-                            )
-                            await message.answer_photo(photo=image_url)
-                            self.catalog_data[item["title"]] = item
-
-                        except Exception as e:
-                            await message.answer(
-                                f"Ошибка при обработке {index}-го элемента: {e}"
-                            )
-
-                else:
-                    await message.answer(
-                        "Failed to fetch the product catalog. Please try again later."
-                    )
+        """Edits the catalog message in place to show another page or category."""
+        try:
+            text, markup = await self.render_page(
+                state, callback_data.category, callback_data.page
+            )
+        except ShopAPIError:
+            await callback.answer(
+                "Failed to fetch the product catalog. Please try again later.",
+                show_alert=True,
+            )
+            return
+        if isinstance(callback.message, types.Message):
+            try:
+                await callback.message.edit_text(text, reply_markup=markup)
+            except TelegramBadRequest:
+                # A repeated tap leaves the message unchanged.
+                pass
+        await callback.answer()
+
+    async def render_page(
+            self, state: FSMContext, category: int, page: int
+    ) -> Tuple[str, InlineKeyboardMarkup]:
+        """Fetches one page of products and renders the catalog message.
+
+        Page numbers travel in the buttons, while the API cursors of the pages
+        seen so far are kept in the user's FSM data, so every step forward or
+        back costs one API call. Categories come from the catalog cache.
+        """
+        browsing = (await state.get_data()).get("catalog_browsing", {})
+        cursors: List[Any] = [None]
+        if browsing.get("category") == category:
+            cursors = browsing["cursors"]
+        if page >= len(cursors):
+            # A button of an old message whose cursors are gone.
+            page = 0
+
+        result = await self.api.get_products_page(
+            CATALOG_PAGE_SIZE, category or None, cursors[page]
+        )
+        next_cursor = page_cursor(result["next"])
+        cursors = cursors[: page + 1] + ([next_cursor] if next_cursor else [])
+        await state.update_data(
+            catalog_browsing={"category": category, "cursors": cursors}
+        )
+
+        path = self.catalog.category_path(category or None)
+        parent = path[-2]["id"] if len(path) > 1 else None
+        products = result["results"]
+        markup = page_keyboard(
+            products,
+            self.catalog.subcategories(category or None),
+            category,
+            parent,
+            page,
+            page * CATALOG_PAGE_SIZE + 1,
+            has_next=next_cursor is not None,
+        )
+        return page_text(path, page, products), markup
+
+    async def product_card(
+            self, callback: types.CallbackQuery, callback_data: ProductCard
+    ) -> None:
+        """Sends the photo and price of a product tapped in the catalog."""
+        product = self.catalog.products.get(callback_data.id)
+        if product is None:
+            try:
+                product = await self.api.get_product(callback_data.id)
+            except ShopAPIError:
+                await callback.answer(
+                    "This product is no longer available.", show_alert=True
+                )
+                return
+        await callback.answer()
+        await send_product(
+            self.send_queue, self.bot, callback.from_user.id, product, self.photos
+        )
 
     async def make_order(self, message: types.Message, state: FSMContext) -> None:
         """
         Initiates the order creation process, prompting the user for product name and quantity.
         """
-        if not self.catalog_data:
-            await self.get_request(message)
+        if not self.catalog.loaded:
+            self.catalog.refresh_soon()
 
         await message.answer(
-            "Please enter the product name and quantity (e.g., Product 1 - 2 pcs)"
+            "Please enter the product name and quantity (e.g., Product 1 - 2 pcs). "
+            "Put several products on separate lines.",
+            reply_markup=self.order_menu,
         )
         await state.set_state(OrderStates.make_order)
 
@@ -124,44 +224,94 @@ class TelegramBot:
             self, message: types.Message, state: FSMContext
     ) -> None:
         """
-        Processes user input for creating an order, calculating the total price.
+        Adds the products typed by the user to their cart and shows the total.
+
+        Products are looked up in the shared catalog cache, and the cart is
+        kept in the user's FSM data, so customers never see each other's
+        orders. A mistyped name is replaced by the product it clearly
+        matches; otherwise the closest titles are suggested.
         """
-        try:
-            if not message.text:
+        if not message.text:
+            await message.answer(
+                "Something went wrong return to the main menu.",
+                reply_markup=self.menu,
+            )
+            return
+        if not self.catalog.loaded:
+            self.catalog.refresh_soon()
+            await message.answer(
+                "The catalog is still loading, please try again in a moment."
+            )
+            return
+
+        additions: List[Dict[str, Any]] = []
+        corrections: List[str] = []
+        for line in message.text.splitlines():
+            if not line.strip():
+                continue
+            match = ORDER_LINE.match(line)
+            if match is None or int(match["quantity"]) < 1:
                 await message.answer(
-                    "Something went wrong return to the main menu.",
-                    reply_markup=self.menu,
+                    "Invalid input format. Please use the format: "
+                    "Product name - quantity (e.g., Product 1 - 2 pcs)."
                 )
                 return
-            product_name, quantity = message.text.split(" - ")
-
-            if product_name in self.catalog_data:
-                product_data = self.catalog_data[product_name]
-                total_price = float(product_data["price"]) * int(quantity)
-                price = float(product_data["price"])
-                self.cart = [
-                    {
-                        "product_name": product_name,
-                        "price": price,
-                        "quantity": int(quantity),
-                    }
-                ]
-                await message.answer(
-                    f"You ordered {quantity} pcs of {product_name}.\n"
-                    f"Total price: {total_price} USD.\n"
-                )
+            product = self.catalog.get(match["name"])
+            if product is None:
+                matches = self.catalog.search(match["name"], limit=3)
+                product = best_match(matches)
+                if product is None:
+                    suggestions = ", ".join(item["title"] for item, _ in matches)
+                    await message.answer(
+                        f"The product '{match['name']}' is not available "
+                        "in our catalog. "
+                        + (f"Did you mean: {suggestions}? " if suggestions else "")
+                        + "Please try again."
+                    )
+                    return
+                corrections.append(f"'{match['name']}' was read as {product['title']}.")
+            additions.append(
+                {
+                    "product_name": product["title"],
+                    "price": product["price"],
+                    "quantity": int(match["quantity"]),
+                }
+            )
 
-                await self.get_shipping_address(message, state)
+        cart: List[Dict[str, Any]] = (await state.get_data()).get("cart", [])
+        for addition in additions:
+            for entry in cart:
+                if entry["product_name"] == addition["product_name"]:
+                    entry["quantity"] += addition["quantity"]
+                    entry["price"] = addition["price"]
+                    break
             else:
-                await message.answer(
-                    f"The product '{product_name}' is not available in our catalog. "
-                    f"Please try again."
-                )
-        except ValueError:
+                cart.append(addition)
+        await state.update_data(cart=cart)
+
+        total_price = sum(Decimal(entry["price"]) * entry["quantity"] for entry in cart)
+        summary = "\n".join(
+            f"{entry['quantity']} pcs of {entry['product_name']}" for entry in cart
+        )
+        notes = "".join(f"{correction}\n" for correction in corrections)
+        await message.answer(
+            f"{notes}Your cart:\n{summary}\n"
+            f"Total price: {total_price} USD.\n"
+            "Add more products, or press Checkout to enter the shipping address.",
+            reply_markup=self.order_menu,
+        )
+
+    async def checkout_cart(self, message: types.Message, state: FSMContext) -> None:
+        """
+        Moves on to the shipping address once the cart has products.
+        """
+        if not (await state.get_data()).get("cart"):
             await message.answer(
-                "Invalid input format. Please use the format: "
-                "Product name - quantity (e.g., Product 1 - 2 pcs)."
+                "Your cart is empty. Please enter the product name and quantity "
+                "(e.g., Product 1 - 2 pcs)."
             )
+            return
+        await self.get_shipping_address(message, state)
 
     async def get_shipping_address(
             self, message: types.Message, state: FSMContext
@@ -200,48 +350,67 @@ class TelegramBot:
                 address_parts
             )
 
-            data = {
-                "shipping_address": {
-                    "full_name": full_name,
-                    "email": email,
-                    "street_address": street_address,
-                    "apartment_address": apartment_address,
-                    "city": city,
-                    "country": country,
-                },
-                "cart_items": self.cart,
+            shipping_address = {
+                "full_name": full_name,
+                "email": email,
+                "street_address": street_address,
+                "apartment_address": apartment_address,
+                "city": city,
+                "country": country,
             }
-            response = await asyncio.to_thread(
-                requests.post, urls["checkout"], json=data
-            )
-
-            if response.status_code == 201:
-                response_data = response.json()
-                checkout_url = response_data.get("checkout_url")
-                checkout_url_api = response_data.get("api_test_url")
-                await message.answer(
-                    f"Your order has been processed successfully! "
-                    f"Complete your payment with stripe: {checkout_url}\n"
-                    f"-----------------------------------\n"
-                    f"Complete your payment with test api: {checkout_url_api}"
+            # Telegram redelivers the same message on retries, so the message id
+            # makes the checkout idempotent across them.
+            idempotency_key = f"tg-{message.chat.id}-{message.message_id}"
+            cart = (await state.get_data()).get("cart", [])
+            try:
+                response_data = await self.api.checkout(
+                    shipping_address, cart, idempotency_key
                 )
-            else:
+            except ShopAPIError:
+                # Keep the cart and the shipping state so the address can be
+                # sent again.
                 await message.answer(
-                    "There was an error processing your order. Please try again later."
+                    "There was an error processing your order. "
+                    "Please send the address again later."
                 )
+                return
+            await state.clear()
+            checkout_url = response_data.get("checkout_url")
+            checkout_url_api = response_data.get("api_test_url")
+            await message.answer(
+                f"Your order has been processed successfully! "
+                f"Complete your payment with stripe: {checkout_url}\n"
+                f"-----------------------------------\n"
+                f"Complete your payment with test api: {checkout_url_api}",
+                reply_markup=self.menu,
+            )
         except Exception:
             await message.answer("An error occurred while processing your order.")
-        await state.clear()
 
     async def run(self) -> None:
         """
         Starts the bot and its handlers, initiating polling for new messages.
         """
-        self.dp.include_router(self.router)
         await self.bot.delete_webhook(drop_pending_updates=True)
         await self.dp.start_polling(self.bot)
 
+    async def on_startup(self) -> None:
+        """
+        Starts the catalog refresh when polling or the webhook app starts.
+        """
+        self.catalog.start()
+
+    async def on_shutdown(self) -> None:
+        """
+        Stops background work and closes the API connections.
+        """
+        await self.catalog.stop()
+        await self.api.close()
+
 
 if __name__ == "__main__":
-    telegram_bot = TelegramBot()
-    asyncio.run(telegram_bot.run())
+    if env.bool("BOT_WEBHOOK", default=False):
+        serve_webhook(TelegramBot, WebhookConfig.from_env(env, "BOT", "/telegram/shop"))
+    else:
+        telegram_bot = TelegramBot()
+        asyncio.run(telegram_bot.run())
@@ -0,0 +1,85 @@
+from typing import List, Optional
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from api_client import Category, Product
+from delivery import product_caption
+
+
+class CatalogPage(CallbackData, prefix="catalog"):
+    """Button data opening a page of a category; category 0 is the whole catalog."""
+
+    category: int
+    page: int
+
+
+class ProductCard(CallbackData, prefix="product"):
+    """Button data showing one product with its photo."""
+
+    id: int
+
+
+def page_text(path: List[Category], page: int, products: List[Product]) -> str:
+    """Formats the catalog message: breadcrumb, page number and product list."""
+    breadcrumb = " › ".join(["Catalog"] + [category["name"] for category in path])
+    if not products:
+        return f"{breadcrumb}\n\nNo products here yet."
+    return f"{breadcrumb} · page {page + 1}\n\nTap a product to see its photo."
+
+
+def page_keyboard(
+    products: List[Product],
+    subcategories: List[Category],
+    category: int,
+    parent: Optional[int],
+    page: int,
+    first_index: int,
+    has_next: bool,
+) -> InlineKeyboardMarkup:
+    """Builds the product, subcategory and navigation buttons of a page."""
+    rows = [
+        [
+            InlineKeyboardButton(
+                text=product_caption(first_index + offset, product),
+                callback_data=ProductCard(id=product["id"]).pack(),
+            )
+        ]
+        for offset, product in enumerate(products)
+    ]
+    rows += [
+        [
+            InlineKeyboardButton(
+                text=f"📂 {subcategory['name']}",
+                callback_data=CatalogPage(category=subcategory["id"], page=0).pack(),
+            )
+        ]
+        for subcategory in subcategories
+    ]
+
+    navigation = []
+    if page > 0:
+        navigation.append(
+            InlineKeyboardButton(
+                text="◀ Prev",
+                callback_data=CatalogPage(category=category, page=page - 1).pack(),
+            )
+        )
+    if has_next:
+        navigation.append(
+            InlineKeyboardButton(
+                text="Next ▶",
+                callback_data=CatalogPage(category=category, page=page + 1).pack(),
+            )
+        )
+    if navigation:
+        rows.append(navigation)
+    if category:
+        rows.append(
+            [
+                InlineKeyboardButton(
+                    text="⬆ Back",
+                    callback_data=CatalogPage(category=parent or 0, page=0).pack(),
+                )
+            ]
+        )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
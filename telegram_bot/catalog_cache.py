@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from api_client import Category, Product, ShopAPIClient, ShopAPIError
+from fuzzy import TrigramIndex
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """Process-wide copy of the catalog shared by every user of a bot.
+
+    The first load downloads the catalog once; after that a background task
+    asks the API only for the products changed since the last sync (the
+    `products/changes/` endpoint) every `ttl / 2` seconds, along with the
+    small category list. Handlers look products up in memory and never
+    download the catalog themselves. If the background task falls behind
+    and the copy is older than `ttl`, a lookup starts a refresh without
+    waiting for it. A trigram index over the titles, updated with each
+    sync, finds products from mistyped names.
+    """
+
+    def __init__(self, api: ShopAPIClient, ttl: float = 60) -> None:
+        self.api = api
+        self.ttl = ttl
+        self.products: Dict[int, Product] = {}
+        self.by_title: Dict[str, Product] = {}
+        self.index: TrigramIndex[int] = TrigramIndex()
+        self.categories: Dict[int, Category] = {}
+        self.token: Optional[str] = None
+        self.synced_at: Optional[float] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the catalog has been downloaded at least once."""
+        return self.synced_at is not None
+
+    @property
+    def stale(self) -> bool:
+        """Whether the last successful sync is older than the TTL."""
+        return self.synced_at is None or time.monotonic() - self.synced_at > self.ttl
+
+    async def refresh(self) -> None:
+        """Applies the changes since the last sync to the in-memory catalog.
+
+        Concurrent callers share one request.
+        """
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._sync())
+        await asyncio.shield(self._refreshing)
+
+    async def _sync(self) -> None:
+        changes, categories = await asyncio.gather(
+            self.api.catalog_changes(self.token), self.api.list_categories()
+        )
+        if changes["reset"]:
+            products = {product["id"]: product for product in changes["changed"]}
+            # Indexing a large catalog takes seconds; do it off the event loop.
+            index = await asyncio.to_thread(
+                TrigramIndex.from_items,
+                [(product["id"], product["title"]) for product in changes["changed"]],
+            )
+        else:
+            products = dict(self.products)
+            index = self.index
+            for product_id in changes["deleted"]:
+                products.pop(product_id, None)
+                index.remove(product_id)
+            for product in changes["changed"]:
+                products[product["id"]] = product
+                index.add(product["id"], product["title"])
+        # Swap whole dicts so readers never see a half-applied sync.
+        self.products = products
+        self.by_title = {product["title"]: product for product in products.values()}
+        self.index = index
+        self.categories = {category["id"]: category for category in categories}
+        self.token = changes["token"]
+        self.synced_at = time.monotonic()
+
+    def refresh_soon(self) -> None:
+        """Starts a refresh in the background unless one is running."""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._sync())
+            self._refreshing.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Catalog refresh failed: %r", task.exception())
+
+    def get(self, title: str) -> Optional[Product]:
+        """Returns the product with this exact title, if it is in the catalog."""
+        if self.stale:
+            self.refresh_soon()
+        return self.by_title.get(title)
+
+    def search(self, name: str, limit: int = 5) -> List[Tuple[Product, float]]:
+        """Returns the products whose titles are most similar to `name`, best first."""
+        if self.stale:
+            self.refresh_soon()
+        return [
+            (self.products[product_id], score)
+            for product_id, score in self.index.search(name, limit)
+        ]
+
+    def subcategories(self, parent: Optional[int]) -> List[Category]:
+        """Returns the direct children of a category, or the roots for None."""
+        return [
+            category
+            for category in self.categories.values()
+            if category["parent"] == parent
+        ]
+
+    def category_path(self, category_id: Optional[int]) -> List[Category]:
+        """Returns the categories from the root down to `category_id`."""
+        path: List[Category] = []
+        while category_id is not None and category_id in self.categories:
+            category = self.categories[category_id]
+            path.insert(0, category)
+            category_id = category["parent"]
+        return path
+
+    def all(self) -> List[Product]:
+        """Returns every cached product."""
+        if self.stale:
+            self.refresh_soon()
+        return list(self.products.values())
+
+    def start(self) -> None:
+        """Starts the background refresh loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background refresh loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except ShopAPIError as e:
+                logger.warning("Catalog refresh failed: %s", e)
+            await asyncio.sleep(self.ttl / 2)
@@ -0,0 +1,277 @@
+import asyncio
+import csv
+import itertools
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+from api_client import Category, ShopAPIClient, ShopAPIError
+
+IMPORT_BATCH_SIZE = 500
+"""Rows sent to the bulk endpoint per request; it accepts up to 5000."""
+
+FORMATS = (".csv", ".jsonl", ".ndjson", ".xlsx")
+
+TRUE_VALUES = {"1", "true", "yes", "y"}
+FALSE_VALUES = {"0", "false", "no", "n"}
+
+Row = Tuple[int, Any]
+"""Row number in the file and the row as read: a dict, or a JSON line."""
+
+
+class RowError(ValueError):
+    """Raised for a row that cannot be imported."""
+
+
+def read_csv(path: Path) -> Iterator[Row]:
+    """Yields the rows of a CSV file with a header line."""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        for number, row in enumerate(csv.DictReader(file), start=2):
+            yield number, row
+
+
+def read_jsonl(path: Path) -> Iterator[Row]:
+    """Yields the non-blank lines of a JSON Lines file."""
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                yield number, line
+
+
+def read_xlsx(path: Path) -> Iterator[Row]:
+    """Yields the rows of the first sheet of a workbook with a header row.
+
+    Requires the `openpyxl` package; the sheet is read in streaming mode.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(name or "").strip() for name in next(rows, ())]
+        for number, values in enumerate(rows, start=2):
+            if any(value is not None for value in values):
+                yield number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(path: Path, file_name: str) -> Iterator[Row]:
+    """Picks the reader for a file from its name.
+
+    Raises:
+        RowError: If the format is not supported.
+    """
+    suffix = Path(file_name).suffix.lower()
+    if suffix == ".csv":
+        return read_csv(path)
+    if suffix in (".jsonl", ".ndjson"):
+        return read_jsonl(path)
+    if suffix == ".xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise RowError(
+                "XLSX files need the openpyxl package; send CSV or JSONL."
+            ) from None
+        return read_xlsx(path)
+    raise RowError(
+        f"Unsupported file type '{suffix}', use one of {', '.join(FORMATS)}."
+    )
+
+
+def category_lookup(categories: List[Category]) -> Dict[str, int]:
+    """Maps category ids, slugs and names (case-insensitive) to ids."""
+    lookup: Dict[str, int] = {}
+    for category in categories:
+        for key in (str(category["id"]), category["slug"], category["name"]):
+            lookup[key.casefold()] = category["id"]
+    return lookup
+
+
+def validate_row(raw: Any, categories: Dict[str, int]) -> Dict[str, Any]:
+    """Turns one row into a create (no `id`) or update (with `id`) payload.
+
+    Columns: `id`, `title`, `slug`, `brand`, `description`, `price`,
+    `discount`, `category` (id, slug or name) and `is_available`. Blank
+    cells are ignored; `title`, `price` and `category` are required to
+    create a product.
+
+    Raises:
+        RowError: If the row is malformed.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            raise RowError(f"invalid JSON ({e})") from None
+    if not isinstance(raw, dict):
+        raise RowError("expected an object")
+
+    values = {
+        str(name).strip().lower(): value.strip() if isinstance(value, str) else value
+        for name, value in raw.items()
+        if name is not None and value not in (None, "")
+    }
+    item: Dict[str, Any] = {}
+    for name in ("title", "slug", "brand", "description"):
+        if name in values:
+            item[name] = str(values[name])
+    try:
+        if "id" in values:
+            item["id"] = int(values["id"])
+        if "price" in values:
+            price = Decimal(str(values["price"]))
+        if "discount" in values:
+            item["discount"] = int(values["discount"])
+    except (ValueError, InvalidOperation):
+        raise RowError("id, price and discount must be numbers") from None
+    if "price" in values:
+        if not price.is_finite() or price < 0 or price >= 100000:
+            raise RowError(f"price out of range: {values['price']}")
+        item["price"] = str(price.quantize(Decimal("0.01")))
+    if "discount" in item and not 0 <= item["discount"] <= 100:
+        raise RowError(f"discount out of range: {values['discount']}")
+    if "category" in values:
+        key = str(values["category"]).casefold()
+        if key.endswith(".0"):
+            # Spreadsheets store whole numbers as floats.
+            key = key[:-2]
+        if key not in categories:
+            raise RowError(f"unknown category: {values['category']}")
+        item["category"] = categories[key]
+    if "is_available" in values:
+        flag = str(values["is_available"]).casefold()
+        if flag not in TRUE_VALUES | FALSE_VALUES:
+            raise RowError(
+                f"is_available must be true or false: {values['is_available']}"
+            )
+        item["is_available"] = flag in TRUE_VALUES
+
+    if "id" not in item:
+        missing = [name for name in ("title", "price", "category") if name not in item]
+        if missing:
+            raise RowError(f"missing {', '.join(missing)}")
+    elif len(item) == 1:
+        raise RowError("nothing to update")
+    return item
+
+
+@dataclass
+class ImportReport:
+    """Running totals of an import."""
+
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+    max_errors: int = 10
+
+    def error(self, message: str, rows: int = 1) -> None:
+        """Counts failed rows and keeps the first few messages."""
+        self.failed += rows
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def summary(self, done: bool = False) -> str:
+        """Formats the progress message."""
+        lines = [
+            f"{'Import finished' if done else 'Importing'}: {self.rows} rows read, "
+            f"{self.created} created, {self.updated} updated, {self.failed} failed."
+        ]
+        lines += self.errors
+        if self.failed and len(self.errors) == self.max_errors:
+            lines.append("…")
+        return "\n".join(lines)
+
+
+def describe(error: ShopAPIError) -> str:
+    """Shortens the validation errors of a rejected batch."""
+    if error.data is None:
+        return str(error)
+    text = error.data if isinstance(error.data, str) else json.dumps(error.data)
+    return text if len(text) <= 300 else text[:300] + "…"
+
+
+async def send_batch(
+    api: ShopAPIClient, items: List[Tuple[int, Dict[str, Any]]], report: ImportReport
+) -> None:
+    """Sends validated rows to the bulk endpoint and counts the outcome.
+
+    The endpoint saves all rows of a batch or none, so when it rejects a
+    batch (for example for a slug already in use) the batch is split in
+    halves and resent, until the rejected rows are alone and the others
+    are saved.
+    """
+    create = [item for _, item in items if "id" not in item]
+    update = [item for _, item in items if "id" in item]
+    try:
+        result = await api.bulk_products(create, update)
+    except ShopAPIError as e:
+        if e.status == 400 and len(items) > 1:
+            middle = len(items) // 2
+            await send_batch(api, items[:middle], report)
+            await send_batch(api, items[middle:], report)
+        elif len(items) == 1:
+            report.error(f"Row {items[0][0]}: {describe(e)}")
+        else:
+            report.error(
+                f"Rows {items[0][0]}-{items[-1][0]} failed: {describe(e)}",
+                rows=len(items),
+            )
+        return
+    report.created += len(result["created"])
+    report.updated += len(result["updated"])
+
+
+async def import_catalog(
+    api: ShopAPIClient,
+    rows: Iterator[Row],
+    categories: List[Category],
+    progress: Callable[[ImportReport], Awaitable[None]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportReport:
+    """Validates rows and sends them to the bulk endpoint in batches.
+
+    Rows are read in a worker thread one batch at a time, so a large file
+    is never loaded whole and parsing does not block the event loop. Rows
+    that fail validation or that the API rejects are reported and skipped.
+    If the file cannot be read further, the import stops with the rows
+    sent so far. `progress` is awaited after every batch.
+    """
+    lookup = category_lookup(categories)
+    report = ImportReport()
+    while True:
+        try:
+            batch = await asyncio.to_thread(list, itertools.islice(rows, batch_size))
+        except Exception as e:
+            # Undecodable text, broken CSV quoting or a damaged workbook.
+            report.error(f"Stopped reading the file: {e}", rows=0)
+            return report
+        if not batch:
+            return report
+        report.rows += len(batch)
+
+        items: List[Tuple[int, Dict[str, Any]]] = []
+        updated = set()
+        for number, raw in batch:
+            try:
+                item = validate_row(raw, lookup)
+            except RowError as e:
+                report.error(f"Row {number}: {e}")
+                continue
+            if item.get("id") in updated:
+                report.error(
+                    f"Row {number}: product {item['id']} changed twice in a batch"
+                )
+                continue
+            if "id" in item:
+                updated.add(item["id"])
+            items.append((number, item))
+
+        if items:
+            await send_batch(api, items, report)
+        await progress(report)
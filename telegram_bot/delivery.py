@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import weakref
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+)
+from api_client import Product
+from photo_cache import PhotoCache, image_hash
+from urls import urls
+
+MEDIA_GROUP_SIZE = 10
+"""Most photos Telegram accepts in one media group."""
+
+MediaGroupItem = Union[
+    InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+]
+"""Media `Bot.send_media_group` accepts; the bots only send photos."""
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def public_image_url(image: str) -> str:
+    """Rewrites a local product image URL to the public tunnel Telegram can reach."""
+    return image.replace("http://127.0.0.1:4421", urls["ngrok_url"])
+
+
+def product_caption(index: int, item: Product) -> str:
+    """Formats the numbered catalog line of a product."""
+    return f"{index}. {item['title']} - {item['price']} USD"
+
+
+class SendQueue:
+    """Sends Telegram API calls with bounded concurrency and flood-control retries.
+
+    At most `concurrency` calls are in flight for all chats together, calls
+    for the same chat are sent one after another so messages keep their
+    order, and a call answered with 429 is retried after the `retry_after`
+    Telegram asks for. Only the chat that was limited waits; other chats
+    keep sending.
+    """
+
+    def __init__(self, concurrency: int = 8, max_retries: int = 5) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.retries = 0
+        self.chat_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def chat_lock(self, chat_id: int) -> asyncio.Lock:
+        """Returns the lock keeping the sends of one chat in order."""
+        lock = self.chat_locks.get(chat_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.chat_locks[chat_id] = lock
+        return lock
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Runs `call`, retrying it while Telegram answers with flood control."""
+        async with self.chat_lock(chat_id):
+            attempt = 0
+            while True:
+                async with self.semaphore:
+                    try:
+                        return await call()
+                    except TelegramRetryAfter as e:
+                        if attempt >= self.max_retries:
+                            raise
+                        retry_after = e.retry_after
+                attempt += 1
+                self.retries += 1
+                logger.info(
+                    "Flood control in chat %s, retry in %ss", chat_id, retry_after
+                )
+                # Wait outside the semaphore so other chats can use the slot.
+                await asyncio.sleep(retry_after)
+
+
+async def send_photos(
+    queue: SendQueue,
+    bot: Bot,
+    chat_id: int,
+    photos: List[Tuple[Product, str]],
+    cache: Optional[PhotoCache] = None,
+) -> None:
+    """Sends captioned product photos as one photo or one media group.
+
+    With a cache, photos Telegram already has are sent by `file_id`, and
+    the `file_id`s of the ones sent by URL are recorded. If Telegram
+    rejects a batch with cached ids (for example after they expired), the
+    ids are dropped and the batch is sent by URL once more.
+    """
+    file_ids = (
+        await cache.get_many(bot.id, [item for item, _ in photos]) if cache else {}
+    )
+    media: List[MediaGroupItem] = [
+        InputMediaPhoto(
+            media=file_ids.get(item["id"]) or public_image_url(item["image"] or ""),
+            caption=caption,
+        )
+        for item, caption in photos
+    ]
+    try:
+        if len(media) == 1:
+            messages = [
+                await queue.send(
+                    chat_id,
+                    lambda: bot.send_photo(
+                        chat_id, photo=media[0].media, caption=media[0].caption
+                    ),
+                )
+            ]
+        else:
+            messages = await queue.send(
+                chat_id, lambda: bot.send_media_group(chat_id, media=media)
+            )
+    except TelegramBadRequest:
+        if not file_ids or cache is None:
+            raise
+        logger.info("Cached photos rejected in chat %s, sending by URL", chat_id)
+        await cache.forget(bot.id, file_ids)
+        await send_photos(queue, bot, chat_id, photos, cache)
+        return
+
+    if cache:
+        await cache.put_many(
+            bot.id,
+            {
+                item["id"]: (image_hash(item["image"] or ""), message.photo[-1].file_id)
+                for (item, _), message in zip(photos, messages)
+                if item["id"] not in file_ids and message.photo
+            },
+        )
+
+
+async def send_products(
+    queue: SendQueue,
+    bot: Bot,
+    chat_id: int,
+    items: List[Product],
+    first_index: int = 1,
+    cache: Optional[PhotoCache] = None,
+) -> None:
+    """Sends products as captioned media groups of up to ten photos.
+
+    Products without an image are listed in a text message after their
+    batch. If Telegram cannot fetch the photos of a batch, the batch is
+    listed as text instead, so one broken image does not hide the others.
+    """
+    for start in range(0, len(items), MEDIA_GROUP_SIZE):
+        batch = items[start : start + MEDIA_GROUP_SIZE]
+        photos: List[Tuple[Product, str]] = []
+        lines: List[str] = []
+        for offset, item in enumerate(batch):
+            caption = product_caption(first_index + start + offset, item)
+            if item.get("image"):
+                photos.append((item, caption))
+            else:
+                lines.append(caption)
+
+        if photos:
+            try:
+                await send_photos(queue, bot, chat_id, photos, cache)
+            except TelegramBadRequest as e:
+                logger.warning("Could not send product photos: %s", e)
+                lines = [caption for _, caption in photos] + lines
+
+        if lines:
+            text = "\n".join(lines)
+            await queue.send(chat_id, lambda: bot.send_message(chat_id, text))
+
+
+async def send_product(
+    queue: SendQueue,
+    bot: Bot,
+    chat_id: int,
+    item: Product,
+    cache: Optional[PhotoCache] = None,
+) -> None:
+    """Sends one product as a photo captioned with its title and price."""
+    caption = f"{item['title']} - {item['price']} USD"
+    if item.get("image"):
+        try:
+            await send_photos(queue, bot, chat_id, [(item, caption)], cache)
+            return
+        except TelegramBadRequest as e:
+            logger.warning("Could not send product photo: %s", e)
+    await queue.send(chat_id, lambda: bot.send_message(chat_id, caption))
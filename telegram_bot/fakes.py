@@ -0,0 +1,436 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMediaGroup, SendMessage, SendPhoto, TelegramMethod
+from aiohttp import web
+
+if TYPE_CHECKING:
+    # Not imported at run time: api_client reads SHOP_API_URL when imported,
+    # and loadtest sets it only after the fakes are up.
+    from api_client import Category, Product
+
+FAKE_TOKEN = "123456:fake-token"
+"""Well-formed bot token for bots talking to a fake session."""
+
+CATEGORIES: List["Category"] = [
+    {"id": 1, "name": "Clothes", "slug": "clothes", "parent": None},
+    {"id": 2, "name": "Shoes", "slug": "shoes", "parent": None},
+    {"id": 3, "name": "Sneakers", "slug": "sneakers", "parent": 2},
+]
+"""Category tree of the fake catalog."""
+
+
+def fake_catalog(size: int) -> List["Product"]:
+    """Builds catalog items shaped like the shop API's product list."""
+    return [
+        {
+            "id": index,
+            "title": f"Product {index}",
+            "price": f"{index % 500}.99",
+            "category": CATEGORIES[index % len(CATEGORIES)]["id"],
+            "image": f"http://127.0.0.1:4421/media/images/product-{index}.jpg",
+        }
+        for index in range(1, size + 1)
+    ]
+
+
+class FakeTelegram:
+    """Answers Bot API calls the way Telegram does, for the fakes below.
+
+    Requests are limited per chat and for the whole bot by token buckets
+    holding one second of requests; over the limit, a request is answered
+    with 429 and a `retry_after`. A rate of 0 disables a limit. Calls and
+    rejections are counted per method name, and `downloads` counts photos
+    sent by URL, which the real API has to fetch.
+    """
+
+    def __init__(self, chat_rate: float, global_rate: float) -> None:
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.calls: Counter = Counter()
+        self.rejected = 0
+        self.downloads = 0
+        self._buckets: Dict[Any, Tuple[float, float]] = {}
+        self._ids = itertools.count(1)
+
+    def _take(self, key: Any, rate: float) -> float:
+        """Takes a token from a bucket holding one second of requests."""
+        if not rate:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (rate, now))
+        tokens = min(rate, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    def _answer(
+        self, name: str, chat_id: Any, result: Callable[[], Any]
+    ) -> Dict[str, Any]:
+        """Counts a call and returns the Bot API response body for it."""
+        self.calls[name] += 1
+        wait = self._take(("chat", chat_id), self.chat_rate) or self._take(
+            "global", self.global_rate
+        )
+        if wait:
+            self.rejected += 1
+            return {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests",
+                "parameters": {"retry_after": max(1, round(wait))},
+            }
+        return {"ok": True, "result": result()}
+
+    def _message(self, chat_id: Any, **fields: Any) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **fields,
+        }
+
+    def _photo(self, photo: Any, caption: Optional[str]) -> Dict[str, Any]:
+        if isinstance(photo, str) and photo.startswith(("http://", "https://")):
+            self.downloads += 1
+        file_number = next(self._ids)
+        photo = [
+            {
+                "file_id": f"fake-photo-{file_number}",
+                "file_unique_id": f"fake-{file_number}",
+                "width": 800,
+                "height": 800,
+            }
+        ]
+        return {"photo": photo, "caption": caption}
+
+
+class FakeTelegramSession(FakeTelegram, BaseSession):
+    """Stand-in for the Telegram Bot API with latency and flood control.
+
+    Each request takes `latency` seconds and is limited as `FakeTelegram`
+    describes. The bot talks to it in-process, without HTTP.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.03,
+        chat_rate: float = 10.0,
+        global_rate: float = 30.0,
+    ) -> None:
+        BaseSession.__init__(self)
+        FakeTelegram.__init__(self, chat_rate, global_rate)
+        self.latency = latency
+
+    def _result(self, method: TelegramMethod[Any]) -> Any:
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(method, SendMediaGroup):
+            return [
+                self._message(chat_id, **self._photo(item.media, item.caption))
+                for item in method.media
+            ]
+        if isinstance(method, SendPhoto):
+            return self._message(chat_id, **self._photo(method.photo, method.caption))
+        if isinstance(method, SendMessage):
+            return self._message(chat_id, text=method.text)
+        return True
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: Optional[int] = None,
+    ) -> Any:
+        await asyncio.sleep(self.latency)
+        content = self._answer(
+            type(method).__name__,
+            getattr(method, "chat_id", None),
+            lambda: self._result(method),
+        )
+        status_code = 200 if content["ok"] else content["error_code"]
+        response = self.check_response(bot, method, status_code, json.dumps(content))
+        return response.result
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeTelegramServer(FakeTelegram):
+    """Stand-in for the Telegram Bot API served over HTTP.
+
+    A bot reaches it through
+    `AiohttpSession(api=TelegramAPIServer.from_base(url))`. Each request
+    takes `latency` seconds and is limited as `FakeTelegram` describes.
+    Every answered call is passed to `on_call(method, params, result)`, so
+    load tests can see what the bot sent to each chat.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.03,
+        chat_rate: float = 0.0,
+        global_rate: float = 0.0,
+        on_call: Optional[Callable[[str, Dict[str, Any], Any], None]] = None,
+    ) -> None:
+        super().__init__(chat_rate, global_rate)
+        self.latency = latency
+        self.on_call = on_call
+
+    def app(self) -> web.Application:
+        """Builds the aiohttp application serving `/bot<token>/<method>`."""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        if method == "sendMediaGroup":
+            return [
+                self._message(
+                    chat_id, **self._photo(item["media"], item.get("caption"))
+                )
+                for item in json.loads(params["media"])
+            ]
+        if method == "sendPhoto":
+            return self._message(
+                chat_id, **self._photo(params["photo"], params.get("caption"))
+            )
+        if method == "sendMessage":
+            return self._message(chat_id, text=params["text"])
+        if method == "editMessageText":
+            return {
+                **self._message(chat_id, text=params["text"]),
+                "message_id": int(params["message_id"]),
+            }
+        return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Answers one Bot API call."""
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        await asyncio.sleep(self.latency)
+        content = self._answer(
+            method, params.get("chat_id"), lambda: self._result(method, params)
+        )
+        if content["ok"] and self.on_call is not None:
+            self.on_call(method, params, content["result"])
+        return web.json_response(content)
+
+
+class FakeShopAPI:
+    """Stand-in for the shop API endpoints the bots use.
+
+    Serves a generated catalog under `/v1/api/`, with product writes,
+    `products/changes/` sync tokens and checkouts. Checked-out orders count
+    as paid at once and are listed in the `paid-orders/` feed until
+    acknowledged. Each request takes `latency` seconds; requests are
+    counted per route.
+    """
+
+    def __init__(self, products: int = 50, latency: float = 0.02) -> None:
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self.products: Dict[int, Dict[str, Any]] = {
+            product["id"]: dict(product) for product in fake_catalog(products)
+        }
+        self.version = 0
+        self.changed_at = {product_id: 0 for product_id in self.products}
+        self.deleted_at: Dict[int, int] = {}
+        self.orders = 0
+        self.paid_events: Dict[int, Dict[str, Any]] = {}
+        self._ids = itertools.count(products + 1)
+
+    def app(self) -> web.Application:
+        """Builds the aiohttp application serving the fake API."""
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/v1/api/products/", self.list_products)
+        app.router.add_post("/v1/api/products/", self.create_product)
+        app.router.add_get("/v1/api/products/changes/", self.changes)
+        app.router.add_get(r"/v1/api/products/{id:\d+}/", self.get_product)
+        app.router.add_patch(r"/v1/api/products/{id:\d+}/", self.update_product)
+        app.router.add_delete(r"/v1/api/products/{id:\d+}/", self.delete_product)
+        app.router.add_get("/v1/api/categories/", self.list_categories)
+        app.router.add_post("/v1/api/checkout/", self.checkout)
+        app.router.add_get("/v1/api/paid-orders/", self.paid_orders)
+        app.router.add_post("/v1/api/paid-orders/ack/", self.ack_paid_orders)
+        return app
+
+    @web.middleware
+    async def middleware(
+        self, request: web.Request, handler: Any
+    ) -> web.StreamResponse:
+        route = request.match_info.route.resource
+        self.requests[
+            f"{request.method} {route.canonical if route else request.path}"
+        ] += 1
+        await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def _touch(self, product_id: int, deleted: bool = False) -> None:
+        self.version += 1
+        if deleted:
+            self.products.pop(product_id, None)
+            self.changed_at.pop(product_id, None)
+            self.deleted_at[product_id] = self.version
+        else:
+            self.changed_at[product_id] = self.version
+
+    def _product(self, request: web.Request) -> Dict[str, Any]:
+        product = self.products.get(int(request.match_info["id"]))
+        if product is None:
+            raise web.HTTPNotFound()
+        return product
+
+    async def list_products(self, request: web.Request) -> web.Response:
+        products = list(self.products.values())
+        category = request.query.get("category")
+        if category:
+            subtree = {int(category)} | {
+                item["id"] for item in CATEGORIES if item["parent"] == int(category)
+            }
+            products = [item for item in products if item["category"] in subtree]
+        offset = int(request.query.get("cursor", 0))
+        size = int(request.query.get("page_size", 20))
+        end = offset + size
+        return web.json_response(
+            {
+                "next": (
+                    str(request.url.update_query(cursor=end))
+                    if end < len(products)
+                    else None
+                ),
+                "previous": None,
+                "results": products[offset:end],
+            }
+        )
+
+    async def get_product(self, request: web.Request) -> web.Response:
+        return web.json_response(self._product(request))
+
+    async def create_product(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        product = {
+            "id": next(self._ids),
+            "title": data["title"],
+            "price": str(data.get("price", "99.99")),
+            "category": data["category"],
+            "image": None,
+        }
+        self.products[product["id"]] = product
+        self._touch(product["id"])
+        return web.json_response(product, status=201)
+
+    async def update_product(self, request: web.Request) -> web.Response:
+        product = self._product(request)
+        product.update(await request.json())
+        self._touch(product["id"])
+        return web.json_response(product)
+
+    async def delete_product(self, request: web.Request) -> web.Response:
+        self._touch(self._product(request)["id"], deleted=True)
+        return web.Response(status=204)
+
+    async def changes(self, request: web.Request) -> web.Response:
+        since = request.query.get("since", "")
+        reset = not since.isdigit() or int(since) > self.version
+        base = -1 if reset else int(since)
+        return web.json_response(
+            {
+                "reset": reset,
+                "changed": [
+                    self.products[product_id]
+                    for product_id, version in self.changed_at.items()
+                    if version > base
+                ],
+                "deleted": (
+                    []
+                    if reset
+                    else [
+                        product_id
+                        for product_id, version in self.deleted_at.items()
+                        if version > base
+                    ]
+                ),
+                "token": str(self.version),
+            }
+        )
+
+    async def list_categories(self, request: web.Request) -> web.Response:
+        return web.json_response(CATEGORIES)
+
+    async def checkout(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if not data.get("cart_items"):
+            return web.json_response({"error": "Cart is empty"}, status=400)
+        self.orders += 1
+        self.paid_events[self.orders] = {
+            "id": self.orders,
+            "order": self.orders,
+            "amount": "{:.2f}".format(
+                sum(
+                    float(item["price"]) * item["quantity"]
+                    for item in data["cart_items"]
+                )
+            ),
+            "payment_provider": "stripe",
+            "email": data.get("shipping_address", {}).get("email"),
+            "items": [
+                {
+                    "title": item["product_name"],
+                    "price": item["price"],
+                    "quantity": item["quantity"],
+                }
+                for item in data["cart_items"]
+            ],
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        return web.json_response(
+            {
+                "checkout_url": f"https://checkout.stripe.test/{self.orders}",
+                "api_test_url": f"https://pay.test/{self.orders}",
+                "order_id": self.orders,
+                "status_url": f"/v1/api/orders/{self.orders}/status/",
+            }
+        )
+
+    async def paid_orders(self, request: web.Request) -> web.Response:
+        after = int(request.query.get("after", 0))
+        limit = int(request.query.get("limit", 100))
+        events = [
+            event for event_id, event in self.paid_events.items() if event_id > after
+        ]
+        return web.json_response(events[:limit])
+
+    async def ack_paid_orders(self, request: web.Request) -> web.Response:
+        ids = (await request.json())["ids"]
+        acknowledged = [self.paid_events.pop(event_id, None) for event_id in ids]
+        return web.json_response(
+            {"acknowledged": sum(event is not None for event in acknowledged)}
+        )
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple, TypeVar
+from weakref import WeakValueDictionary
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseEventIsolation,
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS fsm_locks (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteDatabase:
+    """SQLite file shared by the bot worker processes.
+
+    Queries run in worker threads so a busy database never blocks the event
+    loop; each thread keeps its own connection. WAL mode lets readers in
+    every process work while one of them writes.
+    """
+
+    def __init__(self, path: str, timeout: float = 30) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        connection = self.connection()
+        connection.executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    async def run(self, query: Callable[[sqlite3.Connection], T]) -> T:
+        """Runs `query` with a connection in a worker thread."""
+        return await asyncio.to_thread(lambda: query(self.connection()))
+
+    def close(self) -> None:
+        """Closes every connection opened so far."""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage in a SQLite file, shared by every bot worker process.
+
+    State and data survive restarts, and every worker reads what the others
+    wrote, so a user's conversation can continue on any worker.
+    """
+
+    def __init__(
+        self, database: SQLiteDatabase, key_builder: Optional[KeyBuilder] = None
+    ) -> None:
+        self.database = database
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+
+    @staticmethod
+    def _write(db: sqlite3.Connection, upsert: str, key: str, value: Any) -> None:
+        # Drop rows left empty, so cleared conversations take no space.
+        db.execute(upsert, (key, value))
+        db.execute(
+            "DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,)
+        )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self.database.run(
+            lambda db: self._write(
+                db,
+                "INSERT INTO fsm (key, state) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET state = excluded.state",
+                self.key_builder.build(key),
+                value,
+            )
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self.database.run(
+            lambda db: db.execute(
+                "SELECT state FROM fsm WHERE key = ?", (self.key_builder.build(key),)
+            ).fetchone()
+        )
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.database.run(
+            lambda db: self._write(
+                db,
+                "INSERT INTO fsm (key, data) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET data = excluded.data",
+                self.key_builder.build(key),
+                json.dumps(data),
+            )
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self.database.run(
+            lambda db: db.execute(
+                "SELECT data FROM fsm WHERE key = ?", (self.key_builder.build(key),)
+            ).fetchone()
+        )
+        return json.loads(row[0]) if row else {}
+
+    async def close(self) -> None:
+        self.database.close()
+
+
+class SQLiteEventIsolation(BaseEventIsolation):
+    """Handles one update per user at a time across all worker processes.
+
+    Updates of the same user are serialized with an asyncio lock inside a
+    process and a lock row in SQLite between processes, so a handler's
+    read-modify-write of the user's data cannot interleave with another
+    worker's. Lock rows expire after `lock_ttl` seconds in case a worker
+    dies while holding one.
+    """
+
+    def __init__(
+        self,
+        database: SQLiteDatabase,
+        key_builder: Optional[KeyBuilder] = None,
+        lock_ttl: float = 60,
+    ) -> None:
+        self.database = database
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+        self.lock_ttl = lock_ttl
+        self._local_locks: "WeakValueDictionary[str, asyncio.Lock]" = (
+            WeakValueDictionary()
+        )
+
+    def _try_acquire(self, db: sqlite3.Connection, key: str, owner: str) -> bool:
+        now = time.time()
+        cursor = db.execute(
+            "INSERT INTO fsm_locks (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, "
+            "expires_at = excluded.expires_at WHERE fsm_locks.expires_at < ?",
+            (key, owner, now + self.lock_ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        name = self.key_builder.build(key, "lock")
+        local_lock = self._local_locks.get(name)
+        if local_lock is None:
+            local_lock = self._local_locks[name] = asyncio.Lock()
+
+        async with local_lock:
+            owner = uuid.uuid4().hex
+            delay = 0.01
+            while not await self.database.run(
+                lambda db: self._try_acquire(db, name, owner)
+            ):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.2)
+            try:
+                yield
+            finally:
+                await self.database.run(
+                    lambda db: db.execute(
+                        "DELETE FROM fsm_locks WHERE key = ? AND owner = ?",
+                        (name, owner),
+                    )
+                )
+
+    async def close(self) -> None:
+        pass
+
+
+def make_storage(url: str) -> Tuple[BaseStorage, BaseEventIsolation]:
+    """Builds the FSM storage and event isolation named by a URL.
+
+    `memory://` keeps state in the process (lost on restart, one worker only),
+    `sqlite:///path/to/file.sqlite3` persists it in a file shared by the
+    workers of one host, and `redis://...` uses aiogram's Redis storage
+    (requires the `redis` package) for workers on several hosts.
+    """
+    if url.startswith("memory://"):
+        return MemoryStorage(), SimpleEventIsolation()
+    if url.startswith("sqlite:///"):
+        database = SQLiteDatabase(url[len("sqlite:///") :])
+        return SQLiteStorage(database), SQLiteEventIsolation(database)
+    if url.startswith(("redis://", "rediss://")):
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        storage = RedisStorage.from_url(url)
+        return storage, storage.create_isolation()
+    raise ValueError(f"Unsupported FSM storage URL: {url}")
@@ -0,0 +1,131 @@
+import heapq
+import re
+from collections import Counter
+from typing import (
+    Dict,
+    FrozenSet,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+WORD = re.compile(r"\w+")
+
+AUTO_PICK_SCORE = 0.6
+"""Similarity a match needs before it is picked without asking."""
+
+AUTO_PICK_MARGIN = 0.15
+"""How far the best match must be ahead of the next one to be picked."""
+
+
+def normalize(text: str) -> str:
+    """Lower-cases text and reduces it to words separated by single spaces."""
+    return " ".join(WORD.findall(text.casefold()))
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Returns the trigrams of each word, padded like PostgreSQL's pg_trgm.
+
+    `"air max"` gives `"  a", " ai", "air", "ir ", "  m", " ma", "max", "ax "`,
+    so short words and word starts count, and word order does not matter.
+    """
+    grams: Set[str] = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TrigramIndex(Generic[K]):
+    """Finds the titles most similar to a query through the trigrams they share.
+
+    Each trigram maps to the keys of the titles containing it. A query only
+    looks at the titles sharing its rarer trigrams, so its cost depends on
+    how many titles look alike rather than on the catalog size. Titles are
+    ranked by the Dice coefficient of their trigram sets.
+    """
+
+    def __init__(self, max_candidates: int = 2000) -> None:
+        self.max_candidates = max_candidates
+        self.titles: Dict[K, str] = {}
+        self._grams: Dict[K, FrozenSet[str]] = {}
+        self._postings: Dict[str, Set[K]] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[K, str]]) -> "TrigramIndex[K]":
+        """Builds an index of `(key, title)` pairs."""
+        index: TrigramIndex[K] = cls()
+        for key, title in items:
+            index.add(key, title)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def add(self, key: K, title: str) -> None:
+        """Indexes a title, replacing the one indexed under `key` before."""
+        if key in self.titles:
+            self.remove(key)
+        grams = trigrams(title)
+        self.titles[key] = title
+        self._grams[key] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: K) -> None:
+        """Drops a title from the index; unknown keys are ignored."""
+        self.titles.pop(key, None)
+        for gram in self._grams.pop(key, ()):
+            keys = self._postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self._postings[gram]
+
+    def search(
+        self, query: str, limit: int = 5, min_score: float = 0.3
+    ) -> List[Tuple[K, float]]:
+        """Returns up to `limit` `(key, score)` pairs, best first.
+
+        Trigrams are visited from the rarest. Their titles become candidates
+        until `max_candidates` is reached; after that, more common trigrams
+        only add to the counts of the candidates already found.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        postings = sorted(
+            (self._postings[gram] for gram in grams if gram in self._postings), key=len
+        )
+        shared: Counter = Counter()
+        for keys in postings:
+            if not shared or len(shared) + len(keys) <= self.max_candidates:
+                shared.update(keys)
+            else:
+                shared.update(keys.intersection(shared))
+
+        scores = (
+            (key, 2 * count / (len(grams) + len(self._grams[key])))
+            for key, count in shared.items()
+        )
+        return heapq.nlargest(
+            limit,
+            ((key, score) for key, score in scores if score >= min_score),
+            key=lambda item: item[1],
+        )
+
+
+def best_match(matches: List[Tuple[T, float]]) -> Optional[T]:
+    """Returns the top match if it is close enough and clearly ahead of the next."""
+    if not matches or matches[0][1] < AUTO_PICK_SCORE:
+        return None
+    if len(matches) > 1 and matches[0][1] - matches[1][1] < AUTO_PICK_MARGIN:
+        return None
+    return matches[0][0]
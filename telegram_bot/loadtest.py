@@ -0,0 +1,488 @@
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from aiohttp import web
+from fakes import FAKE_TOKEN, FakeShopAPI, FakeTelegramServer
+
+Call = Tuple[str, Dict[str, Any], Any]
+"""A Bot API call seen by the fake server: method, parameters and result."""
+
+Predicate = Callable[[str, Dict[str, Any]], bool]
+
+Waiter = Tuple[Predicate, List[Call], int, asyncio.Future]
+"""A user step waiting for calls: filter, calls so far, calls wanted, result."""
+
+ADDRESS = "John Smith, john@example.com, Gullweg, 18, Berlin, Germany"
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Returns the value below which `fraction` of the sorted values fall."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def reply(methods: Sequence[str], contains: str = "") -> Predicate:
+    """Matches a call of one of `methods` whose text or caption contains `contains`."""
+
+    def match(method: str, params: Dict[str, Any]) -> bool:
+        text = params.get("text") or params.get("caption") or params.get("media", "")
+        return method in methods and contains in text
+
+    return match
+
+
+def button(params: Dict[str, Any], text: str = "") -> Optional[str]:
+    """Returns the callback data of the first inline button whose text
+    contains `text`."""
+    markup = json.loads(params.get("reply_markup") or "{}")
+    for row in markup.get("inline_keyboard", []):
+        for key in row:
+            if text in key["text"] and key.get("callback_data"):
+                return key["callback_data"]
+    return None
+
+
+class FlowFailed(Exception):
+    """Raised when the bot does not answer a step in time."""
+
+
+class Recorder:
+    """Collects step latencies, failures and counts of a load test."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Counter = Counter()
+        self.flows = 0
+        self.updates = 0
+        self.elapsed = 0.0
+        self.telegram_calls = 0
+        self.rate_limited = 0
+        self.api_requests = 0
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes a task sleeping `interval` seconds.
+
+    Every lag is time in which no other coroutine could run, so the lags add
+    up to how long handlers blocked the loop.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+
+class Simulation:
+    """Simulated users talking to a bot through its webhook.
+
+    Each user has a private chat and runs its flows one step at a time: it
+    posts an update to the webhook and waits until the fake Telegram API
+    receives the answer the step expects. The time in between is the
+    step's latency. The simulation runs in its own process with the fake
+    APIs, so the bot's event loop and interpreter do nothing else.
+    """
+
+    def __init__(
+        self, webhook_url: str, recorder: Recorder, timeout: float, catalog_size: int
+    ) -> None:
+        self.webhook_url = webhook_url
+        self.recorder = recorder
+        self.timeout = timeout
+        self.catalog_size = catalog_size
+        self.waiters: Dict[int, List[Waiter]] = defaultdict(list)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the session posting updates, open while `run` is."""
+        if self._session is None:
+            raise RuntimeError("The simulation is not running")
+        return self._session
+
+    def on_call(self, method: str, params: Dict[str, Any], result: Any) -> None:
+        """Hands a Bot API call to the user step waiting for it."""
+        if "chat_id" not in params:
+            return
+        for waiter in list(self.waiters.get(int(params["chat_id"]), [])):
+            predicate, calls, count, future = waiter
+            if not future.done() and predicate(method, params):
+                calls.append((method, params, result))
+                if len(calls) >= count:
+                    future.set_result(calls)
+                return
+
+    async def step(
+        self,
+        chat_id: int,
+        name: str,
+        update: Dict[str, Any],
+        expect: Predicate,
+        count: int = 1,
+    ) -> List[Call]:
+        """Posts an update and waits for `count` matching calls from the bot."""
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        waiter: Waiter = (expect, [], count, future)
+        self.waiters[chat_id].append(waiter)
+        start = time.perf_counter()
+        try:
+            update["update_id"] = next(self._update_ids)
+            async with self.session.post(self.webhook_url, json=update) as response:
+                response.raise_for_status()
+            self.recorder.updates += 1
+            calls = await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            self.recorder.failures[name] += 1
+            raise FlowFailed(f"{name}: {e!r}") from e
+        finally:
+            self.waiters[chat_id].remove(waiter)
+        self.recorder.latencies[name].append(time.perf_counter() - start)
+        return calls
+
+    def _user(self, chat_id: int) -> Dict[str, Any]:
+        return {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+
+    async def say(
+        self, chat_id: int, name: str, text: str, expect: Predicate, count: int = 1
+    ) -> List[Call]:
+        """Sends a text message as the user."""
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._user(chat_id),
+            "text": text,
+        }
+        return await self.step(chat_id, name, {"message": message}, expect, count)
+
+    async def tap(
+        self, chat_id: int, name: str, message: Call, data: str, expect: Predicate
+    ) -> List[Call]:
+        """Taps an inline button of a message the bot sent."""
+        _, params, result = message
+        callback = {
+            "id": str(next(self._message_ids)),
+            "from": self._user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": result["message_id"],
+                "date": result["date"],
+                "chat": result["chat"],
+                "text": params.get("text", ""),
+            },
+        }
+        return await self.step(chat_id, name, {"callback_query": callback}, expect)
+
+    async def browse_catalog(self, chat_id: int) -> None:
+        """Opens the catalog, turns a page and opens a product card."""
+        calls = await self.say(
+            chat_id, "catalog", "Catalog", reply(["sendMessage"], "Catalog")
+        )
+        page = calls[0]
+        next_page = button(page[1], "Next")
+        if next_page:
+            calls = await self.tap(
+                chat_id, "next_page", page, next_page, reply(["editMessageText"])
+            )
+            page = (calls[0][0], calls[0][1], {**page[2], **calls[0][2]})
+        product = button(page[1], ". ")
+        if product:
+            await self.tap(
+                chat_id,
+                "product_card",
+                page,
+                product,
+                reply(["sendPhoto", "sendMessage"]),
+            )
+
+    async def place_order(self, chat_id: int) -> None:
+        """Fills a cart with two products and checks out."""
+        first, second = (chat_id % self.catalog_size) + 1, (
+            (chat_id + 1) % self.catalog_size
+        ) + 1
+        await self.say(
+            chat_id, "make_order", "Make Order", reply(["sendMessage"], "Please enter")
+        )
+        await self.say(
+            chat_id,
+            "add_to_cart",
+            f"Product {first} - 2\nProduct {second} - 1 pcs",
+            reply(["sendMessage"], "Your cart"),
+        )
+        await self.say(
+            chat_id, "checkout", "Checkout", reply(["sendMessage"], "shipping address")
+        )
+        await self.say(
+            chat_id,
+            "shipping",
+            ADDRESS,
+            reply(["sendMessage"], "processed successfully"),
+        )
+
+    async def list_goods(self, chat_id: int) -> None:
+        """Asks the admin bot for the whole catalog as media groups."""
+        await self.say(
+            chat_id,
+            "list_goods",
+            "List goods",
+            reply(["sendMediaGroup", "sendPhoto"]),
+            count=-(-self.catalog_size // 10),
+        )
+
+    async def edit_product(self, chat_id: int) -> None:
+        """Changes the price of a product through the admin bot."""
+        title = f"Product {(chat_id % self.catalog_size) + 1}"
+        await self.say(
+            chat_id, "change", "Change", reply(["sendMessage"], "Enter the name")
+        )
+        await self.say(
+            chat_id, "find_product", title, reply(["sendMessage"], "Specify")
+        )
+        await self.say(
+            chat_id, "update_product", "price=12.50", reply(["sendMessage"], "updated")
+        )
+
+    async def user(self, chat_id: int, flows: List[str], delay: float) -> None:
+        await asyncio.sleep(delay)
+        for flow in flows:
+            try:
+                await getattr(self, flow)(chat_id)
+            except FlowFailed:
+                continue
+            self.recorder.flows += 1
+
+    async def run(
+        self, users: int, flows: List[str], iterations: int, ramp: float
+    ) -> None:
+        """Runs every user to the end."""
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as self._session:
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    self.user(
+                        chat_id,
+                        [flows[(chat_id + i) % len(flows)] for i in range(iterations)],
+                        ramp * (chat_id - 1) / users,
+                    )
+                    for chat_id in range(1, users + 1)
+                )
+            )
+            self.recorder.elapsed = time.perf_counter() - start
+
+
+FLOWS = {
+    "shop": ["browse_catalog", "place_order"],
+    "admin": ["list_goods", "edit_product"],
+}
+"""Flows each bot supports, run round-robin by the simulated users."""
+
+
+async def serve(app: web.Application) -> Tuple[web.AppRunner, str]:
+    """Serves an application on a free local port and returns its base URL."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def run_users(options: argparse.Namespace, connection: Connection) -> None:
+    """Serves the fake APIs, waits for the webhook URL and runs the users.
+
+    The fake API URLs are sent to the bot process first; the recorder with
+    the results is sent back once every user has finished.
+    """
+    telegram = FakeTelegramServer(
+        latency=options.telegram_latency,
+        chat_rate=options.chat_rate,
+        global_rate=options.global_rate,
+    )
+    shop = FakeShopAPI(products=options.products, latency=options.api_latency)
+    telegram_runner, telegram_url = await serve(telegram.app())
+    shop_runner, shop_url = await serve(shop.app())
+    try:
+        connection.send((telegram_url, shop_url))
+        webhook_url = await asyncio.to_thread(connection.recv)
+
+        recorder = Recorder()
+        simulation = Simulation(
+            webhook_url, recorder, options.timeout, options.products
+        )
+        telegram.on_call = simulation.on_call
+        await simulation.run(
+            options.users, FLOWS[options.bot], options.iterations, options.ramp
+        )
+        recorder.telegram_calls = sum(telegram.calls.values())
+        recorder.rate_limited = telegram.rejected
+        recorder.api_requests = sum(shop.requests.values())
+        connection.send(recorder)
+    finally:
+        await telegram_runner.cleanup()
+        await shop_runner.cleanup()
+
+
+def users_process(options: argparse.Namespace, connection: Connection) -> None:
+    """Entry point of the process running the fake APIs and the users."""
+    asyncio.run(run_users(options, connection))
+
+
+def report(
+    options: argparse.Namespace, recorder: Recorder, monitor: LoopMonitor
+) -> List[str]:
+    """Prints the results and returns the thresholds they exceeded."""
+    elapsed = recorder.elapsed
+    print(
+        f"{options.bot} bot: {options.users} users, {options.iterations} flow(s) each, "
+        f"{options.telegram_latency * 1000:.0f}ms Telegram and "
+        f"{options.api_latency * 1000:.0f}ms API latency, {elapsed:.2f}s"
+    )
+    print(
+        f"{'step':<16} {'count':>6} {'failed':>6} "
+        f"{'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)"
+    )
+    worst_p99 = 0.0
+    for name, values in recorder.latencies.items():
+        p99 = percentile(values, 0.99) * 1000
+        worst_p99 = max(worst_p99, p99)
+        print(
+            f"{name:<16} {len(values):>6} {recorder.failures[name]:>6} "
+            f"{percentile(values, 0.5) * 1000:>8.1f} "
+            f"{percentile(values, 0.9) * 1000:>8.1f} "
+            f"{p99:>8.1f} {max(values) * 1000:>8.1f}"
+        )
+    failed = sum(recorder.failures.values())
+    print(
+        f"throughput: {recorder.updates / elapsed:.1f} updates/s, "
+        f"{recorder.flows / elapsed:.1f} flows/s, {failed} failed flow(s)"
+    )
+    lags = monitor.lags
+    blocked = sum(lags)
+    print(
+        f"event loop lag: p50 {percentile(lags, 0.5) * 1000:.1f}ms, "
+        f"p99 {percentile(lags, 0.99) * 1000:.1f}ms, "
+        f"max {max(lags, default=0) * 1000:.1f}ms; "
+        f"blocked {blocked:.2f}s ({blocked / elapsed:.0%} of the run)"
+    )
+    print(
+        f"telegram: {recorder.telegram_calls} calls, "
+        f"{recorder.rate_limited} rate-limited; "
+        f"shop API: {recorder.api_requests} requests"
+    )
+
+    exceeded = []
+    if failed:
+        exceeded.append(f"{failed} flow(s) failed")
+    if options.max_p99 is not None and worst_p99 > options.max_p99:
+        exceeded.append(f"step p99 {worst_p99:.1f}ms > {options.max_p99:g}ms")
+    max_lag = max(lags, default=0) * 1000
+    if options.max_lag is not None and max_lag > options.max_lag:
+        exceeded.append(f"loop lag {max_lag:.1f}ms > {options.max_lag:g}ms")
+    return exceeded
+
+
+async def run(options: argparse.Namespace) -> List[str]:
+    """Starts the users' process and the bot, runs the load test and reports."""
+    context = multiprocessing.get_context("spawn")
+    connection, child_connection = context.Pipe()
+    process = context.Process(target=users_process, args=(options, child_connection))
+    process.start()
+    telegram_url, shop_url = await asyncio.to_thread(connection.recv)
+
+    # The bot modules read their configuration when imported.
+    os.environ["SHOP_API_URL"] = f"{shop_url}/v1/api"
+    os.environ["TG_BOT_TOKEN"] = os.environ["TG_ADMIN_BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["BOT_FSM_STORAGE"] = options.storage
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from webhook import WebhookConfig, build_app
+
+    if options.bot == "shop":
+        app = importlib.import_module("bot").TelegramBot()
+    else:
+        app = importlib.import_module("admin_bot").TelegramAdminBot()
+    # One log line per update would dominate the measurements.
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    app.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(telegram_url))
+
+    config = WebhookConfig(base_url="http://127.0.0.1", path="/webhook")
+    runner, url = await serve(build_app(app, config))
+    monitor = LoopMonitor()
+    try:
+        while not app.catalog.loaded:
+            await asyncio.sleep(0.05)
+        monitor.start()
+        connection.send(url + config.path)
+        recorder = await asyncio.to_thread(connection.recv)
+    finally:
+        await monitor.stop()
+        await runner.cleanup()
+        process.join()
+    return report(options, recorder, monitor)
+
+
+def main() -> None:
+    """Load-tests a bot with simulated users against fake Telegram and shop APIs."""
+    parser = argparse.ArgumentParser(
+        description="Load-test a Telegram bot offline with simulated users."
+    )
+    parser.add_argument("--bot", choices=sorted(FLOWS), default="shop")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=2, help="flows per user")
+    parser.add_argument(
+        "--ramp", type=float, default=1.0, help="seconds to start all users"
+    )
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    parser.add_argument("--chat-rate", type=float, default=0.0, help="0 disables")
+    parser.add_argument("--global-rate", type=float, default=0.0, help="0 disables")
+    parser.add_argument("--storage", default="memory://", help="BOT_FSM_STORAGE URL")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds per step")
+    parser.add_argument("--max-p99", type=float, help="fail above this step p99 (ms)")
+    parser.add_argument("--max-lag", type=float, help="fail above this loop lag (ms)")
+    options = parser.parse_args()
+
+    exceeded = asyncio.run(run(options))
+    if exceeded:
+        print("FAILED: " + "; ".join(exceeded))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from decimal import Decimal
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+)
+from api_client import PaidOrder, ShopAPIClient, ShopAPIError
+from delivery import SendQueue
+
+MESSAGE_LIMIT = 4096
+"""Longest text Telegram accepts in one message."""
+
+POLL_INTERVAL = 5
+"""Seconds between reads of the paid-order feed."""
+
+MAX_PENDING = 1000
+"""Events held in memory at most; the rest wait in the shop's outbox."""
+
+logger = logging.getLogger(__name__)
+
+
+def format_order(event: PaidOrder) -> str:
+    """Formats one paid order as a digest entry."""
+    items = ", ".join(
+        f"{item['title'] or 'deleted product'} × {item['quantity']}"
+        for item in event["items"]
+    )
+    details = [f"#{event['order']}", f"{event['amount']} USD"]
+    details += [value for value in (event["payment_provider"], event["email"]) if value]
+    return " · ".join(details) + (f"\n  {items}" if items else "")
+
+
+def format_digest(events: List[PaidOrder]) -> List[str]:
+    """Formats paid orders as digest messages within Telegram's length limit."""
+    total = sum(Decimal(event["amount"]) for event in events)
+    header = f"💰 {len(events)} paid order{'s' if len(events) > 1 else ''}, {total} USD"
+    messages = [header]
+    for event in events:
+        entry = format_order(event)[: MESSAGE_LIMIT - 2]
+        if len(messages[-1]) + len(entry) + 2 > MESSAGE_LIMIT:
+            messages.append(entry)
+        else:
+            messages[-1] += "\n\n" + entry
+    return messages
+
+
+class OrderDigest:
+    """Announces paid orders to admin chats in coalesced digest messages.
+
+    The shop writes an outbox event for every paid order in the payment
+    transaction. A background task reads the new events every few seconds
+    and sends them as one digest per chat once `interval` seconds have
+    passed since the oldest unsent order, or at once when `max_orders`
+    are waiting. Messages go through the bot's `SendQueue`, which keeps
+    the sends of a chat in order and waits out flood control.
+
+    Events are acknowledged, and so deleted from the outbox, only after
+    every chat got the digest, so orders paid while the bot is down or
+    before a crash are announced after the restart. A digest interrupted
+    by a crash may be sent twice; one is never lost. A chat that blocked
+    the bot or does not exist is skipped, so it cannot hold the feed up.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        api: ShopAPIClient,
+        queue: SendQueue,
+        chats: List[int],
+        interval: float = 60,
+        max_orders: int = 20,
+    ) -> None:
+        self.bot = bot
+        self.api = api
+        self.queue = queue
+        self.chats = chats
+        self.interval = interval
+        self.max_orders = max_orders
+        self.pending: Dict[int, PaidOrder] = {}
+        self.waiting_since: Optional[float] = None
+        self.batch: List[PaidOrder] = []
+        self.sent_to: Set[int] = set()
+        self.cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts the background digest loop, if any chat subscribed."""
+        if self.chats and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the digest loop; unsent orders wait in the outbox."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+                while self.batch or self.due:
+                    if not await self.flush():
+                        break
+            except ShopAPIError as e:
+                logger.warning("Paid-order feed failed: %s", e)
+            await asyncio.sleep(min(POLL_INTERVAL, self.interval))
+
+    @property
+    def due(self) -> bool:
+        """Whether the waiting orders should be sent now."""
+        if not self.pending or self.waiting_since is None:
+            return False
+        return (
+            len(self.pending) >= self.max_orders
+            or time.monotonic() - self.waiting_since >= self.interval
+        )
+
+    async def poll(self) -> None:
+        """Reads the events added to the outbox since the last poll."""
+        while len(self.pending) < MAX_PENDING:
+            limit = min(100, MAX_PENDING - len(self.pending))
+            events = await self.api.paid_orders(after=self.cursor, limit=limit)
+            if events and not self.pending:
+                self.waiting_since = time.monotonic()
+            for event in events:
+                self.pending[event["id"]] = event
+                self.cursor = max(self.cursor, event["id"])
+            if len(events) < limit:
+                return
+
+    async def flush(self) -> bool:
+        """Sends the current digest to the chats that did not get it yet.
+
+        Returns whether the digest was delivered and acknowledged; if not,
+        the same digest is retried on the next run.
+        """
+        if not self.batch:
+            ids = sorted(self.pending)[: self.max_orders]
+            self.batch = [self.pending.pop(event_id) for event_id in ids]
+            self.sent_to = set()
+            # Orders left over from a burst are already late; keep their clock.
+            if not self.pending:
+                self.waiting_since = None
+
+        messages = format_digest(self.batch)
+        for chat_id in self.chats:
+            if chat_id in self.sent_to:
+                continue
+            try:
+                for text in messages:
+                    await self.queue.send(
+                        chat_id, lambda: self.bot.send_message(chat_id, text)
+                    )
+            except (TelegramForbiddenError, TelegramNotFound, TelegramBadRequest) as e:
+                logger.warning("Skipping order digest for chat %s: %s", chat_id, e)
+            except TelegramAPIError as e:
+                logger.warning(
+                    "Order digest to chat %s failed, will retry: %s", chat_id, e
+                )
+                return False
+            self.sent_to.add(chat_id)
+
+        await self.api.ack_paid_orders([event["id"] for event in self.batch])
+        self.batch = []
+        return True
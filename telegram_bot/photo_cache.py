@@ -0,0 +1,118 @@
+import hashlib
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiogram.fsm.storage.base import BaseStorage
+from api_client import Product
+from fsm_storage import SQLiteDatabase, SQLiteStorage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photo_file_ids (
+    bot_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    image_hash TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    PRIMARY KEY (bot_id, product_id)
+);
+"""
+
+
+def image_hash(image: str) -> str:
+    """Identifies a product image by its media path.
+
+    Django stores a replaced image under a new path, so the hash changes
+    exactly when `Product.image` does, whichever host the URL points at.
+    """
+    return hashlib.sha1(urlsplit(image).path.encode()).hexdigest()
+
+
+class PhotoCache:
+    """Telegram `file_id`s of product photos the bot has already sent.
+
+    Telegram downloads a photo sent by URL and returns a `file_id` for it;
+    sending that id again skips the download. Entries are kept per bot (a
+    `file_id` only works for the bot that received it) and per product,
+    along with the hash of the image they came from, so a product whose
+    image changed is sent by URL once more. Entries are kept in memory and,
+    given a database, persisted for restarts and other worker processes.
+    """
+
+    def __init__(self, database: Optional[SQLiteDatabase] = None) -> None:
+        self.database = database
+        self._entries: Dict[Tuple[int, int], Tuple[str, str]] = {}
+        if database is not None:
+            database.connection().executescript(SCHEMA)
+
+    @classmethod
+    def for_storage(cls, storage: BaseStorage) -> "PhotoCache":
+        """Builds a cache kept in the SQLite file of the FSM storage, if it has one."""
+        if isinstance(storage, SQLiteStorage):
+            return cls(storage.database)
+        return cls()
+
+    async def get_many(
+        self, bot_id: int, products: Iterable[Product]
+    ) -> Dict[int, str]:
+        """Returns the cached `file_id`s of the products' current images, by
+        product id."""
+        wanted = {
+            product["id"]: image_hash(image)
+            for product in products
+            if (image := product.get("image"))
+        }
+        missing = [
+            product_id
+            for product_id in wanted
+            if (bot_id, product_id) not in self._entries
+        ]
+        if missing and self.database is not None:
+            placeholders = ", ".join("?" * len(missing))
+            rows = await self.database.run(
+                lambda db: db.execute(
+                    "SELECT product_id, image_hash, file_id FROM photo_file_ids "
+                    f"WHERE bot_id = ? AND product_id IN ({placeholders})",
+                    (bot_id, *missing),
+                ).fetchall()
+            )
+            for product_id, digest, file_id in rows:
+                self._entries[(bot_id, product_id)] = (digest, file_id)
+
+        file_ids = {}
+        for product_id, digest in wanted.items():
+            entry = self._entries.get((bot_id, product_id))
+            if entry is not None and entry[0] == digest:
+                file_ids[product_id] = entry[1]
+        return file_ids
+
+    async def put_many(self, bot_id: int, file_ids: Dict[int, Tuple[str, str]]) -> None:
+        """Records `(image hash, file_id)` pairs by product id."""
+        if not file_ids:
+            return
+        for product_id, entry in file_ids.items():
+            self._entries[(bot_id, product_id)] = entry
+        if self.database is not None:
+            await self.database.run(
+                lambda db: db.executemany(
+                    "INSERT INTO photo_file_ids "
+                    "(bot_id, product_id, image_hash, file_id) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (bot_id, product_id) DO UPDATE SET "
+                    "image_hash = excluded.image_hash, file_id = excluded.file_id",
+                    [
+                        (bot_id, product_id, digest, file_id)
+                        for product_id, (digest, file_id) in file_ids.items()
+                    ],
+                )
+            )
+
+    async def forget(self, bot_id: int, product_ids: Iterable[int]) -> None:
+        """Drops entries Telegram no longer accepts."""
+        product_ids = list(product_ids)
+        for product_id in product_ids:
+            self._entries.pop((bot_id, product_id), None)
+        if product_ids and self.database is not None:
+            await self.database.run(
+                lambda db: db.executemany(
+                    "DELETE FROM photo_file_ids WHERE bot_id = ? AND product_id = ?",
+                    [(bot_id, product_id) for product_id in product_ids],
+                )
+            )
@@ -0,0 +1,867 @@
+import asyncio
+import os
+import tempfile
+import time
+from collections import defaultdict
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from unittest import IsolatedAsyncioTestCase, TestCase, mock
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import SendMessage, TelegramMethod
+from api_client import PaidOrder, Product, ShopAPIClient, ShopAPIError, page_cursor
+from catalog_browser import CatalogPage
+from catalog_cache import CatalogCache
+from catalog_import import (
+    ImportReport,
+    RowError,
+    category_lookup,
+    import_catalog,
+    read_rows,
+    send_batch,
+    validate_row,
+)
+from delivery import SendQueue
+from fakes import CATEGORIES, FAKE_TOKEN, FakeTelegramSession
+from fsm_storage import (
+    SQLiteDatabase,
+    SQLiteEventIsolation,
+    SQLiteStorage,
+    make_storage,
+)
+from fuzzy import AUTO_PICK_SCORE, TrigramIndex, best_match, trigrams
+from order_digest import MESSAGE_LIMIT, OrderDigest, format_digest
+from photo_cache import PhotoCache, image_hash
+from urls import urls
+
+
+class RecordingSession(FakeTelegramSession):
+    """Fake Bot API recording the texts each chat received.
+
+    A message whose text is a number takes that many hundredths of a
+    second, and the first `flood` calls are answered with flood control.
+    """
+
+    def __init__(self, flood: int = 0) -> None:
+        super().__init__(latency=0, chat_rate=0, global_rate=0)
+        self.flood = flood
+        self.texts: Dict[Any, List[str]] = defaultdict(list)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _take(self, key: Any, rate: float) -> float:
+        if self.flood:
+            self.flood -= 1
+            return 2.0
+        return 0.0
+
+    def _result(self, method: TelegramMethod[Any]) -> Any:
+        if isinstance(method, SendMessage):
+            self.texts[method.chat_id].append(method.text)
+        return super()._result(method)
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: Optional[int] = None,
+    ) -> Any:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if isinstance(method, SendMessage) and method.text.isdigit():
+                await asyncio.sleep(int(method.text) / 100)
+            return await super().make_request(bot, method, timeout)
+        finally:
+            self.in_flight -= 1
+
+
+class StubShopAPI(ShopAPIClient):
+    """Shop API client answering from canned bodies, without HTTP.
+
+    `answers` maps a URL without its query to the bodies returned in turn;
+    a body that is an exception is raised instead. URLs in `handlers` are
+    answered by calling the handler with the payload. Requests are
+    recorded in `requests` as `(method, url, payload)`.
+    """
+
+    def __init__(
+        self,
+        answers: Optional[Dict[str, List[Any]]] = None,
+        handlers: Optional[Dict[str, Callable[[Any], Any]]] = None,
+    ) -> None:
+        super().__init__()
+        self.answers = answers or {}
+        self.handlers = handlers or {}
+        self.requests: List[Tuple[str, str, Any]] = []
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        payload: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        self.requests.append((method, url, payload))
+        if url.split("?")[0] in self.handlers:
+            return self.handlers[url.split("?")[0]](payload)
+        body = self.answers[url.split("?")[0]].pop(0)
+        if isinstance(body, Exception):
+            raise body
+        return body
+
+
+def product(product_id: int, title: str) -> Product:
+    """Builds a product as the shop API lists it."""
+    return {"id": product_id, "title": title, "price": "9.99", "image": None}
+
+
+class SendQueueTest(IsolatedAsyncioTestCase):
+    """Test case for sending Bot API calls through `SendQueue`."""
+
+    def setUp(self) -> None:
+        """Sets up a bot talking to a recording fake session."""
+        self.session = RecordingSession()
+        self.bot = Bot(token=FAKE_TOKEN, session=self.session)
+
+    async def send_texts(
+        self, queue: SendQueue, chat_id: int, texts: List[str]
+    ) -> None:
+        """Sends the texts to a chat at once, in list order."""
+        await asyncio.gather(
+            *(
+                queue.send(chat_id, partial(self.bot.send_message, chat_id, text))
+                for text in texts
+            )
+        )
+
+    async def test_chat_order_is_kept(self) -> None:
+        """Tests that a chat receives its messages in the order they were
+        queued, even when a later one would finish first."""
+        queue = SendQueue()
+        await asyncio.gather(
+            self.send_texts(queue, 1, ["5", "3", "1"]),
+            self.send_texts(queue, 2, ["4", "2", "0"]),
+        )
+        self.assertEqual(self.session.texts[1], ["5", "3", "1"])
+        self.assertEqual(self.session.texts[2], ["4", "2", "0"])
+        # The chats were sent to side by side.
+        self.assertEqual(self.session.max_in_flight, 2)
+
+    async def test_retry_after_waits_and_resends(self) -> None:
+        """Tests that a call answered with flood control is sent again after
+        the `retry_after` Telegram asked for."""
+        self.session.flood = 1
+        queue = SendQueue()
+        with mock.patch("asyncio.sleep", new_callable=mock.AsyncMock) as sleep:
+            await self.send_texts(queue, 1, ["0"])
+        self.assertIn(mock.call(2), sleep.await_args_list)
+        self.assertEqual(self.session.calls["SendMessage"], 2)
+        self.assertEqual(self.session.texts[1], ["0"])
+        self.assertEqual(queue.retries, 1)
+
+    async def test_retries_are_limited(self) -> None:
+        """Tests that flood control is raised once `max_retries` is used up."""
+        self.session.flood = 3
+        queue = SendQueue(max_retries=2)
+        with mock.patch("asyncio.sleep", new_callable=mock.AsyncMock):
+            with self.assertRaises(TelegramRetryAfter):
+                await self.send_texts(queue, 1, ["0"])
+        self.assertEqual(self.session.calls["SendMessage"], 3)
+
+    async def test_semaphore_limits_concurrency(self) -> None:
+        """Tests that no more than `concurrency` calls are in flight for all
+        chats together."""
+        queue = SendQueue(concurrency=3)
+        await asyncio.gather(
+            *(self.send_texts(queue, chat_id, ["1", "1"]) for chat_id in range(10))
+        )
+        self.assertEqual(self.session.max_in_flight, 3)
+        self.assertEqual(sum(map(len, self.session.texts.values())), 20)
+
+
+class CatalogCacheTest(IsolatedAsyncioTestCase):
+    """Test case for keeping `CatalogCache` in sync through `products/changes/`."""
+
+    changes_url = urls["changes"].split("?")[0]
+
+    async def test_delta_sync(self) -> None:
+        """Tests that a delta replaces changed products, drops deleted and
+        unavailable ones, and moves the sync token forward."""
+        api = StubShopAPI(
+            {
+                self.changes_url: [
+                    {
+                        "reset": True,
+                        "changed": [
+                            product(1, "Air Max"),
+                            product(2, "Old Skool"),
+                            product(3, "Chuck Taylor"),
+                        ],
+                        "deleted": [],
+                        "token": "token-1",
+                    },
+                    {
+                        "reset": False,
+                        # 2 was renamed, 4 added; 3 became unavailable and
+                        # 5 was deleted before this bot ever saw it.
+                        "changed": [product(2, "Sk8 Hi"), product(4, "Gel Lyte")],
+                        "deleted": [3, 5],
+                        "token": "token-2",
+                    },
+                    {"reset": False, "changed": [], "deleted": [], "token": "token-3"},
+                ],
+                urls["categories"]: [CATEGORIES] * 3,
+            }
+        )
+        cache = CatalogCache(api)
+
+        await cache.refresh()
+        self.assertEqual(sorted(cache.products), [1, 2, 3])
+        self.assertEqual(cache.token, "token-1")
+
+        await cache.refresh()
+        self.assertEqual(sorted(cache.products), [1, 2, 4])
+        self.assertEqual(cache.products[2]["title"], "Sk8 Hi")
+        self.assertEqual(sorted(cache.by_title), ["Air Max", "Gel Lyte", "Sk8 Hi"])
+        self.assertIsNone(cache.get("Chuck Taylor"))
+        self.assertEqual(cache.search("chuck taylor"), [])
+        self.assertEqual(cache.search("sk8 hi")[0][0]["id"], 2)
+        self.assertEqual(cache.search("old skool"), [])
+        self.assertEqual(cache.token, "token-2")
+        self.assertEqual(len(cache.categories), len(CATEGORIES))
+
+        await cache.refresh()
+        sent = [url for _, url, _ in api.requests if url.startswith(self.changes_url)]
+        self.assertNotIn("since=", sent[0])
+        self.assertIn("since=token-1", sent[1])
+        self.assertIn("since=token-2", sent[2])
+        self.assertEqual(cache.token, "token-3")
+        self.assertEqual(sorted(cache.products), [1, 2, 4])
+
+
+class Checkout(StatesGroup):
+    """Conversation states stored by the FSM storage tests."""
+
+    address = State()
+
+
+class SQLiteStorageTest(IsolatedAsyncioTestCase):
+    """Test case for the FSM storage kept in a SQLite file."""
+
+    def setUp(self) -> None:
+        """Sets up a storage in a temporary database file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "fsm.sqlite3")
+        self.database = SQLiteDatabase(self.path)
+        self.addCleanup(self.database.close)
+        self.storage = SQLiteStorage(self.database)
+        self.key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+    async def test_set_get_clear(self) -> None:
+        """Tests that state and data are stored separately, and that clearing
+        both deletes the row."""
+        context = FSMContext(self.storage, self.key)
+        self.assertIsNone(await context.get_state())
+        self.assertEqual(await context.get_data(), {})
+
+        await context.set_state(Checkout.address)
+        await context.update_data(cart={"Air Max": 2})
+        await context.update_data(email="john@example.com")
+        self.assertEqual(await context.get_state(), "Checkout:address")
+        self.assertEqual(
+            await context.get_data(),
+            {"cart": {"Air Max": 2}, "email": "john@example.com"},
+        )
+
+        await context.set_state(None)
+        self.assertIsNone(await context.get_state())
+        self.assertEqual(
+            await context.get_data(),
+            {"cart": {"Air Max": 2}, "email": "john@example.com"},
+        )
+
+        await context.clear()
+        self.assertIsNone(await context.get_state())
+        self.assertEqual(await context.get_data(), {})
+        rows = await self.database.run(
+            lambda db: db.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+        )
+        self.assertEqual(rows, 0)
+
+    async def test_keys_are_separate_and_persisted(self) -> None:
+        """Tests that users and bots do not share state, and that another
+        worker opening the file reads what was written."""
+        await self.storage.set_state(self.key, "first")
+        await self.storage.set_data(self.key, {"page": 2})
+        other_user = StorageKey(bot_id=1, chat_id=11, user_id=11)
+        other_bot = StorageKey(bot_id=2, chat_id=10, user_id=10)
+        for key in (other_user, other_bot):
+            self.assertIsNone(await self.storage.get_state(key))
+            self.assertEqual(await self.storage.get_data(key), {})
+
+        database = SQLiteDatabase(self.path)
+        self.addCleanup(database.close)
+        worker = SQLiteStorage(database)
+        self.assertEqual(await worker.get_state(self.key), "first")
+        self.assertEqual(await worker.get_data(self.key), {"page": 2})
+
+    async def test_event_isolation_serializes_updates(self) -> None:
+        """Tests that updates of one user run one at a time."""
+        isolation = SQLiteEventIsolation(self.database)
+        running: List[str] = []
+        overlaps = 0
+
+        async def handle(name: str) -> None:
+            nonlocal overlaps
+            async with isolation.lock(self.key):
+                overlaps += bool(running)
+                running.append(name)
+                await asyncio.sleep(0.01)
+                running.remove(name)
+
+        await asyncio.gather(*(handle(str(index)) for index in range(5)))
+        self.assertEqual(overlaps, 0)
+
+    async def test_make_storage(self) -> None:
+        """Tests that the storage URL picks the backend."""
+        storage, isolation = make_storage(f"sqlite:///{self.path}")
+        self.addAsyncCleanup(storage.close)
+        self.assertIsInstance(storage, SQLiteStorage)
+        self.assertIsInstance(isolation, SQLiteEventIsolation)
+        with self.assertRaises(ValueError):
+            make_storage("mongodb://localhost")
+
+
+class CatalogBrowsingTest(IsolatedAsyncioTestCase):
+    """Test case for the API cursors of catalog pages kept in the FSM data."""
+
+    products_url = urls["products"]
+
+    def page(self, first: int, cursor: Optional[str]) -> Dict[str, Any]:
+        """Builds a product page linking to the next one through `cursor`."""
+        return {
+            "next": (
+                f"{self.products_url}?cursor={cursor}&page_size=2" if cursor else None
+            ),
+            "previous": None,
+            "results": [product(first, f"Product {first}")],
+        }
+
+    async def asyncSetUp(self) -> None:
+        """Sets up the shop bot with a stub API and an in-memory FSM context."""
+        env = {"TG_BOT_TOKEN": FAKE_TOKEN, "BOT_FSM_STORAGE": "memory://"}
+        with mock.patch.dict(os.environ, env):
+            from bot import TelegramBot
+
+            self.shop_bot = TelegramBot()
+        self.api = StubShopAPI({self.products_url: []})
+        self.shop_bot.api = self.api
+        self.shop_bot.catalog = CatalogCache(self.api)
+        self.state = FSMContext(
+            MemoryStorage(), StorageKey(bot_id=1, chat_id=10, user_id=10)
+        )
+
+    async def render(
+        self, category: int, page: int, answer: Dict[str, Any]
+    ) -> List[str]:
+        """Renders a page and returns its navigation button data."""
+        self.api.answers[self.products_url].append(answer)
+        _, markup = await self.shop_bot.render_page(self.state, category, page)
+        return [
+            button.callback_data or ""
+            for row in markup.inline_keyboard
+            for button in row
+            if button.text.startswith(("◀", "Next"))
+        ]
+
+    def sent_cursor(self) -> Optional[str]:
+        """Returns the cursor of the last products request."""
+        return page_cursor(self.api.requests[-1][1])
+
+    async def cursors(self) -> List[Optional[str]]:
+        """Returns the cursors stored in the FSM data."""
+        return (await self.state.get_data())["catalog_browsing"]["cursors"]
+
+    async def test_cursors_are_stored_and_reused(self) -> None:
+        """Tests that each page's cursor is stored when the page before it is
+        shown and sent again when the user goes back and forth."""
+        buttons = await self.render(0, 0, self.page(1, "c1"))
+        self.assertIsNone(self.sent_cursor())
+        self.assertEqual(await self.cursors(), [None, "c1"])
+        self.assertEqual(buttons, [CatalogPage(category=0, page=1).pack()])
+
+        await self.render(0, 1, self.page(2, "c2"))
+        self.assertEqual(self.sent_cursor(), "c1")
+        self.assertEqual(await self.cursors(), [None, "c1", "c2"])
+
+        buttons = await self.render(0, 2, self.page(3, None))
+        self.assertEqual(self.sent_cursor(), "c2")
+        self.assertEqual(await self.cursors(), [None, "c1", "c2"])
+        self.assertEqual(buttons, [CatalogPage(category=0, page=1).pack()])
+
+        await self.render(0, 1, self.page(2, "c2"))
+        self.assertEqual(self.sent_cursor(), "c1")
+        await self.render(0, 0, self.page(1, "c1"))
+        self.assertIsNone(self.sent_cursor())
+        self.assertEqual(await self.cursors(), [None, "c1"])
+
+    async def test_other_category_starts_over(self) -> None:
+        """Tests that the cursors of one category are not used for another,
+        and that a page without a stored cursor falls back to the first."""
+        await self.render(0, 0, self.page(1, "c1"))
+        await self.render(3, 1, self.page(7, None))
+        self.assertIsNone(self.sent_cursor())
+        self.assertIn("category=3", self.api.requests[-1][1])
+        self.assertEqual(
+            (await self.state.get_data())["catalog_browsing"],
+            {"category": 3, "cursors": [None]},
+        )
+
+
+class CheckoutTest(IsolatedAsyncioTestCase):
+    """Test case for sending the shipping address to the checkout endpoint."""
+
+    cart = [{"product_name": "Product 1", "price": "9.99", "quantity": 2}]
+
+    async def asyncSetUp(self) -> None:
+        """Sets up the shop bot with a stub API and a customer at checkout."""
+        env = {"TG_BOT_TOKEN": FAKE_TOKEN, "BOT_FSM_STORAGE": "memory://"}
+        with mock.patch.dict(os.environ, env):
+            from bot import OrderStates, TelegramBot
+
+            self.shop_bot = TelegramBot()
+        self.api = StubShopAPI({urls["checkout"]: []})
+        self.shop_bot.api = self.api
+        self.state = FSMContext(
+            MemoryStorage(), StorageKey(bot_id=1, chat_id=10, user_id=10)
+        )
+        await self.state.set_state(OrderStates.shipping_address)
+        await self.state.update_data(cart=self.cart)
+
+    async def send_address(self) -> None:
+        """Sends a shipping address in the expected format."""
+        message = mock.AsyncMock(
+            text="John Smith, john@example.com, Gullweg, 18, Berlin, Germany",
+            message_id=5,
+        )
+        message.chat.id = 10
+        await self.shop_bot.process_shipping_input(message, self.state)
+
+    async def test_failed_checkout_keeps_cart(self) -> None:
+        """Tests that the cart survives an API error and is cleared only once
+        the order is placed."""
+        self.api.answers[urls["checkout"]] = [
+            ShopAPIError("POST checkout failed with 503", status=503),
+            {"checkout_url": "https://pay", "order_id": 1},
+        ]
+        await self.send_address()
+        self.assertEqual(await self.state.get_state(), "OrderStates:shipping_address")
+        self.assertEqual(await self.state.get_data(), {"cart": self.cart})
+
+        await self.send_address()
+        self.assertEqual(self.api.requests[-1][2]["cart_items"], self.cart)
+        self.assertIsNone(await self.state.get_state())
+        self.assertEqual(await self.state.get_data(), {})
+
+
+class PhotoCacheTest(IsolatedAsyncioTestCase):
+    """Test case for the `file_id`s of product photos kept in SQLite."""
+
+    image = "http://127.0.0.1:4421/media/images/products/air-max.jpg"
+
+    def setUp(self) -> None:
+        """Sets up a temporary database file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "photos.sqlite3")
+
+    def open_cache(self) -> PhotoCache:
+        """Opens the database file the way another worker would."""
+        database = SQLiteDatabase(self.path)
+        self.addCleanup(database.close)
+        return PhotoCache(database)
+
+    def product(self, image: Optional[str]) -> Product:
+        """Builds product 5 with the given image URL."""
+        return {"id": 5, "title": "Air Max", "price": "99.90", "image": image}
+
+    async def test_entries_survive_reopening(self) -> None:
+        """Tests that a stored `file_id` is read back from the file, for the
+        same image behind any host, and only for the bot that received it."""
+        await self.open_cache().put_many(1, {5: (image_hash(self.image), "file-5")})
+
+        cache = self.open_cache()
+        self.assertEqual(
+            await cache.get_many(1, [self.product(self.image)]), {5: "file-5"}
+        )
+        public = self.image.replace("http://127.0.0.1:4421", "https://shop.example")
+        self.assertEqual(await cache.get_many(1, [self.product(public)]), {5: "file-5"})
+        self.assertEqual(
+            await self.open_cache().get_many(2, [self.product(self.image)]), {}
+        )
+        self.assertEqual(await cache.get_many(1, [self.product(None)]), {})
+
+    async def test_changed_image_misses(self) -> None:
+        """Tests that a product whose image path changed is sent by URL
+        again, and that forgotten entries are gone for other workers too."""
+        cache = self.open_cache()
+        await cache.put_many(1, {5: (image_hash(self.image), "file-5")})
+        replaced = self.image.replace("air-max.jpg", "air-max_2.jpg")
+        self.assertEqual(await cache.get_many(1, [self.product(replaced)]), {})
+        self.assertEqual(
+            await self.open_cache().get_many(1, [self.product(replaced)]), {}
+        )
+
+        await cache.forget(1, [5])
+        self.assertEqual(await cache.get_many(1, [self.product(self.image)]), {})
+        self.assertEqual(
+            await self.open_cache().get_many(1, [self.product(self.image)]), {}
+        )
+
+
+class TrigramIndexTest(TestCase):
+    """Test case for fuzzy title lookups through `TrigramIndex`."""
+
+    def test_dice_score(self) -> None:
+        """Tests that titles are scored by the Dice coefficient of their
+        trigrams, ignoring case, punctuation and word order."""
+        self.assertEqual(trigrams("abc"), {"  a", " ab", "abc", "bc "})
+        index = TrigramIndex.from_items([(1, "abc"), (2, "Max, Air")])
+        # "abd" shares "  a" and " ab" of the four trigrams on each side.
+        self.assertEqual(index.search("abd"), [(1, 0.5)])
+        self.assertEqual(index.search("air max"), [(2, 1.0)])
+
+    def test_add_replaces_title(self) -> None:
+        """Tests that adding a key again replaces its title in place."""
+        index = TrigramIndex.from_items([(1, "Air Max"), (2, "Gel Lyte")])
+        index.add(1, "Old Skool")
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search("air max"), [])
+        self.assertEqual(index.search("old skool"), [(1, 1.0)])
+
+    def test_remove(self) -> None:
+        """Tests that removed titles are no longer found and leave no
+        trigrams behind, as when a delta sync deletes products."""
+        index = TrigramIndex.from_items([(1, "Air Max"), (2, "Air Force")])
+        index.remove(1)
+        index.remove(3)
+        self.assertEqual([key for key, _ in index.search("air max")], [2])
+        index.remove(2)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search("air"), [])
+        self.assertEqual(index._postings, {})
+
+    def test_max_candidates(self) -> None:
+        """Tests that once `max_candidates` titles were found through rare
+        trigrams, common ones only rank those candidates."""
+        items = [(1, "zebra")] + [(key, "apple") for key in range(2, 7)]
+        unbounded = TrigramIndex.from_items(items)
+        self.assertEqual(len(unbounded.search("zebra apple", limit=10)), 6)
+
+        bounded: TrigramIndex[int] = TrigramIndex(max_candidates=2)
+        for key, title in items:
+            bounded.add(key, title)
+        self.assertEqual(
+            [key for key, _ in bounded.search("zebra apple", limit=10)], [1]
+        )
+
+    def test_no_match_below_threshold(self) -> None:
+        """Tests that titles below `min_score` and queries without words
+        match nothing."""
+        index = TrigramIndex.from_items([(1, "Air Max")])
+        self.assertEqual(index.search("airplane wing"), [])
+        self.assertEqual(index.search("airplane wing", min_score=0.2)[0][0], 1)
+        self.assertEqual(index.search("!!"), [])
+
+    def test_best_match(self) -> None:
+        """Tests that only a close match clearly ahead of the next is picked."""
+        self.assertIsNone(best_match([]))
+        self.assertIsNone(best_match([(1, AUTO_PICK_SCORE - 0.01)]))
+        self.assertEqual(best_match([(1, AUTO_PICK_SCORE)]), 1)
+        self.assertEqual(best_match([(1, 0.9), (2, 0.7)]), 1)
+        self.assertIsNone(best_match([(1, 0.9), (2, 0.8)]))
+
+
+class ValidateRowTest(TestCase):
+    """Test case for turning imported rows into bulk payloads."""
+
+    def setUp(self) -> None:
+        """Sets up the category lookup of the fake catalog."""
+        self.categories = category_lookup(CATEGORIES)
+
+    def test_valid_rows(self) -> None:
+        """Tests that creates and updates are built from cleaned cells."""
+        self.assertEqual(
+            validate_row(
+                {
+                    " Title ": " Air Max ",
+                    "Price": "99.9",
+                    "category": "SHOES",
+                    "slug": "",
+                },
+                self.categories,
+            ),
+            {"title": "Air Max", "price": "99.90", "category": 2},
+        )
+        self.assertEqual(
+            validate_row(
+                '{"id": 7, "discount": 10, "category": 3.0, "is_available": "no"}',
+                self.categories,
+            ),
+            {"id": 7, "discount": 10, "category": 3, "is_available": False},
+        )
+
+    def test_invalid_rows(self) -> None:
+        """Tests that every kind of malformed row is rejected with a reason."""
+        rows = {
+            "{not json": "invalid JSON",
+            "[1, 2]": "expected an object",
+            '{"id": "seven", "is_available": "yes"}': "must be numbers",
+            '{"id": 7, "price": "cheap"}': "must be numbers",
+            '{"id": 7, "discount": "1.5"}': "must be numbers",
+            '{"id": 7, "price": "-1"}': "price out of range",
+            '{"id": 7, "price": "100000"}': "price out of range",
+            '{"id": 7, "price": "NaN"}': "price out of range",
+            '{"id": 7, "discount": 101}': "discount out of range",
+            '{"id": 7, "category": "Hats"}': "unknown category: Hats",
+            '{"id": 7, "is_available": "maybe"}': "is_available must be true or false",
+            '{"title": "Air Max"}': "missing price, category",
+            '{"id": 7, "title": ""}': "nothing to update",
+        }
+        for raw, reason in rows.items():
+            with self.subTest(raw=raw):
+                with self.assertRaisesRegex(RowError, reason):
+                    validate_row(raw, self.categories)
+
+
+class CatalogImportTest(IsolatedAsyncioTestCase):
+    """Test case for sending imported rows to the bulk endpoint."""
+
+    bulk_url = urls["bulk"]
+
+    def setUp(self) -> None:
+        """Sets up a stub bulk endpoint that rejects the slug 'taken'."""
+        self.next_id = 100
+        self.api = StubShopAPI(handlers={self.bulk_url: self.bulk})
+
+    def bulk(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Saves a batch, or rejects it whole if a row uses a taken slug."""
+        if any(item.get("slug") == "taken" for item in payload["create"]):
+            raise ShopAPIError(
+                "POST bulk failed with 400",
+                status=400,
+                data={"create": [{"slug": ["product with this slug already exists."]}]},
+            )
+        created = list(range(self.next_id, self.next_id + len(payload["create"])))
+        self.next_id += len(created)
+        return {
+            "created": created,
+            "updated": [item["id"] for item in payload["update"]],
+            "deleted": 0,
+        }
+
+    def batch_sizes(self) -> List[int]:
+        """Returns the number of rows of each bulk request, in order."""
+        return [
+            len(payload["create"]) + len(payload["update"])
+            for _, _, payload in self.api.requests
+        ]
+
+    async def test_rejected_batch_is_halved(self) -> None:
+        """Tests that a rejected batch is split until the bad row is alone,
+        and that the other rows are saved."""
+        items = [
+            (2, {"title": "A", "price": "1.00", "category": 1}),
+            (3, {"title": "B", "price": "1.00", "category": 1, "slug": "taken"}),
+            (4, {"id": 7, "price": "2.00"}),
+            (5, {"title": "C", "price": "1.00", "category": 1}),
+        ]
+        report = ImportReport()
+        await send_batch(self.api, items, report)
+        self.assertEqual(self.batch_sizes(), [4, 2, 1, 1, 2])
+        self.assertEqual((report.created, report.updated, report.failed), (2, 1, 1))
+        self.assertEqual(len(report.errors), 1)
+        self.assertTrue(report.errors[0].startswith("Row 3: "), report.errors)
+        self.assertIn("already exists", report.errors[0])
+
+    async def test_failed_batch_is_not_split(self) -> None:
+        """Tests that a batch failing for another reason than validation is
+        reported whole."""
+        self.api.handlers[self.bulk_url] = mock.Mock(
+            side_effect=ShopAPIError("POST bulk failed with 503", status=503)
+        )
+        items = [(2, {"id": 1, "price": "1.00"}), (3, {"id": 2, "price": "1.00"})]
+        report = ImportReport()
+        await send_batch(self.api, items, report)
+        self.assertEqual(len(self.api.requests), 1)
+        self.assertEqual(report.failed, 2)
+        self.assertEqual(report.errors, ["Rows 2-3 failed: POST bulk failed with 503"])
+
+    async def import_file(
+        self, name: str, content: bytes, batch_size: int = 500
+    ) -> ImportReport:
+        """Imports a file through `read_rows` and returns the final report."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / name
+        path.write_bytes(content)
+        return await import_catalog(
+            self.api, read_rows(path, name), CATEGORIES, mock.AsyncMock(), batch_size
+        )
+
+    async def test_product_changed_twice_in_a_batch(self) -> None:
+        """Tests that a second update of a product within one batch is
+        reported, while an update in the next batch goes through."""
+        content = b"id,price\n7,1.00\n7,2.00\n8,3.00\n7,4.00\n"
+        report = await self.import_file("prices.csv", content, batch_size=3)
+        self.assertEqual(report.errors, ["Row 3: product 7 changed twice in a batch"])
+        self.assertEqual((report.rows, report.updated, report.failed), (4, 3, 1))
+        updates = [payload["update"] for _, _, payload in self.api.requests]
+        self.assertEqual(
+            updates,
+            [
+                [{"id": 7, "price": "1.00"}, {"id": 8, "price": "3.00"}],
+                [{"id": 7, "price": "4.00"}],
+            ],
+        )
+
+    async def test_malformed_file(self) -> None:
+        """Tests that invalid lines are skipped, and that a file that cannot
+        be decoded further stops the import with the rows sent so far."""
+        line = b'{"title": "Air Max", "price": 1, "category": "clothes"}\n'
+        content = b"{oops\n" + line * 300 + b"\xff\xfe\n"
+        report = await self.import_file("goods.jsonl", content, batch_size=50)
+        self.assertTrue(
+            report.errors[0].startswith("Row 1: invalid JSON"), report.errors
+        )
+        self.assertTrue(
+            report.errors[-1].startswith("Stopped reading the file"), report.errors
+        )
+        self.assertTrue(0 < report.rows < 301, report.rows)
+        self.assertEqual(report.created, report.rows - 1)
+
+    def test_unsupported_file_type(self) -> None:
+        """Tests that only the supported formats are read."""
+        with self.assertRaisesRegex(RowError, "Unsupported file type '.pdf'"):
+            read_rows(Path("catalog.pdf"), "catalog.pdf")
+
+
+def paid_order(event_id: int, items: int = 1) -> PaidOrder:
+    """Builds a paid-order event of `items` lines."""
+    return {
+        "id": event_id,
+        "order": 1000 + event_id,
+        "amount": "10.00",
+        "payment_provider": "stripe",
+        "email": "john@example.com",
+        "items": [
+            {"title": f"Product {index}", "price": "10.00", "quantity": 1}
+            for index in range(items)
+        ],
+        "created": "2024-11-01T12:00:00Z",
+    }
+
+
+class FailingChatsSession(RecordingSession):
+    """Fake Bot API that blocked the bot in some chats and fails in others."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.blocked: Set[int] = set()
+        self.failing: Set[int] = set()
+
+    def _answer(
+        self, name: str, chat_id: Any, result: Callable[[], Any]
+    ) -> Dict[str, Any]:
+        if chat_id in self.blocked:
+            return {"ok": False, "error_code": 403, "description": "Forbidden: blocked"}
+        if chat_id in self.failing:
+            return {
+                "ok": False,
+                "error_code": 500,
+                "description": "Internal Server Error",
+            }
+        return super()._answer(name, chat_id, result)
+
+
+class OrderDigestTest(IsolatedAsyncioTestCase):
+    """Test case for announcing paid orders to the admin chats."""
+
+    async def asyncSetUp(self) -> None:
+        """Sets up a digest for three chats with two paid orders waiting."""
+        self.session = FailingChatsSession()
+        self.acked: List[List[int]] = []
+        self.api = StubShopAPI(
+            {urls["paid_orders"]: [[paid_order(1), paid_order(2)]]},
+            {
+                urls["paid_orders_ack"]: lambda payload: self.acked.append(
+                    payload["ids"]
+                )
+            },
+        )
+        self.digest = OrderDigest(
+            Bot(token=FAKE_TOKEN, session=self.session),
+            self.api,
+            SendQueue(),
+            chats=[1, 2, 3],
+            interval=60,
+        )
+        await self.digest.poll()
+
+    async def test_blocked_chat_is_skipped(self) -> None:
+        """Tests that a chat that blocked the bot does not hold the feed up."""
+        self.session.blocked.add(2)
+        self.assertTrue(await self.digest.flush())
+        self.assertEqual(list(self.session.texts), [1, 3])
+        self.assertIn("2 paid orders, 20.00 USD", self.session.texts[1][0])
+        self.assertEqual(self.acked, [[1, 2]])
+        self.assertEqual(self.digest.pending, {})
+
+    async def test_failed_chat_is_retried_before_ack(self) -> None:
+        """Tests that the events are not acknowledged until every chat got
+        the digest, and that chats already served are not sent it again."""
+        self.session.failing.add(2)
+        self.assertFalse(await self.digest.flush())
+        self.assertEqual(self.acked, [])
+        self.assertEqual(list(self.session.texts), [1])
+
+        self.session.failing.clear()
+        self.assertTrue(await self.digest.flush())
+        self.assertEqual(self.acked, [[1, 2]])
+        self.assertEqual(
+            {chat: len(texts) for chat, texts in self.session.texts.items()},
+            {1: 1, 2: 1, 3: 1},
+        )
+        self.assertEqual(self.digest.batch, [])
+
+    def test_due(self) -> None:
+        """Tests that orders wait for the interval unless enough piled up."""
+        self.assertFalse(self.digest.due)
+        self.digest.max_orders = 2
+        self.assertTrue(self.digest.due)
+        self.digest.max_orders = 20
+        self.digest.waiting_since = time.monotonic() - 61
+        self.assertTrue(self.digest.due)
+
+    def test_format_digest_splits_at_limit(self) -> None:
+        """Tests that long digests are split into messages Telegram accepts,
+        keeping every order and cutting an order too long for one message."""
+        events = [paid_order(event_id, items=20) for event_id in range(1, 41)]
+        messages = format_digest(events)
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(message) <= MESSAGE_LIMIT for message in messages))
+        self.assertTrue(messages[0].startswith("💰 40 paid orders, 400.00 USD"))
+        text = "\n\n".join(messages)
+        for event_id in range(1, 41):
+            self.assertEqual(text.count(f"#{1000 + event_id} "), 1)
+
+        (message,) = format_digest([paid_order(1, items=500)])[1:]
+        self.assertEqual(len(message), MESSAGE_LIMIT - 2)
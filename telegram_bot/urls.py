@@ -1,7 +1,15 @@
-API_URL = "http://127.0.0.1:4421/v1/api"
+import os
+
+API_URL = os.environ.get("SHOP_API_URL", "http://127.0.0.1:4421/v1/api")
 
 urls = {
     "products": f"{API_URL}/products/",
+    "catalog": f"{API_URL}/products/?fields=id,title,price,image&page_size=100",
+    "changes": f"{API_URL}/products/changes/?fields=id,title,price,image",
+    "bulk": f"{API_URL}/products/bulk/",
+    "categories": f"{API_URL}/categories/",
     "checkout": f"{API_URL}/checkout/",
+    "paid_orders": f"{API_URL}/paid-orders/",
+    "paid_orders_ack": f"{API_URL}/paid-orders/ack/",
     "ngrok_url": "https://36a7-91-64-228-61.ngrok-free.app",
 }
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import multiprocessing
+from dataclasses import dataclass
+from typing import Callable, Optional, Protocol
+
+import environ
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookBot(Protocol):
+    """A bot that can be served from a webhook."""
+
+    bot: Bot
+    dp: Dispatcher
+
+
+@dataclass(frozen=True)
+class WebhookConfig:
+    """Where Telegram sends updates and how many processes receive them."""
+
+    base_url: str
+    path: str
+    host: str = "0.0.0.0"
+    port: int = 8080
+    secret: Optional[str] = None
+    workers: int = 1
+
+    @property
+    def url(self) -> str:
+        """Public URL registered with Telegram."""
+        return self.base_url.rstrip("/") + self.path
+
+    @classmethod
+    def from_env(
+        cls, env: environ.Env, prefix: str, default_path: str
+    ) -> "WebhookConfig":
+        """Reads `<prefix>_WEBHOOK_URL`, `_PATH`, `_HOST`, `_PORT`, `_SECRET`
+        and `_WORKERS`."""
+        return cls(
+            base_url=env(f"{prefix}_WEBHOOK_URL"),
+            path=env(f"{prefix}_WEBHOOK_PATH", default=default_path),
+            host=env(f"{prefix}_WEBHOOK_HOST", default="0.0.0.0"),
+            port=env.int(f"{prefix}_WEBHOOK_PORT", default=8080),
+            secret=env(f"{prefix}_WEBHOOK_SECRET", default=None),
+            workers=env.int(f"{prefix}_WORKERS", default=1),
+        )
+
+
+async def register_webhook(
+    make_bot: Callable[[], WebhookBot], config: WebhookConfig
+) -> None:
+    """Points Telegram at the webhook URL for the update types the bot handles."""
+    app = make_bot()
+    try:
+        await app.bot.set_webhook(
+            config.url,
+            secret_token=config.secret,
+            allowed_updates=app.dp.resolve_used_update_types(),
+            max_connections=max(40, config.workers * 10),
+        )
+    finally:
+        await app.bot.session.close()
+        # Workers open their own connections; none may be inherited.
+        await app.dp.storage.close()
+
+
+def build_app(app: WebhookBot, config: WebhookConfig) -> web.Application:
+    """Builds the aiohttp application that feeds webhook updates to the dispatcher.
+
+    The dispatcher's startup and shutdown handlers run with the application.
+    """
+    web_app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=app.dp, bot=app.bot, secret_token=config.secret
+    ).register(web_app, path=config.path)
+    setup_application(web_app, app.dp, bot=app.bot)
+    return web_app
+
+
+def run_worker(make_bot: Callable[[], WebhookBot], config: WebhookConfig) -> None:
+    """Serves the webhook in this process."""
+    web.run_app(
+        build_app(make_bot(), config),
+        host=config.host,
+        port=config.port,
+        reuse_port=config.workers > 1,
+        print=None,
+    )
+
+
+def serve_webhook(make_bot: Callable[[], WebhookBot], config: WebhookConfig) -> None:
+    """Registers the webhook and serves it from `config.workers` processes.
+
+    Workers share the listening port (`SO_REUSEPORT`), and the kernel spreads
+    Telegram's connections between them. Conversation state must live in a
+    storage every worker can reach, such as `sqlite:///` or `redis://`.
+    """
+    asyncio.run(register_webhook(make_bot, config))
+    logger.info("Serving %s with %s worker(s)", config.url, config.workers)
+    if config.workers == 1:
+        run_worker(make_bot, config)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(make_bot, config))
+        for _ in range(config.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
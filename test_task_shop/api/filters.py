@@ -0,0 +1,106 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from django.db.models import QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.request import Request
+from shop.models import Category, Product
+
+TRUE_VALUES = {"1", "true", "yes"}
+
+
+def category_subtree(category: str) -> Set[int]:
+    """
+    Return the ids of the category given by id or slug and all its descendants.
+
+    Categories are read with a single query and walked in memory, so the cost
+    does not depend on the depth of the tree.
+    """
+    children: Dict[Optional[int], List[int]] = defaultdict(list)
+    root_ids = set()
+    for pk, parent_id, slug in Category.objects.values_list("id", "parent_id", "slug"):
+        children[parent_id].append(pk)
+        if category in (str(pk), slug):
+            root_ids.add(pk)
+
+    subtree = set()
+    pending = list(root_ids)
+    while pending:
+        pk = pending.pop()
+        if pk not in subtree:
+            subtree.add(pk)
+            pending.extend(children[pk])
+    return subtree
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Filters products by the `category`, `brand`, `min_price`, `max_price` and
+    `discounted` query parameters.
+
+    `category` takes an id or slug and includes every subcategory, `brand`
+    matches exactly and `discounted=true` keeps only products on discount.
+    Each supported combination is backed by an index on `Product`.
+    """
+
+    def _price(self, request: Request, name: str) -> Optional[Decimal]:
+        """
+        Parse a price query parameter, rejecting malformed values with 400.
+        """
+        value = request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: ["A valid number is required."]})
+        if not price.is_finite():
+            raise ValidationError({name: ["A valid number is required."]})
+        return price
+
+    def filter_queryset(
+        self, request: Request, queryset: QuerySet[Product], view: Any
+    ) -> QuerySet[Product]:
+        params = request.query_params
+
+        category = params.get("category")
+        if category:
+            queryset = queryset.filter(category_id__in=category_subtree(category))
+
+        brand = params.get("brand")
+        if brand:
+            queryset = queryset.filter(brand=brand)
+
+        min_price = self._price(request, "min_price")
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        max_price = self._price(request, "max_price")
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+
+        if params.get("discounted", "").lower() in TRUE_VALUES:
+            queryset = queryset.filter(discount__gt=0)
+        return queryset
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    Orders products by a single field from `?ordering=`, e.g. `price` or
+    `-create_at`.
+
+    The id is appended in the same direction as a tie-breaker, so cursor
+    pagination stays stable and the ordering matches an index.
+    """
+
+    def get_ordering(
+        self, request: Request, queryset: QuerySet[Product], view: Any
+    ) -> Optional[Tuple[str, ...]]:
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        field = ordering[0]
+        if field.lstrip("-") == "id":
+            return (field,)
+        return (field, "-id" if field.startswith("-") else "id")
@@ -0,0 +1,96 @@
+import argparse
+import gzip
+import time
+from decimal import Decimal
+from typing import Any, Callable, List
+
+import brotli
+from api.renderers import ORJSONRenderer
+from api.serializers import FastProductSerializer
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+
+def _best_of(repeat: int, func: Callable[[], Any]) -> float:
+    """
+    Run `func` `repeat` times and return the fastest run in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def catalog_page(size: int) -> List[Any]:
+    """
+    Build a product list payload shaped like a `v1/api/products/` page.
+    """
+    serializer = FastProductSerializer()
+    return serializer.serialize_many(
+        {
+            "id": index,
+            "title": f"Product {index}",
+            "slug": f"product-{index}",
+            "price": Decimal(index % 500) + Decimal("0.99"),
+            "category_id": index % 20 + 1,
+            "image": f"images/products/01-01-2025/product-{index}.jpg",
+        }
+        for index in range(size)
+    )
+
+
+class Command(BaseCommand):
+    """
+    Measure render time and bytes on the wire for catalog payloads.
+    """
+
+    help = (
+        "Benchmark DRF's JSONRenderer against the orjson renderer and report "
+        "the size and compression time of catalog payloads with gzip and brotli."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5_000])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--brotli-quality", type=int, default=5)
+        parser.add_argument("--gzip-level", type=int, default=6)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        repeat = options["repeat"]
+        drf_renderer = JSONRenderer()
+        fast_renderer = ORJSONRenderer()
+
+        self.stdout.write("Render time")
+        self.stdout.write(
+            f"{'products':>10} {'DRF json':>12} {'orjson':>12} {'speedup':>8}"
+        )
+        for size in options["sizes"]:
+            data = {"next": None, "previous": None, "results": catalog_page(size)}
+            slow = _best_of(repeat, lambda: drf_renderer.render(data))
+            fast = _best_of(repeat, lambda: fast_renderer.render(data))
+            self.stdout.write(
+                f"{size:>10} {slow * 1000:>10.2f}ms {fast * 1000:>10.2f}ms "
+                f"{slow / fast:>7.1f}x"
+            )
+
+        self.stdout.write("\nBytes on the wire")
+        self.stdout.write(
+            f"{'products':>10} {'identity':>10} {'gzip':>18} {'brotli':>18}"
+        )
+        for size in options["sizes"]:
+            body = fast_renderer.render({"results": catalog_page(size)})
+            gzipped = gzip.compress(body, compresslevel=options["gzip_level"])
+            brotlied = brotli.compress(body, quality=options["brotli_quality"])
+            gzip_time = _best_of(
+                repeat, lambda: gzip.compress(body, compresslevel=options["gzip_level"])
+            )
+            brotli_time = _best_of(
+                repeat, lambda: brotli.compress(body, quality=options["brotli_quality"])
+            )
+            self.stdout.write(
+                f"{size:>10} {len(body):>10} "
+                f"{len(gzipped):>9} {gzip_time * 1000:>6.2f}ms "
+                f"{len(brotlied):>9} {brotli_time * 1000:>6.2f}ms"
+            )
@@ -0,0 +1,92 @@
+import argparse
+import time
+from decimal import Decimal
+from typing import Any, Callable, List
+
+from api.serializers import FastProductSerializer, ProductSerializer
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+from shop.models import Category, Product
+
+
+def _best_of(repeat: int, func: Callable[[], Any]) -> float:
+    """
+    Run `func` `repeat` times and return the fastest run in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    """
+    Compare `ProductSerializer` with the fast `values()` read path.
+    """
+
+    help = (
+        "Benchmark product list serialization with ProductSerializer and "
+        "FastProductSerializer. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._run(options["sizes"], options["repeat"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, sizes: List[int], repeat: int) -> None:
+        request = Request(RequestFactory().get("/v1/api/products/"))
+        category = Category.objects.create(name="Benchmark", slug="benchmark")
+        created = 0
+
+        self.stdout.write(
+            f"{'products':>10} {'ModelSerializer':>16} {'fast path':>12} {'speedup':>8}"
+        )
+        for size in sorted(sizes):
+            Product.objects.bulk_create(
+                (
+                    Product(
+                        title=f"Product {index}",
+                        slug=f"product-{index}",
+                        brand="Brand",
+                        price=Decimal(index % 500) + Decimal("0.99"),
+                        image=f"images/products/01-01-2025/product-{index}.jpg",
+                        category=category,
+                        is_available=True,
+                    )
+                    for index in range(created, size)
+                ),
+                batch_size=5_000,
+            )
+            created = max(created, size)
+            queryset = Product.available.select_related("category")[:size]
+
+            def model_serializer() -> Any:
+                return ProductSerializer(
+                    queryset.all(), many=True, context={"request": request}
+                ).data
+
+            def fast_serializer() -> Any:
+                serializer = FastProductSerializer(request)
+                return serializer.serialize_many(
+                    queryset.values(*serializer.value_names)
+                )
+
+            slow = _best_of(repeat, model_serializer)
+            fast = _best_of(repeat, fast_serializer)
+            self.stdout.write(
+                f"{size:>10} {slow * 1000:>14.1f}ms {fast * 1000:>10.1f}ms "
+                f"{slow / fast:>7.1f}x"
+            )
@@ -0,0 +1,24 @@
+from typing import Any
+
+from rest_framework.pagination import CursorPagination
+
+
+class DefaultCursorPagination(CursorPagination):
+    """
+    Cursor pagination used by default for every list endpoint of the API.
+
+    Cursor pages cost the same to fetch no matter how deep the client has
+    paged, and clients can pick a smaller or larger page with `page_size`.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = "-id"
+
+
+class ProductCursorPagination(DefaultCursorPagination):
+    """
+    Cursor pagination over products, newest first.
+    """
+
+    ordering: Any = ("-create_at", "-id")
@@ -0,0 +1,24 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+from rest_framework.request import Request
+from rest_framework.views import APIView
+
+
+class HasOrderFeedToken(BasePermission):
+    """
+    Lets in clients sending `Authorization: Bearer <ORDER_FEED_TOKEN>`.
+
+    The paid-order feed exposes customer emails, so it is closed to
+    everybody while `ORDER_FEED_TOKEN` is not set.
+    """
+
+    def has_permission(self, request: Request, view: APIView) -> bool:
+        token = settings.ORDER_FEED_TOKEN
+        if not token:
+            return False
+        scheme, _, sent = request.headers.get("Authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            sent.encode(), token.encode()
+        )
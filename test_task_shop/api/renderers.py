@@ -0,0 +1,59 @@
+from typing import Any, Mapping, Optional
+
+import orjson
+from django.utils.http import parse_header_parameters
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Renders JSON with orjson, which is several times faster than `json`.
+
+    Values orjson does not know natively (`Decimal`, lazy translations, ...)
+    are converted the same way as by DRF's `JSONRenderer`. An `indent`
+    parameter in the accepted media type pretty-prints the output.
+    """
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(
+        self,
+        data: Any,
+        accepted_media_type: Optional[str] = None,
+        renderer_context: Optional[Mapping[str, Any]] = None,
+    ) -> bytes:
+        if data is None:
+            return b""
+        option = orjson.OPT_NON_STR_KEYS
+        if accepted_media_type:
+            _, params = parse_header_parameters(accepted_media_type)
+            if params.get("indent"):
+                option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_encoder.default, option=option)
+
+
+class ORJSONParser(BaseParser):
+    """
+    Parses JSON request bodies with orjson.
+    """
+
+    media_type = "application/json"
+    renderer_class = ORJSONRenderer
+
+    def parse(
+        self,
+        stream: Any,
+        media_type: Optional[str] = None,
+        parser_context: Optional[Mapping[str, Any]] = None,
+    ) -> Any:
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
@@ -1,14 +1,265 @@
-from payment.models import ShippingAddress
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.encoding import filepath_to_uri
+from django.utils.text import slugify
+from payment.models import OrderItem, PaidOrderEvent, ShippingAddress
 from rest_framework import serializers
-from shop.models import Product
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from shop.models import Category, Product
+
+
+class SparseFieldsetsMixin:
+    """
+    Limits the serialized fields to those listed in the `fields` query parameter.
+
+    For example `?fields=id,title,price` returns only those three fields.
+    Unknown names are ignored and write requests always use every field.
+    """
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")  # type: ignore[attr-defined]
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        requested = request.query_params.get("fields")
+        if not requested:
+            return
+        allowed = {name.strip() for name in requested.split(",")}
+        for name in set(self.fields) - allowed:  # type: ignore[attr-defined]
+            self.fields.pop(name)  # type: ignore[attr-defined]
 
-class ProductSerializer(serializers.ModelSerializer):
+
+class ProductSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ["id", "title", "slug", "price", "category", "image"]
 
 
+class FastProductSerializer:
+    """
+    Read-only serializer for products fetched as `values()` rows.
+
+    It produces the same output as `ProductSerializer` without building
+    `Product` instances or running DRF's per-field machinery: the accessor for
+    every requested field is resolved once, and image URLs are built by
+    appending the file path to a precomputed absolute media URL.
+    """
+
+    fields: Sequence[str] = ProductSerializer.Meta.fields
+
+    # Model columns read for each serialized field.
+    columns: Dict[str, str] = {"category": "category_id"}
+
+    def __init__(
+        self,
+        request: Optional[Request] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> None:
+        if fields is None and request is not None:
+            requested = request.query_params.get("fields")
+            if requested:
+                fields = {name.strip() for name in requested.split(",")}
+        self.field_names = [
+            name for name in self.fields if fields is None or name in fields
+        ]
+        self.value_names = [self.columns.get(name, name) for name in self.field_names]
+        self._accessors: List[Tuple[str, str, Optional[Callable[[Any], Any]]]] = [
+            (name, column, self._converter(name))
+            for name, column in zip(self.field_names, self.value_names)
+        ]
+
+        self._media_url: Optional[str] = None
+        if isinstance(default_storage, FileSystemStorage):
+            base_url = default_storage.base_url
+            self._media_url = (
+                request.build_absolute_uri(base_url)
+                if request is not None
+                else base_url
+            )
+        self._request = request
+
+    def _converter(self, name: str) -> Optional[Callable[[Any], Any]]:
+        """
+        Return the function converting a raw column value, or None if not needed.
+        """
+        if name == "price":
+            return self._decimal
+        if name == "image":
+            return self._image_url
+        return None
+
+    @staticmethod
+    def _decimal(value: Optional[Decimal]) -> Optional[str]:
+        """
+        Format a price the way `serializers.DecimalField` does.
+        """
+        if value is None:
+            return None
+        return format(value.quantize(Decimal("0.01")), "f")
+
+    def _image_url(self, name: Optional[str]) -> Optional[str]:
+        """
+        Build the absolute URL of an image stored under `name`.
+        """
+        if not name:
+            return None
+        if self._media_url is not None:
+            return self._media_url + filepath_to_uri(name)
+        url = default_storage.url(name)
+        if self._request is not None:
+            return self._request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Serialize a single `values()` row.
+        """
+        return {
+            name: convert(row[column]) if convert else row[column]
+            for name, column, convert in self._accessors
+        }
+
+    def serialize_many(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Serialize a sequence of `values()` rows.
+        """
+        accessors = self._accessors
+        return [
+            {
+                name: convert(row[column]) if convert else row[column]
+                for name, column, convert in accessors
+            }
+            for row in rows
+        ]
+
+
+class ProductWriteSerializer(serializers.ModelSerializer):
+    """
+    Validates a product created through the bulk endpoint.
+
+    Slug uniqueness and category existence are checked for the whole batch by
+    `ProductBulkSerializer`, so validating a row costs no database queries.
+    """
+
+    slug = serializers.SlugField(max_length=264, required=False)
+    category = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = Product
+        fields = [
+            "title",
+            "slug",
+            "brand",
+            "description",
+            "price",
+            "discount",
+            "category",
+            "is_available",
+        ]
+        extra_kwargs = {"brand": {"required": False}}
+
+    def validate(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
+        if not attrs.get("slug"):
+            attrs["slug"] = slugify(attrs["title"])
+        return attrs
+
+
+class ProductUpdateSerializer(ProductWriteSerializer):
+    """
+    Validates a partial product update sent to the bulk endpoint.
+    """
+
+    id = serializers.IntegerField(min_value=1)
+
+    class Meta(ProductWriteSerializer.Meta):
+        fields = ["id"] + ProductWriteSerializer.Meta.fields
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            if name != "id":
+                field.required = False
+
+    def validate(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
+        return attrs
+
+
+class ProductBulkSerializer(serializers.Serializer):
+    """
+    Validates a batch of product creates, partial updates and deletes.
+
+    Every row is validated before anything is written. Cross-row checks
+    (unique slugs, existing categories and products) run as one query each.
+    """
+
+    create = ProductWriteSerializer(many=True, required=False)
+    update = ProductUpdateSerializer(many=True, required=False)
+    delete = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False
+    )
+
+    def validate(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
+        create = attrs.setdefault("create", [])
+        update = attrs.setdefault("update", [])
+        delete = attrs.setdefault("delete", [])
+
+        total = len(create) + len(update) + len(delete)
+        if not total:
+            raise serializers.ValidationError("The batch is empty.")
+        if total > settings.PRODUCT_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f"A batch can hold at most {settings.PRODUCT_BULK_MAX_ITEMS} changes."
+            )
+
+        errors: Dict[str, Any] = {}
+        update_ids = [item["id"] for item in update]
+        existing = set(
+            Product.objects.filter(id__in=update_ids + delete).values_list(
+                "id", flat=True
+            )
+        )
+        missing = [pk for pk in update_ids + delete if pk not in existing]
+        if missing:
+            errors["missing"] = [f"Products not found: {sorted(set(missing))}"]
+        if len(set(update_ids)) != len(update_ids) or set(update_ids) & set(delete):
+            errors["update"] = ["Each product can be changed only once per batch."]
+
+        categories = {
+            item["category"] for item in create + update if "category" in item
+        }
+        found = set(
+            Category.objects.filter(id__in=categories).values_list("id", flat=True)
+        )
+        if categories - found:
+            errors["category"] = [f"Categories not found: {sorted(categories - found)}"]
+
+        slugs: Dict[str, Optional[int]] = {}
+        for item in create + update:
+            if "slug" not in item:
+                continue
+            if item["slug"] in slugs:
+                errors["slug"] = [f"Duplicate slug in batch: {item['slug']}"]
+            slugs[item["slug"]] = item.get("id")
+        taken = Product.objects.filter(slug__in=slugs).values_list("id", "slug")
+        conflicts = sorted(slug for pk, slug in taken if slugs[slug] != pk)
+        if conflicts:
+            errors.setdefault("slug", []).append(f"Slugs already in use: {conflicts}")
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ["id", "name", "slug", "parent"]
+
+
 class ShippingAddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShippingAddress
@@ -26,3 +277,37 @@ class CartItemSerializer(serializers.Serializer):
     product_name = serializers.CharField(max_length=255)
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
     quantity = serializers.IntegerField()
+
+
+class PaidOrderItemSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source="product.title", default=None)
+
+    class Meta:
+        model = OrderItem
+        fields = ["title", "price", "quantity"]
+
+
+class PaidOrderEventSerializer(serializers.ModelSerializer):
+    """
+    Summary of a paid order for the admin bot's digest.
+    """
+
+    order = serializers.IntegerField(source="order_id")
+    amount = serializers.DecimalField(
+        source="order.amount", max_digits=9, decimal_places=2
+    )
+    payment_provider = serializers.CharField(source="order.payment_provider")
+    email = serializers.EmailField(source="order.shipping_address.email", default=None)
+    items = PaidOrderItemSerializer(source="order.items", many=True)
+
+    class Meta:
+        model = PaidOrderEvent
+        fields = [
+            "id",
+            "order",
+            "amount",
+            "payment_provider",
+            "email",
+            "items",
+            "created",
+        ]
@@ -0,0 +1,91 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+from api.serializers import FastProductSerializer
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from shop.models import Product, ProductTombstone
+
+SYNC_TOKEN_SALT = "api.products.changes"
+
+
+class InvalidSyncToken(Exception):
+    """
+    Raised when a sync token was tampered with or is malformed.
+    """
+
+
+def make_sync_token(cutoff: datetime.datetime) -> str:
+    """
+    Sign the cutoff from which the next sync should read changes.
+    """
+    return signing.dumps({"cutoff": cutoff.isoformat()}, salt=SYNC_TOKEN_SALT)
+
+
+def read_sync_token(token: str) -> datetime.datetime:
+    """
+    Return the cutoff stored in a sync token.
+    """
+    try:
+        payload = signing.loads(token, salt=SYNC_TOKEN_SALT)
+        return datetime.datetime.fromisoformat(payload["cutoff"])
+    except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+        raise InvalidSyncToken(str(e)) from e
+
+
+def catalog_changes(
+    serializer: FastProductSerializer, since: Optional[datetime.datetime] = None
+) -> Dict[str, Any]:
+    """
+    Collect the catalog changes made since the cutoff.
+
+    Products saved since the cutoff are returned in `changed` while they are
+    available and their ids in `deleted` once they are not; deleted products
+    are read from their tombstones. Without a cutoff, or with one older than
+    the tombstone retention window, the whole catalog is returned with
+    `reset` set so the client replaces its copy.
+
+    The next token starts `CATALOG_SYNC_OVERLAP` seconds before now, so rows
+    committed by transactions that were in flight are sent again rather than
+    missed; clients apply changes by id and can ignore the repeats. With read
+    replicas it starts `DATABASE_REPLICA_LAG_WINDOW` seconds earlier still,
+    as the changes may have been read from a replica that had not caught up.
+    """
+    now = timezone.now()
+    retention = datetime.timedelta(days=settings.CATALOG_TOMBSTONE_RETENTION_DAYS)
+    reset = since is None or since < now - retention
+
+    changed: List[Dict[str, Any]] = []
+    deleted: List[int] = []
+    if reset:
+        rows = Product.available.values(*serializer.value_names)
+        changed = serializer.serialize_many(rows)
+    else:
+        columns = {"id", "is_available", *serializer.value_names}
+        rows = (
+            Product.objects.filter(update_at__gte=since)
+            .order_by("update_at", "id")
+            .values(*columns)
+        )
+        for row in rows:
+            if row["is_available"]:
+                changed.append(serializer.to_representation(row))
+            else:
+                deleted.append(row["id"])
+        deleted.extend(
+            ProductTombstone.objects.filter(deleted_at__gte=since).values_list(
+                "product_id", flat=True
+            )
+        )
+
+    overlap = settings.CATALOG_SYNC_OVERLAP
+    if settings.DATABASE_REPLICAS:
+        overlap += settings.DATABASE_REPLICA_LAG_WINDOW
+    cutoff = now - datetime.timedelta(seconds=overlap)
+    return {
+        "reset": reset,
+        "changed": changed,
+        "deleted": sorted(set(deleted)),
+        "token": make_sync_token(cutoff),
+    }
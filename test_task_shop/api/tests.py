@@ -0,0 +1,964 @@
+import asyncio
+import gzip
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from unittest import mock, skipUnless
+from urllib.parse import parse_qsl, urlsplit
+
+import brotli
+from api.renderers import ORJSONRenderer
+from api.serializers import ProductSerializer
+from api.views import OrderStatusView
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from payment.models import Order, OrderItem, PaidOrderEvent, ShippingAddress
+from rest_framework.request import Request
+from shop.catalog_cache import get_catalog_version
+from shop.models import Category, Product, ProductTombstone
+from test_task_shop.db_router import ReplicaRouter, replica_reads
+from test_task_shop.middleware import (
+    LoadSheddingMiddleware,
+    ReplicaRoutingMiddleware,
+    ThrottleMiddleware,
+    negotiate_encoding,
+)
+
+
+class ProductPaginationTest(TestCase):
+    """
+    Test case for cursor pagination and sparse fieldsets on `v1/api/products/`.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up a category with seven available products and one unavailable one.
+        """
+        cache.clear()
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        for index in range(8):
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                price=Decimal("10.00") + index,
+                category=category,
+                is_available=index != 7,
+            )
+
+    def test_pages_cover_catalog_once(self) -> None:
+        """
+        Tests that following `next` links returns every available product once.
+        """
+        url = "/v1/api/products/?page_size=3"
+        titles: List[str] = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data["results"]), 3)
+            titles.extend(item["title"] for item in data["results"])
+            url = data["next"]
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(titles), [f"Product {index}" for index in range(7)])
+
+    def test_page_query_count_is_constant(self) -> None:
+        """
+        Tests that a page is served with a single query.
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get("/v1/api/products/?page_size=5")
+        self.assertEqual(len(response.json()["results"]), 5)
+
+    def test_sparse_fieldsets(self) -> None:
+        """
+        Tests that `fields` limits the serialized fields of each product.
+        """
+        response = self.client.get("/v1/api/products/?fields=id,title,price")
+        item = response.json()["results"][0]
+        self.assertEqual(set(item), {"id", "title", "price"})
+        self.assertEqual(item["title"], "Product 6")
+
+
+class FastProductSerializerTest(TestCase):
+    """
+    Test case checking that the fast read path matches `ProductSerializer`.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up products with and without an image.
+        """
+        cache.clear()
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        self.product = Product.objects.create(
+            title="Product 1",
+            slug="product-1",
+            price=Decimal("12.50"),
+            image="images/products/19-10-2026/photo with space.jpg",
+            category=category,
+            is_available=True,
+        )
+        Product.objects.create(
+            title="Product 2",
+            slug="product-2",
+            price=Decimal("3"),
+            image="",
+            category=category,
+            is_available=True,
+        )
+
+    def expected(self, path: str) -> list:
+        """
+        Serializes available products with `ProductSerializer` for comparison.
+        """
+        request = Request(RequestFactory().get(path))
+        return ProductSerializer(
+            Product.available.all(), many=True, context={"request": request}
+        ).data
+
+    def test_list_matches_model_serializer(self) -> None:
+        """
+        Tests that list output is identical to the model serializer's.
+        """
+        response = self.client.get("/v1/api/products/")
+        self.assertEqual(response.json()["results"], self.expected("/v1/api/products/"))
+
+    def test_retrieve_matches_model_serializer(self) -> None:
+        """
+        Tests that retrieve output is identical and honors sparse fieldsets.
+        """
+        response = self.client.get(f"/v1/api/products/{self.product.id}/")
+        expected = [
+            item
+            for item in self.expected("/v1/api/products/")
+            if item["id"] == self.product.id
+        ]
+        self.assertEqual([response.json()], expected)
+        self.assertEqual(
+            response.json()["image"],
+            "http://testserver/media/images/products/19-10-2026/"
+            "photo%20with%20space.jpg",
+        )
+
+        response = self.client.get(
+            f"/v1/api/products/{self.product.id}/?fields=id,image"
+        )
+        self.assertEqual(set(response.json()), {"id", "image"})
+        self.assertEqual(self.client.get("/v1/api/products/0/").status_code, 404)
+        self.assertEqual(self.client.get("/v1/api/products/abc/").status_code, 404)
+
+
+@override_settings(ORDER_FEED_TOKEN="feed-token")
+class ProductBulkWriteTest(TestCase):
+    """
+    Test case for the `v1/api/products/bulk/` endpoint and catalog caching.
+    """
+
+    url = "/v1/api/products/bulk/"
+
+    def setUp(self) -> None:
+        """
+        Sets up a category with two available products.
+        """
+        cache.clear()
+        self.category = Category.objects.create(name="Category 1", slug="category-1")
+        self.first = Product.objects.create(
+            title="First", slug="first", category=self.category, is_available=True
+        )
+        self.second = Product.objects.create(
+            title="Second", slug="second", category=self.category, is_available=True
+        )
+
+    def post(self, payload: Dict[str, Any]) -> HttpResponse:
+        """
+        Posts a JSON payload to the bulk endpoint with the admin bot token.
+        """
+        return self.client.post(
+            self.url,
+            payload,
+            content_type="application/json",
+            headers={"Authorization": "Bearer feed-token"},
+        )
+
+    def test_staff_or_token_required(self) -> None:
+        """
+        Tests that anonymous clients cannot write and staff users can.
+        """
+        payload = {"delete": [self.second.id]}
+        response = self.client.post(self.url, payload, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Product.objects.filter(id=self.second.id).exists())
+
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post(self.url, payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_cascades_and_leaves_tombstones(self) -> None:
+        """
+        Tests that bulk deletes remove order items and record tombstones.
+        """
+        order = Order.objects.create(amount=Decimal("1.00"))
+        OrderItem.objects.create(
+            order=order, product=self.second, price=Decimal("1.00"), quantity=1
+        )
+        with self.assertNumQueries(7):
+            response = self.post({"delete": [self.first.id, self.second.id]})
+        self.assertEqual(response.json()["deleted"], 2)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(
+            sorted(ProductTombstone.objects.values_list("product_id", flat=True)),
+            sorted([self.first.id, self.second.id]),
+        )
+
+    def test_bulk_create_update_delete(self) -> None:
+        """
+        Tests that one request applies creates, partial updates and deletes.
+        """
+        before = Product.objects.get(id=self.first.id).update_at
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(
+                {
+                    "create": [
+                        {
+                            "title": "New One",
+                            "price": "5.00",
+                            "category": self.category.id,
+                        },
+                        {
+                            "title": "New Two",
+                            "slug": "n2",
+                            "category": self.category.id,
+                        },
+                    ],
+                    "update": [{"id": self.first.id, "price": "7.25"}],
+                    "delete": [self.second.id],
+                }
+            )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["created"]), 2)
+        self.assertEqual(data["updated"], [self.first.id])
+        self.assertEqual(data["deleted"], 1)
+
+        self.assertEqual(
+            set(Product.objects.values_list("slug", flat=True)),
+            {"first", "new-one", "n2"},
+        )
+        first = Product.objects.get(id=self.first.id)
+        self.assertEqual(first.price, Decimal("7.25"))
+        self.assertEqual(first.title, "First")
+        self.assertGreater(first.update_at, before)
+
+    def test_invalid_batch_changes_nothing(self) -> None:
+        """
+        Tests that a single invalid row rejects the whole batch.
+        """
+        response = self.post(
+            {
+                "create": [
+                    {"title": "Valid", "category": self.category.id},
+                    {"title": "Taken", "slug": "first", "category": self.category.id},
+                    {"title": "Orphan", "category": 999},
+                ],
+                "delete": [self.second.id],
+            }
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertIn("slug", errors)
+        self.assertIn("category", errors)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_cache_invalidated_once_per_batch(self) -> None:
+        """
+        Tests that cached lists are invalidated by a single version bump.
+        """
+        self.assertEqual(len(self.client.get("/v1/api/products/").json()["results"]), 2)
+        with self.assertNumQueries(0):
+            self.client.get("/v1/api/products/")
+
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post({"delete": [self.first.id, self.second.id]})
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(self.client.get("/v1/api/products/").json()["results"], [])
+
+
+class ProductFilterTest(TestCase):
+    """
+    Test case for filtering and ordering products on `v1/api/products/`.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up a two-level category tree with products of two brands.
+        """
+        cache.clear()
+        self.root = Category.objects.create(name="Phones", slug="phones")
+        child = Category.objects.create(
+            name="Android", slug="android", parent=self.root
+        )
+        other = Category.objects.create(name="Books", slug="books")
+        for index, (category, brand, discount) in enumerate(
+            [
+                (self.root, "acme", 0),
+                (child, "acme", 10),
+                (child, "globex", 0),
+                (other, "acme", 20),
+            ]
+        ):
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                brand=brand,
+                price=Decimal("10.00") * (index + 1),
+                discount=discount,
+                category=category,
+                is_available=True,
+            )
+
+    def test_categories_endpoint(self) -> None:
+        """
+        Tests that categories are listed with their parent and cached until
+        the catalog changes.
+        """
+        response = self.client.get("/v1/api/categories/")
+        self.assertEqual(
+            [(row["slug"], row["parent"]) for row in response.json()],
+            [("android", self.root.id), ("books", None), ("phones", None)],
+        )
+        with self.assertNumQueries(0):
+            self.client.get("/v1/api/categories/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Tablets", slug="tablets")
+        self.assertEqual(len(self.client.get("/v1/api/categories/").json()), 4)
+
+    def titles(self, query: str) -> list:
+        """
+        Returns the product titles listed for a query string.
+        """
+        response = self.client.get(f"/v1/api/products/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in response.json()["results"]]
+
+    def test_filters(self) -> None:
+        """
+        Tests the category subtree, brand, price range and discount filters.
+        """
+        self.assertEqual(
+            sorted(self.titles("category=phones")),
+            ["Product 0", "Product 1", "Product 2"],
+        )
+        self.assertEqual(
+            sorted(self.titles(f"category={self.root.id}&brand=acme")),
+            ["Product 0", "Product 1"],
+        )
+        self.assertEqual(
+            sorted(self.titles("min_price=20&max_price=30")), ["Product 1", "Product 2"]
+        )
+        self.assertEqual(
+            sorted(self.titles("discounted=true")), ["Product 1", "Product 3"]
+        )
+        self.assertEqual(self.titles("category=missing"), [])
+        response = self.client.get("/v1/api/products/?min_price=abc")
+        self.assertEqual(response.status_code, 400)
+
+    def test_ordering_by_price_pages(self) -> None:
+        """
+        Tests that price ordering is honored across cursor pages.
+        """
+        url = "/v1/api/products/?ordering=-price&page_size=3"
+        titles: List[str] = []
+        while url:
+            data = self.client.get(url).json()
+            titles.extend(item["title"] for item in data["results"])
+            url = data["next"]
+        self.assertEqual(titles, ["Product 3", "Product 2", "Product 1", "Product 0"])
+
+    @skipUnless(connection.vendor == "sqlite", "Query plans are read from SQLite.")
+    def test_filter_combinations_use_indexes(self) -> None:
+        """
+        Tests that every filter and ordering combination reads products
+        through an index instead of scanning the table.
+        """
+        filters = [
+            "",
+            "category=phones",
+            "brand=acme",
+            "min_price=5&max_price=25",
+            "discounted=true",
+            "category=android&brand=acme&discounted=true&min_price=5",
+        ]
+        for query in filters:
+            for ordering in ["-create_at", "create_at", "price", "-price"]:
+                with self.subTest(query=query, ordering=ordering):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as captured:
+                        self.client.get(
+                            f"/v1/api/products/?{query}&ordering={ordering}"
+                        )
+                    sql = captured.captured_queries[-1]["sql"]
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                        plan = [row[-1] for row in cursor.fetchall()]
+                    product_steps = [step for step in plan if "shop_product " in step]
+                    self.assertTrue(product_steps, plan)
+                    for step in product_steps:
+                        self.assertIn("USING", step, plan)
+
+
+@override_settings(CATALOG_SYNC_OVERLAP=0)
+class ProductChangesTest(TestCase):
+    """
+    Test case for delta sync through `v1/api/products/changes/`.
+    """
+
+    url = "/v1/api/products/changes/"
+
+    def setUp(self) -> None:
+        """
+        Sets up three available products.
+        """
+        cache.clear()
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        self.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                category=category,
+                is_available=True,
+            )
+            for index in range(3)
+        ]
+
+    def test_initial_sync_returns_catalog(self) -> None:
+        """
+        Tests that a sync without a token returns every available product.
+        """
+        data = self.client.get(f"{self.url}?fields=title").json()
+        self.assertTrue(data["reset"])
+        self.assertEqual(len(data["changed"]), 3)
+        self.assertEqual(set(data["changed"][0]), {"id", "title"})
+        self.assertEqual(data["deleted"], [])
+        self.assertTrue(data["token"])
+
+    def test_delta_contains_only_changes(self) -> None:
+        """
+        Tests that edits, unavailability flips and deletions since the token
+        are returned, and nothing else.
+        """
+        token = self.client.get(self.url).json()["token"]
+        edited, hidden, deleted = self.products
+        deleted_id = deleted.id
+        edited.title = "Renamed"
+        edited.save()
+        hidden.is_available = False
+        hidden.save()
+        deleted.delete()
+
+        data = self.client.get(self.url, {"since": token}).json()
+        self.assertFalse(data["reset"])
+        self.assertEqual([item["title"] for item in data["changed"]], ["Renamed"])
+        self.assertEqual(data["deleted"], sorted([hidden.id, deleted_id]))
+
+        data = self.client.get(self.url, {"since": data["token"]}).json()
+        self.assertEqual((data["changed"], data["deleted"]), ([], []))
+
+    def test_bulk_changes_are_synced(self) -> None:
+        """
+        Tests that changes made through the bulk endpoint reach the delta.
+        """
+        token = self.client.get(self.url).json()["token"]
+        first, second, _ = self.products
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(staff)
+        self.client.post(
+            "/v1/api/products/bulk/",
+            {
+                "update": [{"id": first.id, "is_available": False}],
+                "delete": [second.id],
+            },
+            content_type="application/json",
+        )
+        data = self.client.get(self.url, {"since": token}).json()
+        self.assertEqual(data["deleted"], [first.id, second.id])
+
+    def test_invalid_token(self) -> None:
+        """
+        Tests that a tampered token is rejected.
+        """
+        response = self.client.get(self.url, {"since": "not-a-token"})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == "sqlite", "Query plans are read from SQLite.")
+    def test_delta_uses_index(self) -> None:
+        """
+        Tests that the delta reads changed products in `update_at` order
+        through an index instead of scanning and sorting the table.
+        """
+        token = self.client.get(self.url).json()["token"]
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.url, {"since": token})
+        sql = next(
+            query["sql"]
+            for query in captured.captured_queries
+            if '"update_at" >=' in query["sql"]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertIn("USING INDEX product_updated_idx", " ".join(plan), plan)
+        self.assertFalse([step for step in plan if "TEMP B-TREE" in step], plan)
+
+
+class ORJSONRendererTest(TestCase):
+    """
+    Test case for the orjson renderer and parser used by the API.
+    """
+
+    def test_render_matches_drf_types(self) -> None:
+        """
+        Tests that values orjson does not support natively are converted.
+        """
+        data = {"price": Decimal("1.50"), "items": [1, None], 2: "non-str key"}
+        self.assertEqual(
+            ORJSONRenderer().render(data),
+            b'{"price":1.5,"items":[1,null],"2":"non-str key"}',
+        )
+        self.assertIn(
+            b"\n  ", ORJSONRenderer().render(data, "application/json; indent=4")
+        )
+
+    def test_invalid_json_body(self) -> None:
+        """
+        Tests that a malformed JSON body is rejected with 400.
+        """
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post(
+            "/v1/api/products/bulk/", b"{not json", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON parse error", response.json()["detail"])
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTest(TestCase):
+    """
+    Test case for brotli/gzip compression of API responses.
+    """
+
+    url = "/v1/api/products/"
+
+    def setUp(self) -> None:
+        """
+        Sets up enough products for the list to exceed the size threshold.
+        """
+        cache.clear()
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        for index in range(10):
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                category=category,
+                is_available=True,
+            )
+
+    def test_negotiation(self) -> None:
+        """
+        Tests that brotli is preferred and q=0 refuses an encoding.
+        """
+        self.assertEqual(negotiate_encoding("gzip, deflate, br"), "br")
+        self.assertEqual(negotiate_encoding("gzip, br;q=0"), "gzip")
+        self.assertEqual(negotiate_encoding("*"), "br")
+        self.assertIsNone(negotiate_encoding("identity"))
+        self.assertIsNone(negotiate_encoding(""))
+
+    def test_compressed_bodies_decode(self) -> None:
+        """
+        Tests that br and gzip bodies decode to the uncompressed response.
+        """
+        plain = self.client.get(self.url)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_small_bodies_and_cache(self) -> None:
+        """
+        Tests that small responses are sent as-is and that compressed
+        bodies of cacheable responses are reused.
+        """
+        response = self.client.get(
+            f"{self.url}?fields=id&page_size=1", HTTP_ACCEPT_ENCODING="br"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+        with self.assertNumQueries(1):
+            self.client.get(self.url, HTTP_ACCEPT_ENCODING="br")
+        with mock.patch("test_task_shop.middleware.compress") as compress:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="br")
+        compress.assert_not_called()
+        self.assertEqual(response["Content-Encoding"], "br")
+
+
+@override_settings(
+    THROTTLE_RULES={
+        "cart": {
+            "paths": ["/cart/add/"],
+            "rate": "1/min",
+            "burst": 2,
+            "global_rate": "1/min",
+            "global_burst": 3,
+        }
+    }
+)
+class ThrottleMiddlewareTest(TestCase):
+    """
+    Test case for the per-client and global token-bucket throttles.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up the middleware around a view that always succeeds.
+        """
+        self.factory = RequestFactory()
+        self.middleware = ThrottleMiddleware(lambda request: HttpResponse("ok"))
+
+    def post(self, address: str, path: str = "/cart/add/") -> HttpResponse:
+        request = self.factory.post(path, REMOTE_ADDR=address)
+        request.user = AnonymousUser()
+        return self.middleware(request)
+
+    def test_client_and_global_buckets(self) -> None:
+        """
+        Tests that a client is limited to its burst and all clients together
+        to the global burst, with Retry-After on throttled responses.
+        """
+        self.assertEqual(self.post("10.0.0.1").status_code, 200)
+        self.assertEqual(self.post("10.0.0.1").status_code, 200)
+        response = self.post("10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+
+        # Another client still has its own tokens, until the global bucket runs dry.
+        self.assertEqual(self.post("10.0.0.2").status_code, 200)
+        self.assertEqual(self.post("10.0.0.3").status_code, 429)
+
+    def test_reads_and_other_paths_pass(self) -> None:
+        """
+        Tests that safe methods and unlisted paths are never throttled.
+        """
+        for _ in range(5):
+            self.assertEqual(self.post("10.0.0.1", "/cart/").status_code, 200)
+            request = self.factory.get("/cart/add/", REMOTE_ADDR="10.0.0.1")
+            self.assertEqual(self.middleware(request).status_code, 200)
+
+    async def test_async_requests_are_throttled(self) -> None:
+        """
+        Tests that the async path consults the store off the event loop.
+        """
+
+        async def view(request: HttpRequest) -> HttpResponse:
+            return HttpResponse("ok")
+
+        async def auser() -> AnonymousUser:
+            return AnonymousUser()
+
+        middleware = ThrottleMiddleware(view)
+        statuses = []
+        with mock.patch(
+            "test_task_shop.middleware.sync_to_async", wraps=sync_to_async
+        ) as wrapper:
+            for _ in range(3):
+                request = self.factory.post("/cart/add/", REMOTE_ADDR="10.0.0.1")
+                request.auser = auser
+                statuses.append((await middleware(request)).status_code)
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(wrapper.call_count, 3)
+
+
+@override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=10)
+class LoadSheddingMiddlewareTest(TestCase):
+    """
+    Test case for priority-based load shedding.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up the middleware with 7 of 10 request slots taken.
+        """
+        self.factory = RequestFactory()
+        self.middleware = LoadSheddingMiddleware(lambda request: HttpResponse("ok"))
+        self.middleware.in_flight = 7
+
+    def test_writes_shed_before_reads(self) -> None:
+        """
+        Tests that cart writes are shed while catalog reads and webhooks
+        are still served, and that finished requests are counted out.
+        """
+        response = self.middleware(self.factory.post("/cart/add/"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+        self.assertEqual(
+            self.middleware(self.factory.get("/v1/api/products/")).status_code, 200
+        )
+        self.assertEqual(self.middleware.in_flight, 7)
+
+        self.middleware.in_flight = 10
+        self.assertEqual(self.middleware(self.factory.get("/")).status_code, 503)
+        response = self.middleware(self.factory.post("/payment/webhook-stripe/"))
+        self.assertEqual(response.status_code, 200)
+        response = self.middleware(self.factory.get("/v1/api/orders/1/status/"))
+        self.assertEqual(response.status_code, 200)
+
+
+class OrderStatusTest(TestCase):
+    """
+    Test case for the order status long-poll and server-sent events.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up an unpaid anonymous order and its signed status URL.
+        """
+        self.order = Order.objects.create(amount=Decimal("20.00"))
+        request = RequestFactory().get("/")
+        url = urlsplit(OrderStatusView.url_for(request, self.order.id))
+        self.url = url.path
+        self.token = dict(parse_qsl(url.query))
+
+    def pay(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.mark_paid([self.order.id])
+
+    async def test_long_poll_wakes_on_payment(self) -> None:
+        """
+        Tests that a waiting request is answered as soon as the order is paid.
+        """
+        request = asyncio.ensure_future(
+            self.async_client.get(self.url, {"wait": 5, **self.token})
+        )
+        await asyncio.sleep(0.1)
+        self.assertFalse(request.done())
+
+        await sync_to_async(self.pay)()
+        response = await asyncio.wait_for(request, 1)
+        self.assertEqual(response.json(), {"id": self.order.id, "is_paid": True})
+
+    async def test_long_poll_timeout_and_paid_order(self) -> None:
+        """
+        Tests that an unpaid order is reported after `wait` and a paid order
+        at once.
+        """
+        response = await self.async_client.get(self.url, {"wait": "0.05", **self.token})
+        self.assertEqual(response.json(), {"id": self.order.id, "is_paid": False})
+
+        await sync_to_async(self.pay)()
+        response = await asyncio.wait_for(
+            self.async_client.get(self.url, self.token), 1
+        )
+        self.assertTrue(response.json()["is_paid"])
+
+    async def test_event_stream(self) -> None:
+        """
+        Tests that the stream sends the current status, then the payment, and
+        ends.
+        """
+        response = await self.async_client.get(
+            self.url, self.token, headers={"Accept": "text/event-stream"}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = aiter(response.streaming_content)
+        self.assertTrue((await anext(events)).startswith(b"retry:"))
+        self.assertIn(b'"is_paid":false', await anext(events))
+
+        await sync_to_async(self.pay)()
+        self.assertIn(b'"is_paid":true', await asyncio.wait_for(anext(events), 1))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    def test_other_users_order_is_hidden(self) -> None:
+        """
+        Tests that orders placed by a user are not shown to anybody else.
+        """
+        self.order.user = User.objects.create_user(username="owner")
+        self.order.save()
+        self.assertEqual(self.client.get(self.url, self.token).status_code, 404)
+        self.assertEqual(self.client.get("/v1/api/orders/0/status/").status_code, 404)
+
+    def test_token_required(self) -> None:
+        """
+        Tests that the status is only shown with the token of that order.
+        """
+        response = self.client.get(self.url, {"wait": 0, **self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        other = f"/v1/api/orders/{Order.objects.create(amount=1).id}/status/"
+        self.assertEqual(self.client.get(other, self.token).status_code, 404)
+        self.assertEqual(self.client.get(other, {"token": "forged"}).status_code, 404)
+
+
+@override_settings(ORDER_FEED_TOKEN="feed-token")
+class PaidOrderFeedTest(TestCase):
+    """
+    Test case for the paid-order outbox on `v1/api/paid-orders/`.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up two orders with a shipping address and an item each.
+        """
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        product = Product.objects.create(
+            title="Product 1",
+            slug="product-1",
+            price=Decimal("10.00"),
+            category=category,
+        )
+        address = ShippingAddress.objects.create(
+            full_name="Buyer",
+            email="buyer@example.com",
+            street_address="Street 1",
+            apartment_address="1",
+        )
+        self.orders = []
+        for quantity in (1, 2):
+            order = Order.objects.create(
+                amount=Decimal("10.00") * quantity,
+                shipping_address=address,
+                payment_provider=Order.STRIPE,
+            )
+            OrderItem.objects.create(
+                order=order, product=product, price=Decimal("10.00"), quantity=quantity
+            )
+            self.orders.append(order)
+        self.auth = {"Authorization": "Bearer feed-token"}
+
+    def test_payment_writes_one_event(self) -> None:
+        """
+        Tests that an event is written when an order is paid, and only once.
+        """
+        Order.mark_paid([self.orders[0].id])
+        Order.mark_paid([self.orders[0].id])
+        self.assertEqual(
+            list(PaidOrderEvent.objects.values_list("order_id", flat=True)),
+            [self.orders[0].id],
+        )
+
+    def test_list_and_ack(self) -> None:
+        """
+        Tests that events are listed with an order summary until acknowledged.
+        """
+        Order.mark_paid([order.id for order in self.orders])
+        response = self.client.get("/v1/api/paid-orders/", headers=self.auth)
+        events = response.json()
+        self.assertEqual(len(events), 2)
+        first = events[0]
+        quantity = 1 if first["order"] == self.orders[0].id else 2
+        self.assertEqual(first["amount"], f"{10 * quantity}.00")
+        self.assertEqual(first["email"], "buyer@example.com")
+        self.assertEqual(first["payment_provider"], "stripe")
+        self.assertEqual(
+            first["items"],
+            [{"title": "Product 1", "price": "10.00", "quantity": quantity}],
+        )
+
+        after = self.client.get(
+            "/v1/api/paid-orders/", {"after": first["id"]}, headers=self.auth
+        )
+        self.assertEqual(len(after.json()), 1)
+
+        response = self.client.post(
+            "/v1/api/paid-orders/ack/",
+            {"ids": [first["id"]]},
+            content_type="application/json",
+            headers=self.auth,
+        )
+        self.assertEqual(response.json(), {"acknowledged": 1})
+        remaining = self.client.get("/v1/api/paid-orders/", headers=self.auth)
+        self.assertEqual([event["id"] for event in remaining.json()], [events[1]["id"]])
+
+    def test_token_required(self) -> None:
+        """
+        Tests that the feed is closed without the token, or when none is set.
+        """
+        self.assertEqual(self.client.get("/v1/api/paid-orders/").status_code, 403)
+        wrong = {"Authorization": "Bearer wrong"}
+        response = self.client.get("/v1/api/paid-orders/", headers=wrong)
+        self.assertEqual(response.status_code, 403)
+        with override_settings(ORDER_FEED_TOKEN=""):
+            response = self.client.get("/v1/api/paid-orders/", headers=self.auth)
+            self.assertEqual(response.status_code, 403)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRouterTest(SimpleTestCase):
+    """
+    Test case for routing catalog reads to read replicas.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up the router and a middleware recording where reads went.
+        """
+        self.router = ReplicaRouter()
+        self.reads: List[Optional[str]] = []
+
+        def view(request: HttpRequest) -> HttpResponse:
+            self.reads.append(self.router.db_for_read(Product))
+            if request.method == "POST":
+                self.router.db_for_write(Product)
+                self.reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+
+    def test_catalog_reads_use_replicas(self) -> None:
+        """
+        Tests that only catalog reads inside a request block use a replica.
+        """
+        self.assertEqual(self.router.db_for_read(Product), "default")
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Product), "replica_1")
+            self.assertEqual(self.router.db_for_read(Category), "replica_1")
+            self.assertEqual(self.router.db_for_read(Order), "default")
+        with replica_reads(pinned=True):
+            self.assertEqual(self.router.db_for_read(Product), "default")
+        with override_settings(DATABASE_REPLICAS=[]), replica_reads():
+            self.assertEqual(self.router.db_for_read(Product), "default")
+
+    def test_reads_after_a_write_use_the_primary(self) -> None:
+        """
+        Tests that a write pins the rest of the request and the client's next
+        requests to the primary.
+        """
+        response = self.middleware(RequestFactory().post("/v1/api/products/"))
+        self.assertEqual(self.reads, ["replica_1", "default"])
+        cookie = response.cookies["read_primary"]
+        self.assertEqual(cookie["max-age"], 5)
+
+        request = RequestFactory().get("/")
+        request.COOKIES["read_primary"] = cookie.value
+        response = self.middleware(request)
+        self.assertEqual(self.reads[-1], "default")
+        self.assertNotIn("read_primary", response.cookies)
+
+        self.middleware(RequestFactory().get("/"))
+        self.assertEqual(self.reads[-1], "replica_1")
@@ -1,13 +1,22 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CompleteOrderAPIView, ProductViewSet
+from .views import (
+    CategoryViewSet,
+    CompleteOrderAPIView,
+    OrderStatusView,
+    PaidOrderEventViewSet,
+    ProductViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"products", ProductViewSet)
+router.register(r"categories", CategoryViewSet)
+router.register(r"paid-orders", PaidOrderEventViewSet, basename="paid-order")
 
 
 urlpatterns = [
     path("", include(router.urls)),
     path("checkout/", CompleteOrderAPIView.as_view()),
+    path("orders/<int:pk>/status/", OrderStatusView.as_view(), name="order-status"),
 ]
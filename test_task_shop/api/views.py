@@ -1,36 +1,350 @@
+import time
 from decimal import Decimal
+from io import BytesIO
+from typing import Any, AsyncIterator, Dict, List, Optional
 
+import orjson
 import stripe
-import requests
-
+from api.filters import ProductFilterBackend, ProductOrderingFilter
+from api.pagination import ProductCursorPagination
+from api.permissions import HasOrderFeedToken
+from api.renderers import ORJSONParser
 from api.serializers import (
     CartItemSerializer,
+    CategorySerializer,
+    FastProductSerializer,
+    PaidOrderEventSerializer,
+    ProductBulkSerializer,
     ProductSerializer,
     ShippingAddressSerializer,
 )
+from api.sync import InvalidSyncToken, catalog_changes, read_sync_token
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import HttpRequest
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from payment.models import Order, OrderItem, ShippingAddress
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from payment.events import OrderStatus, get_broker
+from payment.idempotency import idempotent
+from payment.models import Order, OrderItem, PaidOrderEvent, ShippingAddress
+from payment.simpleswap import QuoteValidationError, SimpleSwapError, get_quote_service
 from rest_framework import status, viewsets
-from rest_framework.permissions import AllowAny
+from rest_framework.authentication import CSRFCheck
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.views import APIView
-from shop.models import Product
+from shop.catalog_cache import (
+    batched_invalidation,
+    bump_catalog_version,
+    get_cached,
+    set_cached,
+)
+from shop.models import Category, Product, ProductTombstone
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.available.all()
+    """
+    CRUD endpoints for available products.
+
+    Lists are cursor-paginated (`?page_size=` picks the page size) and accept
+    `?fields=` to return only the listed fields. They can be filtered with
+    `category`, `brand`, `min_price`, `max_price` and `discounted`, and
+    ordered with `?ordering=price` or `-price`, `create_at`, `-create_at`.
+    Reads are served from `values()` rows by `FastProductSerializer` and
+    cached per URL until the catalog changes; writes use `ProductSerializer`,
+    or `bulk/` for batches.
+    """
+
+    queryset = Product.available.select_related("category")
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductFilterBackend, ProductOrderingFilter]
+    ordering_fields = ["price", "create_at"]
+    ordering = ("-create_at", "-id")
+
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        List products through the `values()` based fast serializer.
+        """
+        cached = get_cached("products", request.build_absolute_uri())
+        if cached is not None:
+            return Response(cached)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = FastProductSerializer(request)
+        columns = set(serializer.value_names)
+        if self.paginator is not None:
+            # Cursor pagination reads its position from the ordering fields.
+            ordering = self.paginator.get_ordering(request, queryset, self)
+            columns.update(field.lstrip("-") for field in ordering)
+        rows = queryset.values(*columns)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            response = self.get_paginated_response(serializer.serialize_many(page))
+        else:
+            response = Response(serializer.serialize_many(rows))
+        set_cached(response.data, "products", request.build_absolute_uri())
+        return response
+
+    def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        Retrieve a product through the `values()` based fast serializer.
+        """
+        cached = get_cached("product", request.build_absolute_uri())
+        if cached is not None:
+            return Response(cached)
+
+        serializer = FastProductSerializer(request)
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            row = (
+                self.filter_queryset(self.get_queryset())
+                .filter(**lookup)
+                .values(*serializer.value_names)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if row is None:
+            raise Http404
+        data = serializer.to_representation(row)
+        set_cached(data, "product", request.build_absolute_uri())
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk",
+        permission_classes=[IsAdminUser | HasOrderFeedToken],
+    )
+    def bulk(self, request: Request) -> Response:
+        """
+        Create, update and delete many products in one transaction.
+
+        The payload holds optional `create` (product objects), `update`
+        (partial product objects with an `id`) and `delete` (product ids)
+        lists. The whole batch is validated first and applied with one query
+        per operation, so either every change is saved or none is. Only staff
+        and clients holding the `ORDER_FEED_TOKEN` (the admin bot) may write.
+        """
+        serializer = ProductBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        with batched_invalidation(), transaction.atomic():
+            created = Product.objects.bulk_create(
+                Product(**self._product_values(item)) for item in data["create"]
+            )
+
+            changes = {
+                item["id"]: self._product_values(item) for item in data["update"]
+            }
+            updated = list(Product.objects.in_bulk(list(changes)).values())
+            update_fields = {"update_at"}
+            now = timezone.now()
+            for product in updated:
+                for name, value in changes[product.id].items():
+                    setattr(product, name, value)
+                    update_fields.add(name)
+                product.update_at = now
+            update_fields.discard("id")
+            if updated:
+                Product.objects.bulk_update(updated, sorted(update_fields))
+
+            deleted = 0
+            if data["delete"]:
+                # A queryset delete would load every product to fire the
+                # per-row signals, so cascade, delete and tombstone in bulk.
+                ids = list(
+                    Product.objects.filter(id__in=data["delete"]).values_list(
+                        "id", flat=True
+                    )
+                )
+                OrderItem.objects.filter(product_id__in=ids).delete()
+                products = Product.objects.filter(id__in=ids)
+                deleted = products._raw_delete(products.db)
+                ProductTombstone.objects.bulk_create(
+                    ProductTombstone(product_id=product_id) for product_id in ids
+                )
+
+            # None of the writes above send model signals, so invalidate once.
+            bump_catalog_version()
+
+        return Response(
+            {
+                "created": [product.id for product in created],
+                "updated": sorted(changes),
+                "deleted": deleted,
+            }
+        )
+
+    @action(detail=False, methods=["get"], url_path="changes")
+    def changes(self, request: Request) -> Response:
+        """
+        Return the products changed and removed since `?since=<token>`.
+
+        Pass the `token` from the previous response as `since`; without it the
+        whole catalog is returned. `?fields=` works as in the list, and the
+        id is always included so mirrors can apply the changes.
+        """
+        fields = None
+        requested = request.query_params.get("fields")
+        if requested:
+            fields = {"id", *(name.strip() for name in requested.split(","))}
+        serializer = FastProductSerializer(request, fields=fields)
+
+        since = None
+        token = request.query_params.get("since")
+        if token:
+            try:
+                since = read_sync_token(token)
+            except InvalidSyncToken:
+                return Response(
+                    {"since": ["Invalid sync token."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        return Response(catalog_changes(serializer, since))
+
+    @staticmethod
+    def _product_values(item: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map validated bulk row data onto `Product` constructor arguments.
+        """
+        values = dict(item)
+        if "category" in values:
+            values["category_id"] = values.pop("category")
+        return values
+
+
+class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only list of all categories, with `parent` linking the tree.
+
+    The list is small and changes rarely, so it is returned unpaginated and
+    cached until the catalog changes.
+    """
+
+    queryset = Category.objects.order_by("name", "id")
+    serializer_class = CategorySerializer
+    permission_classes = [AllowAny]
+    pagination_class = None
+
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        List categories from the catalog cache.
+        """
+        cached = get_cached("categories", request.build_absolute_uri())
+        if cached is not None:
+            return Response(cached)
+        data = self.get_serializer(self.get_queryset(), many=True).data
+        set_cached(data, "categories", request.build_absolute_uri())
+        return Response(data)
+
+
+class PaidOrderEventViewSet(viewsets.GenericViewSet):
+    """
+    Outbox of paid orders the admin bot has not announced yet.
+
+    The bot lists events oldest first (`?after=<event id>` skips the ones it
+    already holds, `?limit=` caps the batch) and acknowledges them with
+    `POST ack/` once its digest is delivered, which deletes them. Events
+    stay listed until acknowledged, so a bot restarting before it sends a
+    digest finds them again. Requires the `ORDER_FEED_TOKEN` bearer token.
+    """
+
+    queryset = PaidOrderEvent.objects.select_related(
+        "order__shipping_address"
+    ).prefetch_related("order__items__product")
+    serializer_class = PaidOrderEventSerializer
+    authentication_classes: List[Any] = []
+    permission_classes = [HasOrderFeedToken]
+    pagination_class = None
+
+    def list(self, request: Request) -> Response:
+        """
+        List unacknowledged events after `?after=`, at most `?limit=`.
+        """
+        try:
+            after = int(request.query_params.get("after", 0))
+            limit = int(request.query_params.get("limit", 100))
+        except ValueError:
+            return Response(
+                {"detail": "after and limit must be integers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, settings.ORDER_FEED_MAX_BATCH))
+        events = self.get_queryset().filter(id__gt=after)[:limit]
+        return Response(self.get_serializer(events, many=True).data)
+
+    @action(detail=False, methods=["post"], url_path="ack")
+    def ack(self, request: Request) -> Response:
+        """
+        Delete the events listed in `ids`; unknown ids are ignored.
+        """
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(
+            isinstance(event_id, int) for event_id in ids
+        ):
+            return Response(
+                {"ids": ["Expected a list of event ids."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        deleted, _ = PaidOrderEvent.objects.filter(id__in=ids).delete()
+        return Response({"acknowledged": deleted})
+
 
+def _enforce_csrf(request: HttpRequest) -> Optional[HttpResponse]:
+    """
+    Run Django's CSRF check, returning the rejection response if it fails.
 
-class CompleteOrderAPIView(APIView):
+    Like DRF's session authentication, it is only applied to logged-in users;
+    anonymous API clients such as the Telegram bot send no CSRF token.
+    """
+    check = CSRFCheck(lambda request: HttpResponse())
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
 
-    def post(self, request: HttpRequest) -> Response:
+
+class CompleteOrderAPIView(View):
+    """
+    Asynchronous checkout endpoint for API clients.
+
+    DRF views cannot run asynchronously, so this is a plain Django view that
+    validates with the DRF serializers. Stripe and SimpleSwap are called
+    through their async clients, and only the database writes run in a worker
+    thread, so a checkout waiting on a provider does not hold a thread.
+    """
+
+    http_method_names = ["post"]
+
+    @classmethod
+    def as_view(cls, **initkwargs: Any) -> Any:
+        """
+        Exempt the view from the CSRF middleware and make it idempotent.
+        """
+        return csrf_exempt(idempotent(super().as_view(**initkwargs)))
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
         """
         Handle the POST request to create an order.
         This method:
@@ -39,24 +353,32 @@ class CompleteOrderAPIView(APIView):
         - Calculates the total order price based on cart items.
         - Creates an `Order` with associated `OrderItem`s.
         - Initiates a Stripe checkout session for payment.
+
+        Retries carrying the same `Idempotency-Key` header get the stored
+        response of the first request.
         """
-        api_key = settings.SIMPLE_SWAP
-        btc_address = settings.BTC_ADDRESS
-        url = "https://api.simpleswap.io/create_exchange"
+        user = await request.auser()
+        if user.is_authenticated:
+            rejected = _enforce_csrf(request)
+            if rejected is not None:
+                return rejected
 
-        params = {
-            "api_key": api_key,
-        }
+        try:
+            data = ORJSONParser().parse(BytesIO(request.body or b"{}"))
+        except ParseError as e:
+            return JsonResponse({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            data = {}
 
         shipping_serializer = ShippingAddressSerializer(
-            data=request.data.get("shipping_address")
-        )
-        cart_serializer = CartItemSerializer(
-            data=request.data.get("cart_items"), many=True
+            data=data.get("shipping_address")
         )
+        cart_serializer = CartItemSerializer(data=data.get("cart_items"), many=True)
 
-        if not shipping_serializer.is_valid() or not cart_serializer.is_valid():
-            return Response(
+        shipping_valid = await sync_to_async(shipping_serializer.is_valid)()
+        cart_valid = cart_serializer.is_valid()
+        if not shipping_valid or not cart_valid:
+            return JsonResponse(
                 {
                     "shipping_errors": shipping_serializer.errors,
                     "cart_errors": cart_serializer.errors,
@@ -64,21 +386,31 @@ class CompleteOrderAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Create ShippingAddress object
-        shipping_data = shipping_serializer.validated_data
-        shipping_address = ShippingAddress.objects.create(**shipping_data)
-        user = request.user if request.user.is_authenticated else None
-        shipping_address.user = user
-        shipping_address.save()
-
         # Calculate total order price
         cart_data = cart_serializer.validated_data
         total_price = sum(item["price"] * item["quantity"] for item in cart_data)
 
-        # Create Order object
-        order = Order.objects.create(
-            user=user, shipping_address=shipping_address, amount=total_price
-        )
+        # Check the amount against the cached exchange quote before any writes
+        quote_service = get_quote_service()
+        try:
+            await quote_service.avalidate_amount(total_price)
+        except QuoteValidationError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except SimpleSwapError as e:
+            return JsonResponse({"error": str(e)}, status=e.status_code)
+
+        try:
+            order = await sync_to_async(self._create_order)(
+                shipping_serializer.validated_data,
+                user if user.is_authenticated else None,
+                cart_data,
+                total_price,
+            )
+        except Http404:
+            return JsonResponse(
+                {"detail": "No Product matches the given query."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
 
         # Prepare data for Stripe session
         session_data = {
@@ -90,27 +422,7 @@ class CompleteOrderAPIView(APIView):
             "line_items": [],
             "client_reference_id": order.id,
         }
-        data = {
-            "fixed": False,
-            "currency_from": "usd",
-            "currency_to": "btc",
-            "amount": float(total_price),
-            "address_to": btc_address,
-            "extra_id_to": "",
-            "user_refund_address": "",
-            "user_refund_extra_id": "",
-        }
-        # Create OrderItems and Stripe line items
         for item in cart_data:
-            product = get_object_or_404(Product, title=item["product_name"])
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                price=item["price"],
-                quantity=item["quantity"],
-                user=user,
-            )
-
             session_data["line_items"].append(
                 {
                     "price_data": {
@@ -126,18 +438,182 @@ class CompleteOrderAPIView(APIView):
                 }
             )
         try:
-            session = stripe.checkout.Session.create(**session_data)
-            response = requests.post(url, json=data, params=params)
-            if response.status_code == 200:
-                exchange_data = response.json()
-                redirect_url = exchange_data.get("redirect_url")
-            else:
-                return Response(
-                    {"error": "Failed to create exchange on SimpleSwap"}, status=500
-                )
+            session = await stripe.checkout.Session.create_async(**session_data)
+            await Order.objects.filter(id=order.id).aupdate(
+                payment_provider=Order.STRIPE, payment_reference=session.id
+            )
+            exchange_data = await quote_service.acreate_exchange(
+                total_price, settings.BTC_ADDRESS
+            )
+            redirect_url = exchange_data.get("redirect_url")
+        except SimpleSwapError:
+            return JsonResponse(
+                {"error": "Failed to create exchange on SimpleSwap"}, status=500
+            )
         except (Exception, stripe.error.StripeError) as e:
-            return Response({"error": str(e)}, status=500)
-        return Response(
-            {"checkout_url": session.url, "api_test_url": redirect_url},
+            return JsonResponse({"error": str(e)}, status=500)
+        return JsonResponse(
+            {
+                "checkout_url": session.url,
+                "api_test_url": redirect_url,
+                "order_id": order.id,
+                "status_url": OrderStatusView.url_for(request, order.id),
+            },
             status=status.HTTP_201_CREATED,
         )
+
+    @staticmethod
+    def _create_order(
+        shipping_data: Dict[str, Any],
+        user: Optional[User],
+        cart_data: List[Dict[str, Any]],
+        total_price: Decimal,
+    ) -> Order:
+        """
+        Create the shipping address, order and order items in one transaction.
+        """
+        with transaction.atomic():
+            shipping_address = ShippingAddress.objects.create(
+                **shipping_data, user=user
+            )
+            order = Order.objects.create(
+                user=user, shipping_address=shipping_address, amount=total_price
+            )
+            for item in cart_data:
+                product = get_object_or_404(Product, title=item["product_name"])
+                OrderItem.objects.create(
+                    order=order,
+                    product=product,
+                    price=item["price"],
+                    quantity=item["quantity"],
+                    user=user,
+                )
+        return order
+
+
+class OrderStatusView(View):
+    """
+    Pushes the payment status of an order to a waiting client.
+
+    With `Accept: text/event-stream` the status is streamed as server-sent
+    events: the current status first, then every change, until the order is
+    paid or `ORDER_STATUS_STREAM_TIMEOUT` passes. Other requests long-poll:
+    an unpaid order is answered when it is paid or after `?wait=` seconds
+    (at most `ORDER_STATUS_LONG_POLL_TIMEOUT`), whichever comes first.
+
+    The database is read once per request; waiting clients are woken by the
+    order event broker, so they cost no polling. Order ids are sequential,
+    so the URL handed out at checkout carries a signed `?token=` without
+    which the order is not found; orders placed by a user are moreover only
+    visible to that user.
+    """
+
+    http_method_names = ["get"]
+    token_salt = "api.orders.status"
+
+    @classmethod
+    def url_for(cls, request: HttpRequest, order_id: int) -> str:
+        """
+        Build the absolute, signed status URL of an order.
+        """
+        token = signing.dumps(order_id, salt=cls.token_salt)
+        url = reverse("order-status", args=[order_id])
+        return request.build_absolute_uri(f"{url}?{urlencode({'token': token})}")
+
+    @classmethod
+    def has_token(cls, request: HttpRequest, pk: int) -> bool:
+        """
+        Check that the request carries the status token of the order.
+        """
+        try:
+            return (
+                signing.loads(request.GET.get("token", ""), salt=cls.token_salt) == pk
+            )
+        except signing.BadSignature:
+            return False
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        """
+        Answer with the order status, waiting for payment if necessary.
+        """
+        if not self.has_token(request, pk):
+            return self._not_found()
+        if "text/event-stream" in request.headers.get("Accept", ""):
+            if await self._read_status(request, pk) is None:
+                return self._not_found()
+            response = StreamingHttpResponse(
+                self._stream(pk), content_type="text/event-stream"
+            )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
+
+        # Subscribe before reading, so a payment in between is not missed.
+        async with get_broker().subscribe(pk) as subscription:
+            current = await self._read_status(request, pk)
+            if current is None:
+                return self._not_found()
+            if not current["is_paid"]:
+                current = await subscription.get(self._wait(request)) or current
+        return JsonResponse(current)
+
+    @staticmethod
+    def _not_found() -> HttpResponse:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    @staticmethod
+    def _wait(request: HttpRequest) -> float:
+        """
+        Return the long-poll timeout requested with `?wait=`, within limits.
+        """
+        limit = settings.ORDER_STATUS_LONG_POLL_TIMEOUT
+        try:
+            wait = float(request.GET.get("wait", limit))
+        except ValueError:
+            wait = limit
+        return min(max(wait, 0), limit)
+
+    @staticmethod
+    async def _read_status(request: HttpRequest, pk: int) -> Optional[OrderStatus]:
+        """
+        Read the order status, or None if the order is not visible.
+        """
+        order = (
+            await Order.objects.filter(pk=pk)
+            .values("id", "is_paid", "user_id")
+            .afirst()
+        )
+        if order is None:
+            return None
+        if order["user_id"] is not None:
+            user = await request.auser()
+            if user.pk != order["user_id"]:
+                return None
+        return {"id": order["id"], "is_paid": order["is_paid"]}
+
+    @staticmethod
+    async def _stream(pk: int) -> AsyncIterator[bytes]:
+        """
+        Yield server-sent events until the order is paid or the stream expires.
+
+        Comment lines are sent while idle so proxies keep the connection open.
+        """
+        async with get_broker().subscribe(pk) as subscription:
+            # Read again now that the subscription is live.
+            is_paid = await Order.objects.filter(pk=pk, is_paid=True).aexists()
+            current: OrderStatus = {"id": pk, "is_paid": is_paid}
+            yield b"retry: %d\n" % (settings.ORDER_STATUS_SSE_RETRY * 1000)
+            yield b"event: status\ndata: " + orjson.dumps(current) + b"\n\n"
+            deadline = time.monotonic() + settings.ORDER_STATUS_STREAM_TIMEOUT
+            while not current["is_paid"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = await subscription.get(
+                    min(remaining, settings.ORDER_STATUS_KEEPALIVE)
+                )
+                if event is None:
+                    yield b": keepalive\n\n"
+                    continue
+                current = event
+                yield b"event: status\ndata: " + orjson.dumps(current) + b"\n\n"
@@ -69,6 +69,7 @@ class OrderAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         "is_paid",
+        "payment_provider",
         "updated",
         "created",
     ]
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional, Protocol, Set
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+OrderStatus = Dict[str, Any]
+Deliver = Callable[[int, OrderStatus], None]
+
+
+class OrderEventBackend(Protocol):
+    """
+    Carries order status events to the brokers of every process.
+
+    A backend is created with the `deliver` callback of its process' broker
+    and must call it for every event published by any process, including
+    its own.
+    """
+
+    def publish(self, order_id: int, status: OrderStatus) -> None:
+        """
+        Send the status event to all processes.
+        """
+        ...
+
+
+class LocalOrderEventBackend:
+    """
+    Delivers events to subscribers of the current process only.
+
+    Enough for a single ASGI worker; with several workers, configure a
+    backend that forwards events between them, e.g. over Redis pub/sub.
+    """
+
+    def __init__(self, deliver: Deliver) -> None:
+        self.deliver = deliver
+
+    def publish(self, order_id: int, status: OrderStatus) -> None:
+        self.deliver(order_id, status)
+
+
+class Subscription:
+    """
+    Status events of one order for one waiting client.
+
+    Events may be published from any thread; they are handed over to the
+    event loop that created the subscription.
+    """
+
+    def __init__(self, broker: "OrderStatusBroker", order_id: int) -> None:
+        self.broker = broker
+        self.order_id = order_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[OrderStatus]" = asyncio.Queue()
+
+    async def __aenter__(self) -> "Subscription":
+        self.broker.add(self)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.broker.remove(self)
+
+    def push(self, status: OrderStatus) -> None:
+        """
+        Queue an event; safe to call from any thread.
+        """
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, status)
+        except RuntimeError:
+            # The subscriber's loop is already closed.
+            self.broker.remove(self)
+
+    async def get(self, timeout: float) -> Optional[OrderStatus]:
+        """
+        Wait up to `timeout` seconds for the next event.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class OrderStatusBroker:
+    """
+    In-process pub/sub of order status changes.
+
+    Waiting clients subscribe by order id, so a published event wakes only
+    the clients of that order and waiting costs no database queries.
+    Events go out through the configured `OrderEventBackend` and come back
+    through `deliver`.
+    """
+
+    def __init__(self, backend: Callable[[Deliver], OrderEventBackend]) -> None:
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.backend = backend(self.deliver)
+
+    def subscribe(self, order_id: int) -> Subscription:
+        """
+        Return a subscription to use as `async with` around the wait.
+        """
+        return Subscription(self, order_id)
+
+    def add(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers[subscription.order_id].add(subscription)
+
+    def remove(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.order_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.order_id]
+
+    def publish(self, order_id: int, status: OrderStatus) -> None:
+        """
+        Publish a status event to subscribers in every process.
+        """
+        self.backend.publish(order_id, status)
+
+    def deliver(self, order_id: int, status: OrderStatus) -> None:
+        """
+        Hand an event to the subscribers of this process.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(order_id, ()))
+        for subscription in subscribers:
+            subscription.push(status)
+
+
+@lru_cache(maxsize=None)
+def get_broker() -> OrderStatusBroker:
+    """
+    Return the process-wide broker using `ORDER_EVENTS_BACKEND`.
+    """
+    return OrderStatusBroker(import_string(settings.ORDER_EVENTS_BACKEND))
+
+
+def publish_paid(order_ids: Iterable[int]) -> None:
+    """
+    Tell the subscribers of the given orders that they have been paid.
+    """
+    broker = get_broker()
+    for order_id in order_ids:
+        broker.publish(order_id, {"id": order_id, "is_paid": True})
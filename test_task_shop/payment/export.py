@@ -0,0 +1,181 @@
+import csv
+import datetime
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.utils import timezone
+from payment.models import Order, OrderItem
+from test_task_shop.db_router import replica_alias
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+ORDER_FIELDS = [
+    "id",
+    "created",
+    "updated",
+    "is_paid",
+    "amount",
+    "discount",
+    "user_id",
+]
+SHIPPING_FIELDS = [
+    "full_name",
+    "email",
+    "street_address",
+    "apartment_address",
+    "city",
+    "country",
+    "zip",
+]
+ITEM_FIELDS = ["id", "product_id", "product__title", "price", "quantity"]
+
+CSV_COLUMNS = (
+    [f"order_{name}" for name in ORDER_FIELDS]
+    + [f"shipping_{name}" for name in SHIPPING_FIELDS]
+    + [
+        "item_id",
+        "item_product_id",
+        "item_product_title",
+        "item_price",
+        "item_quantity",
+    ]
+)
+
+
+class _Echo:
+    """
+    File-like object whose `write` returns the value instead of buffering it.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def filter_orders(
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    is_paid: Optional[bool] = None,
+) -> QuerySet[Order]:
+    """
+    Build the export queryset for the given creation dates and paid status.
+
+    Both dates are inclusive and interpreted in the current time zone.
+    Exports are read from a replica when there is one.
+    """
+    queryset = Order.objects.using(replica_alias())
+    if date_from is not None:
+        start = datetime.datetime.combine(date_from, datetime.time.min)
+        queryset = queryset.filter(created__gte=timezone.make_aware(start))
+    if date_to is not None:
+        end = datetime.datetime.combine(
+            date_to + datetime.timedelta(days=1), datetime.time.min
+        )
+        queryset = queryset.filter(created__lt=timezone.make_aware(end))
+    if is_paid is not None:
+        queryset = queryset.filter(is_paid=is_paid)
+    return queryset
+
+
+def iter_orders(
+    queryset: QuerySet[Order], chunk_size: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield orders with their shipping address and items as plain dicts.
+
+    Orders are read in pages of `chunk_size` using keyset pagination over
+    `Order.id`, and each page's items are streamed with a single query, so
+    memory use stays constant regardless of how many orders are exported.
+    """
+    order_values = ORDER_FIELDS + [
+        f"shipping_address__{name}" for name in SHIPPING_FIELDS
+    ]
+    queryset = queryset.order_by("id").values(*order_values)
+    last_id = 0
+
+    while True:
+        orders = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not orders:
+            return
+
+        items: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        order_items = (
+            OrderItem.objects.using(queryset.db)
+            .filter(order_id__in=[order["id"] for order in orders])
+            .order_by("order_id", "id")
+            .values("order_id", *ITEM_FIELDS)
+        )
+        for item in order_items.iterator(chunk_size=chunk_size):
+            items[item.pop("order_id")].append(
+                {
+                    "id": item["id"],
+                    "product_id": item["product_id"],
+                    "product_title": item["product__title"],
+                    "price": item["price"],
+                    "quantity": item["quantity"],
+                }
+            )
+
+        for order in orders:
+            yield {
+                **{name: order[name] for name in ORDER_FIELDS},
+                "shipping_address": {
+                    name: order[f"shipping_address__{name}"] for name in SHIPPING_FIELDS
+                },
+                "items": items.pop(order["id"], []),
+            }
+        last_id = orders[-1]["id"]
+
+
+def iter_csv(orders: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Render orders as CSV lines with one row per order item.
+
+    Orders without items are written as a single row with empty item columns.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for order in orders:
+        order_row = [order[name] for name in ORDER_FIELDS] + [
+            order["shipping_address"][name] for name in SHIPPING_FIELDS
+        ]
+        if not order["items"]:
+            yield writer.writerow(order_row + [""] * 5)
+        for item in order["items"]:
+            yield writer.writerow(
+                order_row
+                + [
+                    item["id"],
+                    item["product_id"],
+                    item["product_title"],
+                    item["price"],
+                    item["quantity"],
+                ]
+            )
+
+
+def iter_jsonl(orders: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Render orders as JSON Lines, one order with nested items per line.
+    """
+    encoder = DjangoJSONEncoder()
+    for order in orders:
+        yield json.dumps(order, default=encoder.default) + "\n"
+
+
+def export_orders(
+    export_format: str,
+    queryset: QuerySet[Order],
+    chunk_size: int = 1000,
+) -> Iterator[str]:
+    """
+    Stream the orders in the queryset in the requested export format.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    orders = iter_orders(queryset, chunk_size=chunk_size)
+    if export_format == "csv":
+        return iter_csv(orders)
+    return iter_jsonl(orders)
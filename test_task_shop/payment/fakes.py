@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+from payment.gateways import PaymentStatusError
+from payment.simpleswap import SimpleSwapError
+
+
+class FakeSimpleSwap:
+    """
+    In-process stand-in for the SimpleSwap API used by tests and local runs.
+
+    It implements the same methods as `SimpleSwapClient`, records every call
+    and can simulate slow responses or an unavailable upstream. The async
+    methods wait with `asyncio.sleep`, like a non-blocking HTTP client.
+    """
+
+    def __init__(
+        self,
+        rate: Decimal = Decimal("0.000015"),
+        min_amount: Decimal = Decimal("10"),
+        max_amount: Optional[Decimal] = Decimal("50000"),
+        latency: float = 0.0,
+        fail: bool = False,
+    ) -> None:
+        self.rate = rate
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.latency = latency
+        self.fail = fail
+        self.calls: List[str] = []
+        self.exchanges: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+
+    def _call(self, name: str) -> None:
+        """
+        Record a call and apply the configured latency and failure mode.
+        """
+        self.calls.append(name)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise SimpleSwapError("SimpleSwap is unavailable", status_code=503)
+
+    async def _acall(self, name: str) -> None:
+        """
+        Asynchronous version of `_call`.
+        """
+        self.calls.append(name)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail:
+            raise SimpleSwapError("SimpleSwap is unavailable", status_code=503)
+
+    def count(self, name: str) -> int:
+        """
+        Return how many times the named endpoint was called.
+        """
+        return self.calls.count(name)
+
+    def _ranges(self) -> Dict[str, Optional[str]]:
+        return {
+            "min": str(self.min_amount),
+            "max": str(self.max_amount) if self.max_amount is not None else None,
+        }
+
+    def get_ranges(
+        self, currency_from: str, currency_to: str
+    ) -> Dict[str, Optional[str]]:
+        self._call("get_ranges")
+        return self._ranges()
+
+    async def aget_ranges(
+        self, currency_from: str, currency_to: str
+    ) -> Dict[str, Optional[str]]:
+        await self._acall("get_ranges")
+        return self._ranges()
+
+    def get_estimated(
+        self, currency_from: str, currency_to: str, amount: Decimal
+    ) -> str:
+        self._call("get_estimated")
+        return str(Decimal(amount) * self.rate)
+
+    async def aget_estimated(
+        self, currency_from: str, currency_to: str, amount: Decimal
+    ) -> str:
+        await self._acall("get_estimated")
+        return str(Decimal(amount) * self.rate)
+
+    def create_exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        self._call("create_exchange")
+        return self._exchange(data)
+
+    async def acreate_exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        await self._acall("create_exchange")
+        return self._exchange(data)
+
+    def _exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        exchange_id = f"fake{next(self._ids)}"
+        exchange = {
+            "id": exchange_id,
+            "amount_from": str(data["amount"]),
+            "currency_from": data["currency_from"],
+            "currency_to": data["currency_to"],
+            "address_to": data["address_to"],
+            "redirect_url": f"https://simpleswap.example/exchange?id={exchange_id}",
+        }
+        self.exchanges.append(exchange)
+        return exchange
+
+
+class FakePaymentProvider:
+    """
+    In-process payment provider that reports a fixed set of references as paid.
+
+    It tracks the highest number of concurrent lookups so tests can check
+    that callers respect their concurrency limits. Lookups of
+    `failing_references` raise `PaymentStatusError`, and lookups of
+    `unreachable_references` raise a connection error like a network failure.
+    """
+
+    def __init__(
+        self,
+        paid_references: Iterable[str] = (),
+        failing_references: Iterable[str] = (),
+        latency: float = 0.0,
+        unreachable_references: Iterable[str] = (),
+    ) -> None:
+        self.paid_references = set(paid_references)
+        self.failing_references = set(failing_references)
+        self.unreachable_references = set(unreachable_references)
+        self.latency = latency
+        self.lookups: List[str] = []
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def is_paid(self, reference: str) -> bool:
+        with self._lock:
+            self.lookups.append(reference)
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if reference in self.failing_references:
+                raise PaymentStatusError(f"Lookup of {reference} failed")
+            if reference in self.unreachable_references:
+                raise requests.exceptions.ConnectionError(f"{reference} unreachable")
+            return reference in self.paid_references
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+class FakeStripeCheckout:
+    """
+    Stand-in for `stripe.checkout.Session` creation with configurable latency.
+
+    Patch `stripe.checkout.Session.create` and `create_async` with its methods
+    to run checkouts without calling Stripe.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.sessions: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+
+    def _session(self, params: Dict[str, Any]) -> SimpleNamespace:
+        session_id = f"cs_fake_{next(self._ids)}"
+        self.sessions.append(params)
+        return SimpleNamespace(
+            id=session_id, url=f"https://stripe.example/pay/{session_id}"
+        )
+
+    def create(self, **params: Any) -> SimpleNamespace:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._session(params)
+
+    async def create_async(self, **params: Any) -> SimpleNamespace:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._session(params)
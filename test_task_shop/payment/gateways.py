@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Protocol, Tuple
+
+import aiohttp
+import requests
+import stripe
+from django.conf import settings
+from payment.models import Order
+
+BITPAY_API_URL = "https://test.bitpay.com"
+
+# BitPay invoice states that mean the customer has paid.
+BITPAY_PAID_STATUSES = {"paid", "confirmed", "complete"}
+
+# Errors of the provider clients and the network that only fail one lookup.
+TRANSPORT_ERRORS = (
+    stripe.StripeError,
+    requests.exceptions.RequestException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    OSError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentStatusError(Exception):
+    """
+    Raised when a provider cannot report the status of a payment.
+    """
+
+
+class PaymentProvider(Protocol):
+    """
+    Looks up whether a payment made through a provider has been completed.
+    """
+
+    def is_paid(self, reference: str) -> bool:
+        """Return True if the payment with the given reference is paid."""
+
+
+class StripeProvider:
+    """
+    Reads the payment status of Stripe Checkout sessions.
+    """
+
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+
+    def is_paid(self, reference: str) -> bool:
+        try:
+            session = stripe.checkout.Session.retrieve(reference, api_key=self.api_key)
+        except stripe.StripeError as e:
+            raise PaymentStatusError(str(e)) from e
+        return session.payment_status == "paid"
+
+
+class BitPayProvider:
+    """
+    Reads the status of BitPay invoices.
+    """
+
+    def __init__(
+        self, token: str, base_url: str = BITPAY_API_URL, timeout: float = 10.0
+    ) -> None:
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def is_paid(self, reference: str) -> bool:
+        try:
+            response = self.session.get(
+                f"{self.base_url}/invoices/{reference}",
+                params={"token": self.token},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            status = response.json()["data"]["status"]
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            raise PaymentStatusError(str(e)) from e
+        return status in BITPAY_PAID_STATUSES
+
+
+class PaymentGateway:
+    """
+    Dispatches payment status lookups to the provider that took each payment.
+
+    Lookups run in a thread pool of `max_workers`, which bounds how many
+    requests are in flight against the providers at any time.
+    """
+
+    def __init__(
+        self, providers: Dict[str, PaymentProvider], max_workers: int = 8
+    ) -> None:
+        self.providers = providers
+        self.max_workers = max_workers
+
+    def _check(self, provider_name: str, reference: str) -> Optional[bool]:
+        """
+        Look up a single payment. Returns None if the provider is unknown.
+        """
+        provider = self.providers.get(provider_name)
+        if provider is None:
+            return None
+        return provider.is_paid(reference)
+
+    def check_payments(
+        self, payments: Iterable[Tuple[int, str, str]]
+    ) -> Tuple[Dict[int, Optional[bool]], Dict[int, str]]:
+        """
+        Check `(order_id, provider, reference)` payments concurrently.
+
+        Returns the status per order (None when it cannot be verified) and the
+        error message for each order whose lookup failed. A provider or
+        network error fails only the lookup that raised it; it is logged and
+        the other lookups carry on.
+        """
+        statuses: Dict[int, Optional[bool]] = {}
+        errors: Dict[int, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                order_id: executor.submit(self._check, provider, reference)
+                for order_id, provider, reference in payments
+            }
+            for order_id, future in futures.items():
+                try:
+                    statuses[order_id] = future.result()
+                except PaymentStatusError as e:
+                    errors[order_id] = str(e)
+                except TRANSPORT_ERRORS as e:
+                    logger.warning("Payment lookup of order %s failed: %r", order_id, e)
+                    errors[order_id] = f"{type(e).__name__}: {e}"
+        return statuses, errors
+
+
+def get_payment_gateway(max_workers: int = 8) -> PaymentGateway:
+    """
+    Return a gateway backed by the real Stripe and BitPay APIs.
+    """
+    return PaymentGateway(
+        {
+            Order.STRIPE: StripeProvider(settings.STRIPE_SECRET_KEY),
+            Order.BITPAY: BitPayProvider(settings.BITPAY_SECRET),
+        },
+        max_workers=max_workers,
+    )
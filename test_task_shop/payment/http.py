@@ -0,0 +1,61 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiohttp
+from django.conf import settings
+
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]"
+_sessions = weakref.WeakKeyDictionary()
+
+
+def _new_session() -> aiohttp.ClientSession:
+    """
+    Create a session with the configured timeout and connection pool size.
+    """
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=settings.PAYMENT_HTTP_TIMEOUT),
+        connector=aiohttp.TCPConnector(limit=settings.PAYMENT_HTTP_POOL_SIZE),
+    )
+
+
+async def open_client_session() -> None:
+    """
+    Keep a pooled session for the running event loop.
+
+    Called on ASGI lifespan startup: the server's loop lives as long as the
+    process, so every request served on it reuses the session until
+    `close_client_session` runs on shutdown.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        _sessions[loop] = _new_session()
+
+
+async def close_client_session() -> None:
+    """
+    Close the session of the running event loop, if one was opened.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+@asynccontextmanager
+async def client_session() -> AsyncIterator[aiohttp.ClientSession]:
+    """
+    Provide the session for an outgoing provider request.
+
+    Yields the pooled session of the running loop when one was opened.
+    Otherwise, as for async views that runserver or a WSGI server runs in
+    a new loop per request, a session is opened for the block and closed
+    after it, so none is left behind with its loop.
+    """
+    session = _sessions.get(asyncio.get_running_loop())
+    if session is not None and not session.closed:
+        yield session
+        return
+    async with _new_session() as session:
+        yield session
@@ -0,0 +1,263 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import BaseCache, cache
+from django.http import HttpRequest, HttpResponse, JsonResponse
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+IDEMPOTENCY_FIELD = "idempotency_key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+@dataclass
+class StoredResponse:
+    """
+    A response captured for replay under an idempotency key.
+    """
+
+    fingerprint: str
+    status_code: int
+    content: bytes
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+
+    @classmethod
+    def from_response(
+        cls, fingerprint: str, response: HttpResponse
+    ) -> "StoredResponse":
+        """
+        Capture the status, body and headers of a rendered response.
+        """
+        return cls(
+            fingerprint=fingerprint,
+            status_code=response.status_code,
+            content=response.content,
+            headers=list(response.items()),
+        )
+
+    def to_response(self) -> HttpResponse:
+        """
+        Rebuild an `HttpResponse` marked as a replay of the stored one.
+        """
+        response = HttpResponse(self.content, status=self.status_code)
+        for name, value in self.headers:
+            response[name] = value
+        response[REPLAYED_HEADER] = "true"
+        return response
+
+
+class IdempotencyStore:
+    """
+    Stores responses by idempotency key and coordinates in-flight duplicates.
+
+    The first request for a key takes a short-lived lock in the cache and runs
+    the view; duplicates arriving meanwhile wait for its stored response
+    instead of repeating the work. With a shared cache backend this also works
+    across processes, waiters in the same process are woken immediately.
+    """
+
+    def __init__(
+        self,
+        cache_backend: BaseCache = cache,
+        ttl: int = 24 * 60 * 60,
+        lock_timeout: int = 60,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.cache = cache_backend
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._events: Dict[str, threading.Event] = {}
+        self._events_guard = threading.Lock()
+
+    def _event_for(self, key: str) -> threading.Event:
+        """
+        Return the in-process event signalled when the key is completed.
+        """
+        with self._events_guard:
+            return self._events.setdefault(key, threading.Event())
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        """
+        Return the stored response for the key, if any.
+        """
+        return self.cache.get(f"idempotency:response:{key}")
+
+    def acquire(self, key: str) -> bool:
+        """
+        Mark the key as in flight. Returns False if another request holds it.
+        """
+        acquired = self.cache.add(f"idempotency:lock:{key}", 1, self.lock_timeout)
+        if acquired:
+            self._event_for(key).clear()
+        return acquired
+
+    def save(self, key: str, stored: StoredResponse) -> None:
+        """
+        Store the response for the key for `ttl` seconds.
+        """
+        self.cache.set(f"idempotency:response:{key}", stored, self.ttl)
+
+    def release(self, key: str) -> None:
+        """
+        Drop the in-flight lock and wake local waiters.
+        """
+        self.cache.delete(f"idempotency:lock:{key}")
+        with self._events_guard:
+            event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def wait(self, key: str, timeout: float) -> Optional[StoredResponse]:
+        """
+        Wait until the in-flight request for the key stores its response.
+
+        Returns None if the first request finished without storing a response
+        or the timeout expired.
+        """
+        event = self._event_for(key)
+        deadline = time.monotonic() + timeout
+        while True:
+            stored = self.get(key)
+            if stored is not None:
+                return stored
+            if self.cache.get(f"idempotency:lock:{key}") is None:
+                return self.get(key)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            event.wait(min(self.poll_interval, remaining))
+
+
+store = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_KEY_TTL, lock_timeout=settings.IDEMPOTENCY_WAIT_TIMEOUT
+)
+
+
+def get_idempotency_key(request: HttpRequest) -> Optional[str]:
+    """
+    Return the idempotency key from the `Idempotency-Key` header or form field.
+    """
+    # Read the raw body first so that it stays available after POST is parsed.
+    request.body
+    key = request.META.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+    if not key:
+        return None
+    return key.strip()[:255] or None
+
+
+def _scoped_key(request: HttpRequest, user: Any, key: str) -> str:
+    """
+    Scope the client key to the endpoint and user so keys cannot collide.
+    """
+    user_id = user.pk if user.is_authenticated else "anon"
+    raw = f"{request.path}:{user_id}:{key}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _begin(scoped_key: str, fingerprint: str) -> Optional[HttpResponse]:
+    """
+    Claim the key for this request or return the response to send instead.
+
+    Returns None once the key is held, otherwise the replayed response of the
+    first request, 422 for a different body or 409 if it is still running.
+    """
+    stored = store.get(scoped_key)
+    if stored is None and not store.acquire(scoped_key):
+        stored = store.wait(scoped_key, timeout=store.lock_timeout)
+        if stored is None:
+            return JsonResponse(
+                {"error": "A request with this idempotency key is in progress"},
+                status=409,
+            )
+    if stored is None:
+        return None
+    if stored.fingerprint != fingerprint:
+        return JsonResponse(
+            {"error": "Idempotency key was reused with a different request"},
+            status=422,
+        )
+    return stored.to_response()
+
+
+def _finish(scoped_key: str, fingerprint: str, response: HttpResponse) -> None:
+    """
+    Store the response of the request holding the key and release it.
+    """
+    try:
+        if hasattr(response, "render") and not response.is_rendered:
+            response.render()
+        # Server errors are not stored so that the client can retry them.
+        if response.status_code < 500 and not response.streaming:
+            store.save(scoped_key, StoredResponse.from_response(fingerprint, response))
+    finally:
+        store.release(scoped_key)
+
+
+def idempotent(view_func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Make a POST view idempotent for requests that carry an idempotency key.
+
+    A repeated key returns the stored response of the first request. A repeated
+    key with a different body is rejected with 422, and a duplicate that
+    outlives the first request's wait window gets 409. Both sync and async
+    views are supported; async views wait for duplicates off the event loop.
+    """
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def _async_wrapped(
+            request: HttpRequest, *args: Any, **kwargs: Any
+        ) -> HttpResponse:
+            key = get_idempotency_key(request) if request.method == "POST" else None
+            if key is None:
+                return await view_func(request, *args, **kwargs)
+
+            scoped_key = _scoped_key(request, await request.auser(), key)
+            fingerprint = hashlib.sha256(request.body).hexdigest()
+            early = await sync_to_async(_begin, thread_sensitive=False)(
+                scoped_key, fingerprint
+            )
+            if early is not None:
+                return early
+
+            response = None
+            try:
+                response = await view_func(request, *args, **kwargs)
+            finally:
+                if response is None:
+                    store.release(scoped_key)
+            await sync_to_async(_finish, thread_sensitive=False)(
+                scoped_key, fingerprint, response
+            )
+            return response
+
+        return _async_wrapped
+
+    @wraps(view_func)
+    def _wrapped(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        key = get_idempotency_key(request) if request.method == "POST" else None
+        if key is None:
+            return view_func(request, *args, **kwargs)
+
+        scoped_key = _scoped_key(request, request.user, key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        early = _begin(scoped_key, fingerprint)
+        if early is not None:
+            return early
+
+        response = None
+        try:
+            response = view_func(request, *args, **kwargs)
+        finally:
+            if response is None:
+                store.release(scoped_key)
+        _finish(scoped_key, fingerprint, response)
+        return response
+
+    return _wrapped
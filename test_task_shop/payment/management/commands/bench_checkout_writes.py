@@ -0,0 +1,230 @@
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from api.views import CompleteOrderAPIView
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+from payment.models import Order
+from shop.models import Category, Product
+from test_task_shop.database import (
+    POSTGRESQL_ENGINE,
+    SQLITE_ENGINE,
+    postgresql_pool_options,
+    sqlite_options,
+)
+
+from .loadtest_checkout import CHECKOUT_BODY
+
+PRODUCT_NAME = CHECKOUT_BODY["cart_items"][0]["product_name"]
+
+
+def profiles(engine: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Connection settings compared for a database engine, untuned first.
+    """
+    if engine == SQLITE_ENGINE:
+        return {
+            "sqlite default": {"OPTIONS": {}},
+            "sqlite tuned": {
+                "OPTIONS": sqlite_options(
+                    settings.DATABASES["default"]["OPTIONS"].get("timeout", 20),
+                    256 * 1024 * 1024,
+                )
+            },
+        }
+    if engine == POSTGRESQL_ENGINE:
+        return {
+            "pg per request": {"OPTIONS": {}, "CONN_MAX_AGE": 0},
+            "pg persistent": {
+                "OPTIONS": {},
+                "CONN_MAX_AGE": 600,
+                "CONN_HEALTH_CHECKS": True,
+            },
+            "pg pool": {
+                "OPTIONS": postgresql_pool_options(2, 20, 10),
+                "CONN_MAX_AGE": 0,
+            },
+        }
+    raise CommandError(f"No benchmark profiles for {engine}")
+
+
+class Command(BaseCommand):
+    """
+    Compare checkout write throughput across database connection profiles.
+    """
+
+    help = (
+        "Run concurrent checkouts (order, items and the payment update, each "
+        "in its own transaction) next to catalog readers, once per connection "
+        "profile of the configured database engine, and report throughput, "
+        "latency percentiles and failed writes. SQLite runs with Django's "
+        "defaults and with the tuned profile; PostgreSQL with connections per "
+        "request, persistent connections and a pool. Uses a throwaway test "
+        "database, in a file for SQLite."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument(
+            "--checkouts", type=int, default=50, help="Checkouts per writer."
+        )
+        parser.add_argument(
+            "--readers",
+            type=int,
+            default=4,
+            help="Threads reading the catalog while the writers run.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if min(options["writers"], options["checkouts"]) < 1:
+            raise CommandError("--writers and --checkouts must be positive")
+        if options["readers"] < 0:
+            raise CommandError("--readers must not be negative")
+
+        settings_dict = connection.settings_dict
+        saved = {
+            key: settings_dict.get(key)
+            for key in ("OPTIONS", "CONN_MAX_AGE", "CONN_HEALTH_CHECKS")
+        }
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            if settings_dict["ENGINE"] == SQLITE_ENGINE:
+                # Threads need a shared file; the in-memory test database
+                # would measure neither journaling nor fsync.
+                settings_dict["TEST"]["NAME"] = str(Path(directory) / "bench.sqlite3")
+            try:
+                for name, profile in profiles(settings_dict["ENGINE"]).items():
+                    settings_dict.update(profile)
+                    results.append((name, self._run_profile(options)))
+            finally:
+                settings_dict.update(saved)
+
+        total = options["writers"] * options["checkouts"]
+        self.stdout.write(
+            f"{total} checkouts from {options['writers']} writers, "
+            f"{options['readers']} catalog readers"
+        )
+        self.stdout.write(
+            f"{'profile':<16} {'ok':>5} {'failed':>6} {'chk/s':>8} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'reads/s':>8}"
+        )
+        for name, result in results:
+            self._report(name, *result)
+
+    def _run_profile(
+        self, options: Dict[str, Any]
+    ) -> Tuple[List[float], int, float, int]:
+        """
+        Create a fresh test database and run the workload against it.
+        """
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            category = Category.objects.create(name="Bench", slug="bench")
+            for index in range(50):
+                Product.objects.create(
+                    title=PRODUCT_NAME if index == 0 else f"Bench product {index}",
+                    slug=f"bench-product-{index}",
+                    price=Decimal("5.00"),
+                    category=category,
+                    is_available=True,
+                )
+            connection.close()
+            return self._workload(options)
+        finally:
+            if hasattr(connection, "close_pool"):
+                connection.close_pool()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _workload(self, options: Dict[str, Any]) -> Tuple[List[float], int, float, int]:
+        """
+        Run the writer and reader threads; returns latencies, failures,
+        elapsed seconds and completed reads.
+        """
+        cart = [{"product_name": PRODUCT_NAME, "price": Decimal("5.00"), "quantity": 4}]
+        latencies: List[float] = []
+        failed = 0
+        reads = 0
+        lock = threading.Lock()
+        writing = threading.Event()
+        writing.set()
+
+        def writer() -> None:
+            nonlocal failed
+            try:
+                for _ in range(options["checkouts"]):
+                    started = time.perf_counter()
+                    try:
+                        order = CompleteOrderAPIView._create_order(
+                            CHECKOUT_BODY["shipping_address"],
+                            None,
+                            cart,
+                            Decimal("20.00"),
+                        )
+                        Order.mark_paid([order.id])
+                    except DatabaseError:
+                        with lock:
+                            failed += 1
+                    else:
+                        with lock:
+                            latencies.append(time.perf_counter() - started)
+                    # End the "request" the way Django's request_finished does.
+                    close_old_connections()
+            finally:
+                connection.close()
+
+        def reader() -> None:
+            nonlocal reads
+            try:
+                while writing.is_set():
+                    try:
+                        list(Product.objects.filter(is_available=True)[:20])
+                        Order.objects.filter(is_paid=True).count()
+                    except DatabaseError:
+                        continue
+                    with lock:
+                        reads += 1
+                    close_old_connections()
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=writer) for _ in range(options["writers"])]
+        readers = [threading.Thread(target=reader) for _ in range(options["readers"])]
+        start = time.perf_counter()
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        writing.clear()
+        for thread in readers:
+            thread.join()
+        return latencies, failed, elapsed, reads
+
+    def _report(
+        self,
+        name: str,
+        latencies: List[float],
+        failed: int,
+        elapsed: float,
+        reads: int,
+    ) -> None:
+        """
+        Write one result row with throughput and latency percentiles.
+        """
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100)
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = latencies[0] if latencies else 0.0
+        self.stdout.write(
+            f"{name:<16} {len(latencies):>5} {failed:>6} "
+            f"{len(latencies) / elapsed:>8.1f} {p50 * 1000:>6.0f}ms "
+            f"{p95 * 1000:>6.0f}ms {p99 * 1000:>6.0f}ms {reads / elapsed:>8.0f}"
+        )
@@ -0,0 +1,61 @@
+import argparse
+import datetime
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from payment.export import EXPORT_FORMATS, export_orders, filter_orders
+
+
+def _date(value: str) -> datetime.date:
+    """
+    Parse a YYYY-MM-DD command line argument.
+    """
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date: {value}")
+
+
+class Command(BaseCommand):
+    """
+    Stream orders with their items and shipping addresses as CSV or JSONL.
+    """
+
+    help = "Export orders with items and shipping addresses as CSV or JSON Lines."
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument(
+            "--output", help="File to write to. Defaults to standard output."
+        )
+        parser.add_argument(
+            "--since", type=_date, help="Only orders created on or after this date."
+        )
+        parser.add_argument(
+            "--until", type=_date, help="Only orders created on or before this date."
+        )
+        paid = parser.add_mutually_exclusive_group()
+        paid.add_argument("--paid", dest="is_paid", action="store_true", default=None)
+        paid.add_argument("--unpaid", dest="is_paid", action="store_false")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        queryset = filter_orders(
+            date_from=options["since"],
+            date_to=options["until"],
+            is_paid=options["is_paid"],
+        )
+        lines = export_orders(
+            options["format"], queryset, chunk_size=options["chunk_size"]
+        )
+
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            output.writelines(lines)
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+from unittest import mock
+
+from api.views import CompleteOrderAPIView
+from asgiref.sync import async_to_sync
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from payment.fakes import FakeSimpleSwap, FakeStripeCheckout
+from payment.simpleswap import QuoteService
+from shop.models import Category, Product
+
+CHECKOUT_BODY: Dict[str, Any] = {
+    "shipping_address": {
+        "full_name": "Load Test",
+        "email": "load@example.com",
+        "street_address": "Gullweg 18",
+        "apartment_address": "1",
+        "city": "Berlin",
+        "country": "Germany",
+    },
+    "cart_items": [
+        {"product_name": "Load Test Product", "price": "5.00", "quantity": 4}
+    ],
+}
+
+
+class Command(BaseCommand):
+    """
+    Compare the async checkout with thread-per-request checkouts under load.
+    """
+
+    help = (
+        "Run concurrent checkouts against slow fake Stripe and SimpleSwap "
+        "providers, once through the async `v1/api/checkout/` view and once "
+        "with blocking provider calls on a fixed thread pool, and report "
+        "throughput and latency percentiles. Uses a throwaway test database."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Checkouts in flight at once.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Worker threads of the blocking baseline.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.2,
+            help="Seconds each fake provider call takes.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if min(options["requests"], options["concurrency"], options["threads"]) < 1:
+            raise CommandError(
+                "--requests, --concurrency and --threads must be positive"
+            )
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, options: Dict[str, Any]) -> None:
+        category = Category.objects.create(name="Load test", slug="load-test")
+        Product.objects.create(
+            title="Load Test Product",
+            slug="load-test-product",
+            price=Decimal("5.00"),
+            category=category,
+            is_available=True,
+        )
+        swap = FakeSimpleSwap(latency=options["latency"])
+        service = QuoteService(swap, cache_backend=LocMemCache("loadtest", {}))
+        stripe_fake = FakeStripeCheckout(latency=options["latency"])
+
+        with (
+            mock.patch("api.views.get_quote_service", return_value=service),
+            mock.patch(
+                "stripe.checkout.Session.create_async",
+                side_effect=stripe_fake.create_async,
+            ),
+            # Measure the view itself, not the throttles guarding it.
+            override_settings(
+                THROTTLE_RULES={},
+                LOAD_SHEDDING_MAX_IN_FLIGHT=options["concurrency"] * 2,
+            ),
+        ):
+            blocking = self._run_blocking(service, stripe_fake, options)
+            asynchronous = async_to_sync(self._run_async)(options)
+
+        self.stdout.write(
+            f"{options['requests']} checkouts, {options['latency'] * 1000:.0f}ms per "
+            f"provider call, {options['concurrency']} in flight"
+        )
+        self.stdout.write(
+            f"{'mode':<22} {'ok':>5} {'errors':>6} {'req/s':>8} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8}"
+        )
+        self._report(f"blocking, {options['threads']} threads", *blocking)
+        self._report("async view", *asynchronous)
+        self.stdout.write(
+            f"Throughput gain: {blocking[2] / asynchronous[2]:.1f}x "
+            f"({blocking[2]:.2f}s -> {asynchronous[2]:.2f}s)"
+        )
+
+    def _run_blocking(
+        self,
+        service: QuoteService,
+        stripe_fake: FakeStripeCheckout,
+        options: Dict[str, Any],
+    ) -> Tuple[List[float], int, float]:
+        """
+        Run checkouts the way a sync view does, each holding a pool thread.
+        """
+        product_price = Decimal("5.00")
+        db_lock = threading.Lock()
+        total = product_price * 4
+
+        def checkout(submitted: float) -> float:
+            service.validate_amount(total)
+            # The in-memory test database takes one writer at a time.
+            with db_lock:
+                order = CompleteOrderAPIView._create_order(
+                    CHECKOUT_BODY["shipping_address"],
+                    None,
+                    [
+                        {
+                            "product_name": "Load Test Product",
+                            "price": product_price,
+                            "quantity": 4,
+                        }
+                    ],
+                    total,
+                )
+            stripe_fake.create(client_reference_id=order.id)
+            service.create_exchange(total, "btc-address")
+            return time.perf_counter() - submitted
+
+        # Warm the quote cache so both modes measure the same provider calls.
+        service.get_quote()
+        latencies: List[float] = []
+        errors = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+            # Latency counts from submission, so time spent queued for a free
+            # thread is included like a request waiting for a worker would be.
+            futures = [
+                executor.submit(checkout, time.perf_counter())
+                for _ in range(options["requests"])
+            ]
+            for future in futures:
+                try:
+                    latencies.append(future.result())
+                except Exception:
+                    errors += 1
+        return latencies, errors, time.perf_counter() - start
+
+    async def _run_async(
+        self, options: Dict[str, Any]
+    ) -> Tuple[List[float], int, float]:
+        """
+        Post checkouts concurrently to the async view through the ASGI handler.
+        """
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        latencies: List[float] = []
+        errors = 0
+
+        async def checkout() -> None:
+            nonlocal errors
+            started = time.perf_counter()
+            async with semaphore:
+                response = await client.post(
+                    "/v1/api/checkout/", CHECKOUT_BODY, content_type="application/json"
+                )
+                if response.status_code == 201:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(checkout() for _ in range(options["requests"])))
+        return latencies, errors, time.perf_counter() - start
+
+    def _report(
+        self, mode: str, latencies: List[float], errors: int, elapsed: float
+    ) -> None:
+        """
+        Write one result row with throughput and latency percentiles.
+        """
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100)
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = latencies[0] if latencies else 0.0
+        self.stdout.write(
+            f"{mode:<22} {len(latencies):>5} {errors:>6} "
+            f"{len(latencies) / elapsed:>8.1f} {p50 * 1000:>6.0f}ms "
+            f"{p95 * 1000:>6.0f}ms {p99 * 1000:>6.0f}ms"
+        )
@@ -0,0 +1,74 @@
+import argparse
+import datetime
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from payment.gateways import get_payment_gateway
+from payment.reconciliation import reconcile_payments, unpaid_orders
+
+
+class Command(BaseCommand):
+    """
+    Mark orders as paid when their provider confirms a payment we missed.
+    """
+
+    help = (
+        "Check unpaid orders against Stripe and BitPay and mark the ones "
+        "that were paid but never received a webhook."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=8,
+            help="Maximum number of provider lookups in flight.",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Only check orders created within this many days.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report mismatches without updating orders.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["chunk_size"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--chunk-size and --concurrency must be positive")
+
+        since = None
+        if options["days"] is not None:
+            since = timezone.now() - datetime.timedelta(days=options["days"])
+
+        report = reconcile_payments(
+            get_payment_gateway(max_workers=options["concurrency"]),
+            unpaid_orders(since),
+            chunk_size=options["chunk_size"],
+            dry_run=options["dry_run"],
+        )
+
+        self.stdout.write(f"Checked {report.checked} unpaid orders.")
+        self.stdout.write(
+            f"Paid at provider but unpaid locally: {len(report.mismatched)}"
+        )
+        for order_id in report.mismatched:
+            self.stdout.write(f"  order {order_id}")
+        if options["dry_run"]:
+            self.stdout.write("Dry run: no orders were updated.")
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Marked {len(report.updated)} orders as paid.")
+            )
+        if report.unverifiable:
+            self.stdout.write(
+                f"Without a payment reference: {len(report.unverifiable)}"
+            )
+        if report.errors:
+            self.stdout.write(self.style.ERROR(f"Failed lookups: {len(report.errors)}"))
+        for order_id, error in report.errors.items():
+            self.stdout.write(self.style.ERROR(f"  order {order_id}: {error}"))
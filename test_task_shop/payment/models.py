@@ -1,10 +1,12 @@
 from decimal import Decimal
-from typing import Optional
+from typing import Iterable, List, Optional
 
 from django.contrib.auth.models import User
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
+from payment.events import publish_paid
 from shop.models import Product
 
 
@@ -57,6 +59,13 @@ class ShippingAddress(models.Model):
 
 
 class Order(models.Model):
+    STRIPE = "stripe"
+    BITPAY = "bitpay"
+    PAYMENT_PROVIDERS = [
+        (STRIPE, "Stripe"),
+        (BITPAY, "BitPay"),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
     shipping_address = models.ForeignKey(
         ShippingAddress, on_delete=models.CASCADE, blank=True, null=True
@@ -68,6 +77,10 @@ class Order(models.Model):
     discount = models.IntegerField(
         default=0, validators=[MinValueValidator(0), MaxValueValidator(100)]
     )
+    payment_provider = models.CharField(
+        max_length=20, choices=PAYMENT_PROVIDERS, blank=True
+    )
+    payment_reference = models.CharField(max_length=255, blank=True)
 
     class Meta:
         verbose_name = "Order"
@@ -75,6 +88,7 @@ class Order(models.Model):
         ordering = ["-created"]
         indexes = [
             models.Index(fields=["-created"]),
+            models.Index(fields=["is_paid", "id"]),
         ]
         constraints = [
             models.CheckConstraint(check=models.Q(amount__gte=0), name="amount_gte_0"),
@@ -89,6 +103,37 @@ class Order(models.Model):
         """
         return "Order " + str(self.id)
 
+    @classmethod
+    def mark_paid(cls, order_ids: Iterable[int]) -> List[int]:
+        """
+        Marks the given orders as paid with a single bulk update.
+
+        Subscribers of the order status stream are notified once the
+        transaction commits. A `PaidOrderEvent` is written in the same
+        transaction for each newly paid order, so the admin bot's digest
+        cannot miss a payment even if it is down when the webhook arrives.
+
+        Args:
+            order_ids (Iterable[int]): IDs of the orders confirmed as paid.
+
+        Returns:
+            List[int]: IDs of the orders that were unpaid before the update.
+        """
+        with transaction.atomic():
+            unpaid = cls.objects.select_for_update().filter(
+                id__in=list(order_ids), is_paid=False
+            )
+            flipped = list(unpaid.values_list("id", flat=True))
+            cls.objects.filter(id__in=flipped).update(
+                is_paid=True, updated=timezone.now()
+            )
+            PaidOrderEvent.objects.bulk_create(
+                PaidOrderEvent(order_id=order_id) for order_id in flipped
+            )
+            if flipped:
+                transaction.on_commit(lambda: publish_paid(flipped))
+        return flipped
+
     def get_absolute_url(self) -> str:
         """
         Returns the URL to access a particular order instance.
@@ -130,6 +175,34 @@ class Order(models.Model):
         return total_cost - self.get_discount
 
 
+class PaidOrderEvent(models.Model):
+    """
+    Outbox entry for an order that was paid and not yet announced.
+
+    The admin bot drains the outbox through `v1/api/paid-orders/` and
+    acknowledges the events once its digest is sent, which deletes them.
+    """
+
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, related_name="paid_event"
+    )
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Paid Order Event"
+        verbose_name_plural = "Paid Order Events"
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        """
+        Returns a string representation of the event.
+
+        Returns:
+            str: String representation of the event.
+        """
+        return f"Order {self.order_id} paid at {self.created}"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order, on_delete=models.CASCADE, blank=True, null=True, related_name="items"
@@ -0,0 +1,86 @@
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.db.models import QuerySet
+from payment.gateways import PaymentGateway
+from payment.models import Order
+
+
+@dataclass
+class ReconciliationReport:
+    """
+    Outcome of a reconciliation run.
+
+    Attributes:
+        checked (int): Unpaid orders looked up at their provider.
+        mismatched (List[int]): Orders paid at the provider but unpaid locally.
+        updated (List[int]): Mismatched orders that were marked as paid.
+        unverifiable (List[int]): Orders without a provider reference.
+        errors (Dict[int, str]): Orders whose lookup failed, with the reason.
+    """
+
+    checked: int = 0
+    mismatched: List[int] = field(default_factory=list)
+    updated: List[int] = field(default_factory=list)
+    unverifiable: List[int] = field(default_factory=list)
+    errors: Dict[int, str] = field(default_factory=dict)
+
+
+def unpaid_orders(since: Optional[datetime.datetime] = None) -> QuerySet[Order]:
+    """
+    Return the unpaid orders to reconcile, optionally only recent ones.
+    """
+    queryset = Order.objects.filter(is_paid=False)
+    if since is not None:
+        queryset = queryset.filter(created__gte=since)
+    return queryset
+
+
+def reconcile_payments(
+    gateway: PaymentGateway,
+    queryset: Optional[QuerySet[Order]] = None,
+    chunk_size: int = 500,
+    dry_run: bool = False,
+) -> ReconciliationReport:
+    """
+    Compare unpaid orders with their provider and mark the paid ones.
+
+    Orders are paged by `Order.id` in chunks of `chunk_size`. Each chunk is
+    checked through the gateway concurrently and the orders confirmed as paid
+    are updated with one bulk query per chunk. With `dry_run` the mismatches
+    are only reported.
+    """
+    if queryset is None:
+        queryset = unpaid_orders()
+    queryset = queryset.order_by("id").values_list(
+        "id", "payment_provider", "payment_reference"
+    )
+    report = ReconciliationReport()
+    last_id = 0
+
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return report
+        last_id = chunk[-1][0]
+
+        payments = []
+        for order_id, provider, reference in chunk:
+            if provider and reference:
+                payments.append((order_id, provider, reference))
+            else:
+                report.unverifiable.append(order_id)
+
+        statuses, errors = gateway.check_payments(payments)
+        report.checked += len(payments)
+        report.errors.update(errors)
+        for order_id, is_paid in statuses.items():
+            if is_paid is None:
+                report.unverifiable.append(order_id)
+            elif is_paid:
+                report.mismatched.append(order_id)
+
+        paid_ids = [order_id for order_id, is_paid in statuses.items() if is_paid]
+        if paid_ids and not dry_run:
+            report.updated.extend(Order.mark_paid(paid_ids))
@@ -0,0 +1,462 @@
+import asyncio
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Dict, Optional, Protocol, Tuple
+
+import aiohttp
+import requests
+from django.conf import settings
+from django.core.cache import BaseCache, cache
+from payment.http import client_session
+
+SIMPLE_SWAP_API_URL = "https://api.simpleswap.io"
+
+# Amount used to derive an exchange rate from SimpleSwap's estimate endpoint.
+REFERENCE_AMOUNT = Decimal("100")
+
+
+class SimpleSwapError(Exception):
+    """
+    Raised when SimpleSwap cannot be reached or answers with an error.
+    """
+
+    def __init__(self, message: str, status_code: int = 500) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class QuoteValidationError(SimpleSwapError):
+    """
+    Raised when an amount falls outside the range allowed by the current quote.
+    """
+
+    def __init__(self, amount: Decimal, quote: "Quote") -> None:
+        super().__init__(
+            f"Amount {amount} {quote.currency_from.upper()} is outside the allowed "
+            f"range ({quote.min_amount} - {quote.max_amount or 'unlimited'})",
+            status_code=400,
+        )
+        self.amount = amount
+        self.quote = quote
+
+
+class SimpleSwapBackend(Protocol):
+    """
+    Interface shared by the real SimpleSwap client and the local fake.
+    """
+
+    def get_ranges(
+        self, currency_from: str, currency_to: str
+    ) -> Dict[str, Optional[str]]:
+        """Return the minimum and maximum amounts for a currency pair."""
+
+    def get_estimated(
+        self, currency_from: str, currency_to: str, amount: Decimal
+    ) -> str:
+        """Return the estimated amount received for `amount`."""
+
+    def create_exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create an exchange and return the exchange object."""
+
+    async def aget_ranges(
+        self, currency_from: str, currency_to: str
+    ) -> Dict[str, Optional[str]]:
+        """Asynchronous version of `get_ranges`."""
+
+    async def aget_estimated(
+        self, currency_from: str, currency_to: str, amount: Decimal
+    ) -> str:
+        """Asynchronous version of `get_estimated`."""
+
+    async def acreate_exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Asynchronous version of `create_exchange`."""
+
+
+@dataclass(frozen=True)
+class Quote:
+    """
+    Exchange rate and allowed amount range for a currency pair.
+    """
+
+    currency_from: str
+    currency_to: str
+    rate: Decimal
+    min_amount: Decimal
+    max_amount: Optional[Decimal]
+    fetched_at: float
+
+    def is_valid_amount(self, amount: Decimal) -> bool:
+        """
+        Check whether the amount can be exchanged under this quote.
+        """
+        if amount < self.min_amount:
+            return False
+        return self.max_amount is None or amount <= self.max_amount
+
+    def estimate(self, amount: Decimal) -> Decimal:
+        """
+        Estimate how much of `currency_to` the amount converts to.
+        """
+        return (amount * self.rate).quantize(Decimal("0.00000001"))
+
+
+class SimpleSwapClient:
+    """
+    Thin HTTP client for the SimpleSwap v1 API.
+
+    The `a`-prefixed methods send the same requests through the pooled aiohttp
+    session, so async views do not hold a thread while SimpleSwap answers.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = SIMPLE_SWAP_API_URL,
+        timeout: float = 10.0,
+    ) -> None:
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> Any:
+        """
+        Send a request to SimpleSwap and return the decoded JSON body.
+        """
+        params = kwargs.pop("params", {})
+        params["api_key"] = self.api_key
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}/{path}",
+                params=params,
+                timeout=self.timeout,
+                **kwargs,
+            )
+        except requests.exceptions.RequestException as e:
+            raise SimpleSwapError(str(e)) from e
+        if response.status_code != 200:
+            raise SimpleSwapError(
+                "Failed to send request", status_code=response.status_code
+            )
+        return response.json()
+
+    async def _arequest(self, method: str, path: str, **kwargs: Any) -> Any:
+        """
+        Asynchronous version of `_request`.
+        """
+        params = kwargs.pop("params", {})
+        params["api_key"] = self.api_key
+        try:
+            async with client_session() as session:
+                async with session.request(
+                    method,
+                    f"{self.base_url}/{path}",
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                    **kwargs,
+                ) as response:
+                    if response.status != 200:
+                        raise SimpleSwapError(
+                            "Failed to send request", status_code=response.status
+                        )
+                    return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise SimpleSwapError(str(e)) from e
+
+    @staticmethod
+    def _ranges_params(currency_from: str, currency_to: str) -> Dict[str, str]:
+        """
+        Build the query parameters of the `get_ranges` endpoint.
+        """
+        return {
+            "fixed": "false",
+            "currency_from": currency_from,
+            "currency_to": currency_to,
+        }
+
+    def get_ranges(
+        self, currency_from: str, currency_to: str
+    ) -> Dict[str, Optional[str]]:
+        """
+        Fetch the minimum and maximum amounts for a currency pair.
+        """
+        return self._request(
+            "GET", "get_ranges", params=self._ranges_params(currency_from, currency_to)
+        )
+
+    async def aget_ranges(
+        self, currency_from: str, currency_to: str
+    ) -> Dict[str, Optional[str]]:
+        """
+        Asynchronous version of `get_ranges`.
+        """
+        return await self._arequest(
+            "GET", "get_ranges", params=self._ranges_params(currency_from, currency_to)
+        )
+
+    def get_estimated(
+        self, currency_from: str, currency_to: str, amount: Decimal
+    ) -> str:
+        """
+        Fetch the estimated amount of `currency_to` received for `amount`.
+        """
+        params = self._ranges_params(currency_from, currency_to)
+        params["amount"] = str(amount)
+        return self._request("GET", "get_estimated", params=params)
+
+    async def aget_estimated(
+        self, currency_from: str, currency_to: str, amount: Decimal
+    ) -> str:
+        """
+        Asynchronous version of `get_estimated`.
+        """
+        params = self._ranges_params(currency_from, currency_to)
+        params["amount"] = str(amount)
+        return await self._arequest("GET", "get_estimated", params=params)
+
+    def create_exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Create an exchange and return SimpleSwap's exchange object.
+        """
+        return self._request("POST", "create_exchange", json=data)
+
+    async def acreate_exchange(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Asynchronous version of `create_exchange`.
+        """
+        return await self._arequest("POST", "create_exchange", json=data)
+
+
+class QuoteService:
+    """
+    Caches SimpleSwap quotes and validates amounts against them locally.
+
+    Quotes are kept in the Django cache for `ttl` seconds. Concurrent requests
+    for an expired quote are collapsed into a single upstream refresh, so a
+    burst of checkouts costs one round-trip instead of one per checkout. The
+    `a`-prefixed methods do the same for coroutines on an event loop.
+    """
+
+    def __init__(
+        self,
+        client: SimpleSwapBackend,
+        ttl: int = 60,
+        cache_backend: BaseCache = cache,
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.cache = cache_backend
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # asyncio locks belong to one event loop, so they are kept per loop.
+        self._async_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        """
+        Return the lock guarding refreshes of the given cache key.
+        """
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _async_lock_for(self, key: str) -> asyncio.Lock:
+        """
+        Return the asyncio lock guarding refreshes of the key on this loop.
+        """
+        locks = self._async_locks.setdefault(asyncio.get_running_loop(), {})
+        return locks.setdefault(key, asyncio.Lock())
+
+    @staticmethod
+    def _cache_key(currency_from: str, currency_to: str) -> str:
+        """
+        Return the cache key of the quote for a currency pair.
+        """
+        return f"simpleswap:quote:{currency_from}:{currency_to}"
+
+    def get_quote(self, currency_from: str = "usd", currency_to: str = "btc") -> Quote:
+        """
+        Return a cached quote for the pair, refreshing it once if it has expired.
+        """
+        key = self._cache_key(currency_from, currency_to)
+        quote: Optional[Quote] = self.cache.get(key)
+        if quote is not None:
+            return quote
+
+        with self._lock_for(key):
+            # Another thread may have refreshed the quote while we waited.
+            quote = self.cache.get(key)
+            if quote is None:
+                quote = self._fetch_quote(currency_from, currency_to)
+                self.cache.set(key, quote, self.ttl)
+        return quote
+
+    async def aget_quote(
+        self, currency_from: str = "usd", currency_to: str = "btc"
+    ) -> Quote:
+        """
+        Asynchronous version of `get_quote`.
+        """
+        key = self._cache_key(currency_from, currency_to)
+        quote: Optional[Quote] = await self.cache.aget(key)
+        if quote is not None:
+            return quote
+
+        async with self._async_lock_for(key):
+            # Another coroutine may have refreshed the quote while we waited.
+            quote = await self.cache.aget(key)
+            if quote is None:
+                quote = await self._afetch_quote(currency_from, currency_to)
+                await self.cache.aset(key, quote, self.ttl)
+        return quote
+
+    @staticmethod
+    def _parse_ranges(
+        ranges: Dict[str, Optional[str]]
+    ) -> Tuple[Decimal, Optional[Decimal], Decimal]:
+        """
+        Return the minimum, maximum and reference amounts from a ranges answer.
+        """
+        try:
+            min_amount = Decimal(str(ranges.get("min") or 0))
+            max_amount = (
+                Decimal(str(ranges["max"])) if ranges.get("max") is not None else None
+            )
+        except (InvalidOperation, TypeError) as e:
+            raise SimpleSwapError(f"Unexpected quote data: {e}") from e
+        reference = max(min_amount, REFERENCE_AMOUNT)
+        if max_amount is not None:
+            reference = min(reference, max_amount)
+        if reference <= 0:
+            raise SimpleSwapError("SimpleSwap returned an empty range")
+        return min_amount, max_amount, reference
+
+    @staticmethod
+    def _make_quote(
+        currency_from: str,
+        currency_to: str,
+        ranges: Tuple[Decimal, Optional[Decimal], Decimal],
+        estimated: Any,
+    ) -> Quote:
+        """
+        Build a quote from the parsed ranges and the estimate for the reference.
+        """
+        min_amount, max_amount, reference = ranges
+        try:
+            rate = Decimal(str(estimated)) / reference
+        except (InvalidOperation, TypeError) as e:
+            raise SimpleSwapError(f"Unexpected quote data: {e}") from e
+        return Quote(
+            currency_from=currency_from,
+            currency_to=currency_to,
+            rate=rate,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            fetched_at=time.time(),
+        )
+
+    def _fetch_quote(self, currency_from: str, currency_to: str) -> Quote:
+        """
+        Build a fresh quote from SimpleSwap's ranges and estimate endpoints.
+        """
+        ranges = self._parse_ranges(self.client.get_ranges(currency_from, currency_to))
+        estimated = self.client.get_estimated(currency_from, currency_to, ranges[2])
+        return self._make_quote(currency_from, currency_to, ranges, estimated)
+
+    async def _afetch_quote(self, currency_from: str, currency_to: str) -> Quote:
+        """
+        Asynchronous version of `_fetch_quote`.
+        """
+        ranges = self._parse_ranges(
+            await self.client.aget_ranges(currency_from, currency_to)
+        )
+        estimated = await self.client.aget_estimated(
+            currency_from, currency_to, ranges[2]
+        )
+        return self._make_quote(currency_from, currency_to, ranges, estimated)
+
+    def validate_amount(
+        self, amount: Decimal, currency_from: str = "usd", currency_to: str = "btc"
+    ) -> Quote:
+        """
+        Check the amount against the cached quote without calling SimpleSwap.
+
+        Raises:
+            QuoteValidationError: If the amount is outside the allowed range.
+        """
+        quote = self.get_quote(currency_from, currency_to)
+        if not quote.is_valid_amount(amount):
+            raise QuoteValidationError(amount, quote)
+        return quote
+
+    async def avalidate_amount(
+        self, amount: Decimal, currency_from: str = "usd", currency_to: str = "btc"
+    ) -> Quote:
+        """
+        Asynchronous version of `validate_amount`.
+        """
+        quote = await self.aget_quote(currency_from, currency_to)
+        if not quote.is_valid_amount(amount):
+            raise QuoteValidationError(amount, quote)
+        return quote
+
+    @staticmethod
+    def _exchange_data(
+        amount: Decimal, address_to: str, currency_from: str, currency_to: str
+    ) -> Dict[str, Any]:
+        """
+        Build the `create_exchange` payload.
+        """
+        return {
+            "fixed": False,
+            "currency_from": currency_from,
+            "currency_to": currency_to,
+            "amount": float(amount),
+            "address_to": address_to,
+            "extra_id_to": "",
+            "user_refund_address": "",
+            "user_refund_extra_id": "",
+        }
+
+    def create_exchange(
+        self,
+        amount: Decimal,
+        address_to: str,
+        currency_from: str = "usd",
+        currency_to: str = "btc",
+    ) -> Dict[str, Any]:
+        """
+        Validate the amount locally, then create the exchange on SimpleSwap.
+        """
+        self.validate_amount(amount, currency_from, currency_to)
+        return self.client.create_exchange(
+            self._exchange_data(amount, address_to, currency_from, currency_to)
+        )
+
+    async def acreate_exchange(
+        self,
+        amount: Decimal,
+        address_to: str,
+        currency_from: str = "usd",
+        currency_to: str = "btc",
+    ) -> Dict[str, Any]:
+        """
+        Asynchronous version of `create_exchange`.
+        """
+        await self.avalidate_amount(amount, currency_from, currency_to)
+        return await self.client.acreate_exchange(
+            self._exchange_data(amount, address_to, currency_from, currency_to)
+        )
+
+
+@lru_cache(maxsize=1)
+def get_quote_service() -> QuoteService:
+    """
+    Return the process-wide quote service backed by the real SimpleSwap API.
+    """
+    return QuoteService(
+        SimpleSwapClient(settings.SIMPLE_SWAP), ttl=settings.SIMPLE_SWAP_QUOTE_TTL
+    )
@@ -0,0 +1,538 @@
+import asyncio
+import csv
+import json
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from typing import Any, Dict, List
+from unittest import mock
+
+import aiohttp
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from payment.export import filter_orders, iter_orders
+from payment.fakes import FakePaymentProvider, FakeSimpleSwap, FakeStripeCheckout
+from payment.gateways import PaymentGateway
+from payment.http import client_session
+from payment.idempotency import REPLAYED_HEADER, idempotent
+from payment.models import Order, OrderItem, ShippingAddress
+from payment.reconciliation import reconcile_payments
+from payment.simpleswap import QuoteService, QuoteValidationError
+from shop.models import Category, Product
+from test_task_shop.asgi import application
+
+
+class QuoteServiceTest(TestCase):
+    """
+    Test case for the cached SimpleSwap quote service.
+
+    The service runs against `FakeSimpleSwap`, so the tests can count how many
+    upstream calls each operation costs.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up a fake SimpleSwap and a quote service with its own cache.
+        """
+        self.fake = FakeSimpleSwap(latency=0.01)
+        self.service = QuoteService(
+            self.fake, ttl=60, cache_backend=LocMemCache("quotes-test", {})
+        )
+        self.service.cache.clear()
+
+    def test_quote_is_cached(self) -> None:
+        """
+        Tests that repeated quote lookups hit SimpleSwap only once within the TTL.
+        """
+        first = self.service.get_quote()
+        for _ in range(5):
+            self.assertEqual(self.service.get_quote(), first)
+        self.assertEqual(self.fake.count("get_ranges"), 1)
+        self.assertEqual(self.fake.count("get_estimated"), 1)
+        self.assertEqual(first.rate, self.fake.rate)
+
+    def test_concurrent_refresh_is_single_flight(self) -> None:
+        """
+        Tests that concurrent lookups of an expired quote share one refresh.
+        """
+        threads = [threading.Thread(target=self.service.get_quote) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.fake.count("get_ranges"), 1)
+
+    def test_out_of_range_amount_is_rejected_locally(self) -> None:
+        """
+        Tests that invalid amounts never reach `create_exchange`.
+        """
+        with self.assertRaises(QuoteValidationError):
+            self.service.create_exchange(Decimal("1"), "btc-address")
+        with self.assertRaises(QuoteValidationError):
+            self.service.create_exchange(Decimal("100000"), "btc-address")
+        self.assertEqual(self.fake.count("create_exchange"), 0)
+
+        exchange = self.service.create_exchange(Decimal("25.50"), "btc-address")
+        self.assertEqual(exchange["amount_from"], "25.5")
+        self.assertEqual(self.fake.count("create_exchange"), 1)
+
+    def test_async_refresh_is_single_flight(self) -> None:
+        """
+        Tests that concurrent coroutines share one refresh and validate locally.
+        """
+
+        async def run() -> None:
+            await asyncio.gather(*(self.service.aget_quote() for _ in range(8)))
+            with self.assertRaises(QuoteValidationError):
+                await self.service.acreate_exchange(Decimal("1"), "btc-address")
+            await self.service.acreate_exchange(Decimal("25.50"), "btc-address")
+
+        async_to_sync(run)()
+        self.assertEqual(self.fake.count("get_ranges"), 1)
+        self.assertEqual(self.fake.count("create_exchange"), 1)
+
+
+class CheckoutAPITestCase(TestCase):
+    """
+    Base test case posting orders to `v1/api/checkout/` with faked providers.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up a product and patches SimpleSwap and Stripe with fakes.
+        """
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        Product.objects.create(
+            title="Example Product",
+            slug="example-product",
+            price=Decimal("5.00"),
+            is_available=True,
+            category=category,
+        )
+        self.fake = FakeSimpleSwap()
+        service = QuoteService(
+            self.fake, cache_backend=LocMemCache("checkout-quotes-test", {})
+        )
+        service.cache.clear()
+
+        patchers = [
+            mock.patch("api.views.get_quote_service", return_value=service),
+            mock.patch(
+                "stripe.checkout.Session.create_async",
+                side_effect=FakeStripeCheckout().create_async,
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def checkout(self, quantity: int) -> HttpResponse:
+        """
+        Posts a checkout for the given quantity and returns the response.
+        """
+        return self.client.post(
+            "/v1/api/checkout/",
+            {
+                "shipping_address": {
+                    "full_name": "John Smith",
+                    "email": "john@example.com",
+                    "street_address": "Gullweg 18",
+                    "apartment_address": "1",
+                    "city": "Berlin",
+                    "country": "Germany",
+                },
+                "cart_items": [
+                    {
+                        "product_name": "Example Product",
+                        "price": "5.00",
+                        "quantity": quantity,
+                    }
+                ],
+            },
+            content_type="application/json",
+        )
+
+
+class CompleteOrderAPIQuoteTest(CheckoutAPITestCase):
+    """
+    Test case for the quote checks in the `v1/api/checkout/` endpoint.
+    """
+
+    def test_amount_below_minimum_creates_nothing(self) -> None:
+        """
+        Tests that an order below the SimpleSwap minimum is rejected before any writes.
+        """
+        response = self.checkout(quantity=1)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.fake.count("create_exchange"), 0)
+
+    def test_valid_amount_creates_exchange_after_order(self) -> None:
+        """
+        Tests that a valid order is stored and a single exchange is created.
+        """
+        response = self.checkout(quantity=4)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().amount, Decimal("20.00"))
+        self.assertEqual(self.fake.count("create_exchange"), 1)
+        self.assertEqual(
+            response.json()["api_test_url"], self.fake.exchanges[0]["redirect_url"]
+        )
+
+
+class CompleteOrderViewTest(CheckoutAPITestCase):
+    """
+    Test case for the asynchronous `payment/complete_order/` view.
+    """
+
+    def complete_order(self, type_payment: str) -> HttpResponse:
+        """
+        Adds two products to the cart and completes the order.
+        """
+        product = Product.objects.get()
+        self.client.post(
+            reverse("cart:add_to_cart"),
+            {"action": "post", "product_id": product.id, "product_qty": 2},
+        )
+        return self.client.post(
+            reverse("payment:complete_order"),
+            {
+                "type_payment": type_payment,
+                "full_name": "John Smith",
+                "email": "john@example.com",
+                "street_address": "Gullweg 18",
+                "apartment_address": "1",
+                "city": "Berlin",
+                "country": "Germany",
+            },
+        )
+
+    def test_stripe_checkout_redirects_to_session(self) -> None:
+        """
+        Tests that the cart becomes an order linked to the Stripe session.
+        """
+        response = self.complete_order("stripe-payment")
+        order = Order.objects.get()
+        self.assertRedirects(
+            response,
+            f"https://stripe.example/pay/{order.payment_reference}",
+            status_code=302,
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(order.payment_provider, Order.STRIPE)
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual(order.amount, Decimal("10.00"))
+
+    def test_provider_session_closed_after_request(self) -> None:
+        """
+        Tests that the HTTP session opened for BitPay is closed once the
+        request is served, as its event loop ends with the request.
+        """
+        sessions: List[aiohttp.ClientSession] = []
+        init = aiohttp.ClientSession.__init__
+
+        def record(session: aiohttp.ClientSession, *args: Any, **kwargs: Any) -> None:
+            init(session, *args, **kwargs)
+            sessions.append(session)
+
+        with (
+            mock.patch.object(
+                aiohttp.ClientSession, "__init__", autospec=True, side_effect=record
+            ),
+            mock.patch.object(
+                aiohttp.ClientSession,
+                "_request",
+                side_effect=aiohttp.ClientConnectionError("unreachable"),
+            ),
+        ):
+            response = self.complete_order("bitpay")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(sessions), 1)
+        self.assertTrue(sessions[0].closed)
+
+    def test_asgi_lifespan_keeps_session(self) -> None:
+        """
+        Tests that the session opened on ASGI startup serves every request
+        on the loop and is closed on shutdown.
+        """
+
+        async def serve() -> None:
+            messages: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+            sent: List[Dict[str, Any]] = []
+
+            async def send(message: Dict[str, Any]) -> None:
+                sent.append(message)
+
+            server = asyncio.create_task(
+                application({"type": "lifespan"}, messages.get, send)
+            )
+            await messages.put({"type": "lifespan.startup"})
+            while not sent:
+                await asyncio.sleep(0)
+            async with client_session() as first, client_session() as second:
+                self.assertIs(first, second)
+            self.assertFalse(first.closed)
+            await messages.put({"type": "lifespan.shutdown"})
+            await server
+            self.assertTrue(first.closed)
+            self.assertEqual(
+                [message["type"] for message in sent],
+                ["lifespan.startup.complete", "lifespan.shutdown.complete"],
+            )
+
+        async_to_sync(serve)()
+
+
+class IdempotencyTest(CheckoutAPITestCase):
+    """
+    Test case for idempotency keys on the checkout endpoints.
+    """
+
+    def setUp(self) -> None:
+        """
+        Reuses the checkout fixtures and clears stored idempotency responses.
+        """
+        super().setUp()
+        cache.clear()
+
+    def checkout_with_key(self, key: str, quantity: int = 4) -> HttpResponse:
+        """
+        Posts a checkout carrying the given `Idempotency-Key` header.
+        """
+        with mock.patch.object(self.client, "defaults", {"HTTP_IDEMPOTENCY_KEY": key}):
+            return self.checkout(quantity=quantity)
+
+    def test_retry_replays_first_response(self) -> None:
+        """
+        Tests that a retried checkout creates one order and one exchange.
+        """
+        first = self.checkout_with_key("retry-key")
+        second = self.checkout_with_key("retry-key")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second[REPLAYED_HEADER], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.fake.count("create_exchange"), 1)
+
+    def test_key_reused_with_different_body(self) -> None:
+        """
+        Tests that a key reused for a different order is rejected.
+        """
+        self.checkout_with_key("reused-key", quantity=4)
+        response = self.checkout_with_key("reused-key", quantity=5)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_concurrent_duplicates_wait_for_first_request(self) -> None:
+        """
+        Tests that duplicates arriving while the first request runs share its result.
+        """
+        calls: List[int] = []
+
+        @idempotent
+        def slow_view(request: HttpRequest) -> HttpResponse:
+            calls.append(1)
+            time.sleep(0.2)
+            return JsonResponse({"order": len(calls)}, status=201)
+
+        responses: List[HttpResponse] = []
+
+        def send() -> None:
+            request = RequestFactory().post(
+                "/payment/complete_order/", {"idempotency_key": "concurrent-key"}
+            )
+            request.user = AnonymousUser()
+            responses.append(slow_view(request))
+
+        threads = [threading.Thread(target=send) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({response.status_code for response in responses}, {201})
+        self.assertEqual(
+            sum(response.has_header(REPLAYED_HEADER) for response in responses), 4
+        )
+
+
+class OrderExportTest(TestCase):
+    """
+    Test case for the streaming order export command and staff view.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up two orders, one paid with two items and one unpaid without items.
+        """
+        category = Category.objects.create(name="Category 1", slug="category-1")
+        product = Product.objects.create(
+            title="Example Product", slug="example-product", category=category
+        )
+        address = ShippingAddress.objects.create(
+            full_name="John Smith",
+            email="john@example.com",
+            street_address="Gullweg 18",
+            apartment_address="1",
+            city="Berlin",
+            country="Germany",
+        )
+        self.paid = Order.objects.create(
+            shipping_address=address, amount=Decimal("30.00"), is_paid=True
+        )
+        for quantity in (1, 2):
+            OrderItem.objects.create(
+                order=self.paid, product=product, price="10.00", quantity=quantity
+            )
+        self.unpaid = Order.objects.create(amount=Decimal("0.00"))
+
+    def test_csv_has_one_row_per_item(self) -> None:
+        """
+        Tests that the CSV export writes a row per item across keyset pages.
+        """
+        output = StringIO()
+        call_command("export_orders", "--chunk-size", "1", stdout=output)
+        rows = list(csv.DictReader(StringIO(output.getvalue())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            [row["order_id"] for row in rows],
+            [str(self.paid.id), str(self.paid.id), str(self.unpaid.id)],
+        )
+        self.assertEqual(rows[0]["shipping_city"], "Berlin")
+        self.assertEqual(rows[0]["item_product_title"], "Example Product")
+        self.assertEqual(rows[2]["item_id"], "")
+
+    def test_export_queries_do_not_grow_with_orders(self) -> None:
+        """
+        Tests that each page of orders costs a constant number of queries.
+        """
+        queryset = filter_orders()
+        with self.assertNumQueries(3):
+            orders = list(iter_orders(queryset, chunk_size=10))
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(len(orders[0]["items"]), 2)
+
+    def test_jsonl_view_filters_paid_orders(self) -> None:
+        """
+        Tests that the staff view streams only the requested paid orders.
+        """
+        url = reverse("payment:export_orders")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url, {"format": "jsonl", "paid": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        order = json.loads(lines[0])
+        self.assertEqual(order["id"], self.paid.id)
+        self.assertEqual(order["amount"], "30.00")
+        self.assertEqual(len(order["items"]), 2)
+
+
+class ReconcilePaymentsTest(TestCase):
+    """
+    Test case for reconciling unpaid orders against fake payment providers.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up unpaid Stripe and BitPay orders, two of which were paid upstream.
+        """
+        self.orders = [
+            Order.objects.create(
+                amount=Decimal("10.00"),
+                payment_provider=provider,
+                payment_reference=f"{provider}-{index}",
+            )
+            for index, provider in enumerate([Order.STRIPE, Order.BITPAY] * 3)
+        ]
+        self.no_reference = Order.objects.create(amount=Decimal("10.00"))
+        self.stripe = FakePaymentProvider(paid_references={"stripe-0"}, latency=0.01)
+        self.bitpay = FakePaymentProvider(
+            paid_references={"bitpay-3"}, failing_references={"bitpay-5"}
+        )
+        self.stripe.unreachable_references = {"stripe-4"}
+        self.gateway = PaymentGateway(
+            {Order.STRIPE: self.stripe, Order.BITPAY: self.bitpay}, max_workers=2
+        )
+
+    def test_marks_orders_paid_at_provider(self) -> None:
+        """
+        Tests that mismatched orders are bulk updated and reported.
+        """
+        report = reconcile_payments(self.gateway, chunk_size=4)
+        paid_ids = [self.orders[0].id, self.orders[3].id]
+
+        self.assertEqual(report.checked, 6)
+        self.assertEqual(sorted(report.mismatched), paid_ids)
+        self.assertEqual(sorted(report.updated), paid_ids)
+        self.assertEqual(report.unverifiable, [self.no_reference.id])
+        self.assertEqual(sorted(report.errors), [self.orders[4].id, self.orders[5].id])
+        self.assertIn("ConnectionError", report.errors[self.orders[4].id])
+        self.assertEqual(
+            sorted(Order.objects.filter(is_paid=True).values_list("id", flat=True)),
+            paid_ids,
+        )
+        self.assertLessEqual(self.stripe.max_in_flight, 2)
+
+    def test_dry_run_only_reports(self) -> None:
+        """
+        Tests that a dry run leaves every order unpaid.
+        """
+        report = reconcile_payments(self.gateway, dry_run=True)
+        self.assertEqual(len(report.mismatched), 2)
+        self.assertEqual(report.updated, [])
+        self.assertFalse(Order.objects.filter(is_paid=True).exists())
+
+
+class WebhookTest(TestCase):
+    """
+    Test case for the asynchronous payment provider webhooks.
+    """
+
+    def setUp(self) -> None:
+        """
+        Sets up an unpaid order.
+        """
+        self.order = Order.objects.create(amount=Decimal("10.00"))
+
+    def test_bitpay_paid_event_marks_order(self) -> None:
+        """
+        Tests that a paid BitPay event marks the order and unknown ids get 404.
+        """
+        url = reverse("payment:webhook-bitpat")
+        payload = {"data": {"status": "paid", "orderId": self.order.id}}
+        response = self.client.post(url, payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_paid)
+
+        payload["data"]["orderId"] = self.order.id + 1
+        response = self.client.post(url, payload, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_stripe_event_requires_signature(self) -> None:
+        """
+        Tests that unsigned Stripe events are rejected.
+        """
+        response = self.client.post(
+            reverse("payment:webhook-stripe"),
+            {"type": "checkout.session.completed"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
@@ -13,6 +13,7 @@ urlpatterns = [
     path("checkout/", views.checkout, name="checkout"),
     path("pay_with_crypo", views.create_invoice_bit_pay, name="pay_with_crypo"),
     path("excange", views.create_exchange_request, name="exchange"),
+    path("export/", views.export_orders_view, name="export_orders"),
     path("webhook-stripe/", stripe_webhook, name="webhook-stripe"),
     path("webhook-bitpay/", bitpay_webhook, name="webhook-bitpat"),
 ]
@@ -1,16 +1,29 @@
+import asyncio
+import datetime
+import uuid
 from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
+import aiohttp
 import stripe
+from asgiref.sync import sync_to_async
 from cart.cart import Cart
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.utils.dateparse import parse_date
+from payment.export import EXPORT_FORMATS, export_orders, filter_orders
 from payment.forms import ShippingForm
+from payment.http import client_session
+from payment.idempotency import idempotent
 from payment.models import Order, OrderItem, ShippingAddress
+from payment.simpleswap import QuoteValidationError, SimpleSwapError, get_quote_service
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -51,52 +64,97 @@ def checkout(request: HttpRequest) -> HttpResponse:
         else None
     )
     shipping_form = ShippingForm(instance=shipping_address)
-    return render(request, "payment/checkout.html", {"shipping_address": shipping_form})
+    context = {"shipping_address": shipping_form, "idempotency_key": uuid.uuid4().hex}
+    return render(request, "payment/checkout.html", context)
 
 
-def complete_order(request: HttpRequest) -> HttpResponse:
+def _cart_contents(request: HttpRequest) -> Tuple[List[Dict[str, Any]], Decimal]:
     """
-    Completes the order creation process. If payment is successful,
-    redirects to the payment success page.
+    Read the session cart items and total price.
     """
-    if request.method == "POST":
-        form = ShippingForm(request.POST)
-        if form.is_valid():
-            shipping_address = form.save(commit=False)
-            user = request.user if request.user.is_authenticated else None
-            type_payment = request.POST.get("type_payment")
+    cart = Cart(request)
+    return list(cart), cart.get_total_price()
 
-            if user:
-                ShippingAddress.objects.filter(user=request.user).first().delete()
 
-            shipping_address.user = user
-            shipping_address.save()
-
-        cart = Cart(request)
-        total_price = cart.get_total_price()
+def _create_order(
+    request: HttpRequest,
+    user: Optional[User],
+    items: List[Dict[str, Any]],
+    total_price: Decimal,
+) -> Tuple[Optional[Order], ShippingForm]:
+    """
+    Save the shipping address and create the order with its items.
 
-        session_data = {
-            "mode": "payment",
-            "success_url": request.build_absolute_uri(
-                reverse("payment:payment_success")
-            ),
-            "cancel_url": request.build_absolute_uri(reverse("payment:payment_failed")),
-            "line_items": [],
-        }
+    Returns no order if the shipping form is invalid.
+    """
+    form = ShippingForm(request.POST)
+    if not form.is_valid():
+        return None, form
+
+    with transaction.atomic():
+        shipping_address = form.save(commit=False)
+        if user:
+            previous = ShippingAddress.objects.filter(user=user).first()
+            if previous is not None:
+                previous.delete()
+        shipping_address.user = user
+        shipping_address.save()
 
         order = Order.objects.create(
             user=user, shipping_address=shipping_address, amount=total_price
         )
-
-        for item in cart:
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create(
+            OrderItem(
                 order=order,
                 product=item["product"],
                 price=item["price"],
                 quantity=item["quantity"],
                 user=user,
             )
-            session_data["line_items"].append(
+            for item in items
+        )
+    return order, form
+
+
+@idempotent
+async def complete_order(request: HttpRequest) -> HttpResponse:
+    """
+    Completes the order creation process. If payment is successful,
+    redirects to the payment success page.
+
+    The view is asynchronous: Stripe, BitPay and SimpleSwap are called without
+    holding a thread, and only the database writes run in a worker thread.
+
+    Repeated submissions with the same `idempotency_key` replay the first
+    response instead of creating another order and payment session.
+    """
+    if request.method == "POST":
+        type_payment = request.POST.get("type_payment") or ""
+        items, total_price = await sync_to_async(_cart_contents)(request)
+
+        if "api_task" in type_payment:
+            # Reject amounts SimpleSwap would refuse before writing anything.
+            try:
+                await get_quote_service().avalidate_amount(total_price)
+            except QuoteValidationError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            except SimpleSwapError as e:
+                return JsonResponse({"error": str(e)}, status=e.status_code)
+
+        user = await request.auser()
+        order, form = await sync_to_async(_create_order)(
+            request, user if user.is_authenticated else None, items, total_price
+        )
+        if order is None:
+            return JsonResponse({"errors": form.errors}, status=400)
+
+        session_data = {
+            "mode": "payment",
+            "success_url": request.build_absolute_uri(
+                reverse("payment:payment_success")
+            ),
+            "cancel_url": request.build_absolute_uri(reverse("payment:payment_failed")),
+            "line_items": [
                 {
                     "price_data": {
                         "unit_amount": int(item["price"] * Decimal(100)),
@@ -107,18 +165,23 @@ def complete_order(request: HttpRequest) -> HttpResponse:
                     },
                     "quantity": item["quantity"],
                 }
-            )
+                for item in items
+            ],
+        }
 
         if "stripe-payment" in type_payment:
             session_data["client_reference_id"] = order.id
-            session = stripe.checkout.Session.create(**session_data)
+            session = await stripe.checkout.Session.create_async(**session_data)
+            await Order.objects.filter(id=order.id).aupdate(
+                payment_provider=Order.STRIPE, payment_reference=session.id
+            )
             return redirect(session.url, code=303)
         if "api_task" in type_payment:
-            return create_exchange_request(session_data)
-        return create_invoice_bit_pay(session_data, order.id)
+            return await create_exchange_request(session_data)
+        return await create_invoice_bit_pay(session_data, order.id)
 
 
-def create_invoice_bit_pay(session_data: dict, order_id: int) -> HttpResponse:
+async def create_invoice_bit_pay(session_data: dict, order_id: int) -> HttpResponse:
     """
     Creates a BitPay invoice and provides the user with a link for payment.
     """
@@ -150,77 +213,66 @@ def create_invoice_bit_pay(session_data: dict, order_id: int) -> HttpResponse:
         "redirectURL": "http://127.0.0.1:4421/payment/payment-success/",
     }
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # Ensures we capture HTTP errors
-        data = response.json()
+        async with client_session() as session:
+            async with session.post(url, json=payload) as response:
+                response.raise_for_status()  # Ensures we capture HTTP errors
+                data = await response.json()
         payment_url = data["data"]["url"]
+        await Order.objects.filter(id=order_id).aupdate(
+            payment_provider=Order.BITPAY, payment_reference=data["data"].get("id", "")
+        )
         return HttpResponse(
             f"Your link for pay: {payment_url}", content_type="text/html"
         )
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         error_message = f"HTTP error occurred: {e}"
         print(error_message)
         return JsonResponse({"error": error_message}, status=500)
 
 
-def create_exchange_request(session_data: dict) -> HttpResponse:
+async def create_exchange_request(session_data: dict) -> HttpResponse:
     """
     Sends a request to create a USD-to-BTC exchange through the SimpleSwap API.
 
+    The amount is checked against the cached SimpleSwap quote first, so
+    out-of-range orders are rejected without an upstream round-trip.
+
     Parameters:
     - session_data (dict): Dictionary containing order data.
       `session_data` is expected to include a 'line_items' key, which holds
       a list of items, each with a 'price_data' -> 'unit_amount' key to calculate the total amount.
     """
-
-    api_key = settings.SIMPLE_SWAP
-    btc_address = settings.BTC_ADDRESS
-    url = "https://api.simpleswap.io/create_exchange"
-
-    params = {
-        "api_key": api_key,
-    }
-
-    total = sum(
-        [item["price_data"]["unit_amount"] for item in session_data["line_items"]]
-    )
-    total /= 100
-
-    data = {
-        "fixed": False,
-        "currency_from": "usd",
-        "currency_to": "btc",
-        "amount": total,
-        "address_to": btc_address,
-        "extra_id_to": "",
-        "user_refund_address": "",
-        "user_refund_extra_id": "",
-    }
+    total = Decimal(
+        sum(
+            item["price_data"]["unit_amount"] * item["quantity"]
+            for item in session_data["line_items"]
+        )
+    ) / Decimal(100)
 
     try:
-        response = requests.post(url, json=data, params=params)
-
-        if response.status_code == 200:
-            exchange_data = response.json()
-            redirect_url = exchange_data.get("redirect_url")
-            if redirect_url:
-                return redirect(redirect_url)
-            else:
-                return JsonResponse(
-                    {"error": "Missing redirect URL in response"}, status=500
-                )
-
-        else:
-            return JsonResponse(
-                {
-                    "error": "Failed to send request",
-                    "status_code": response.status_code,
-                },
-                status=response.status_code,
-            )
+        exchange_data = await get_quote_service().acreate_exchange(
+            total, settings.BTC_ADDRESS
+        )
+    except QuoteValidationError as e:
+        return JsonResponse(
+            {
+                "error": str(e),
+                "min_amount": str(e.quote.min_amount),
+                "max_amount": (
+                    str(e.quote.max_amount) if e.quote.max_amount is not None else None
+                ),
+            },
+            status=400,
+        )
+    except SimpleSwapError as e:
+        return JsonResponse(
+            {"error": str(e), "status_code": e.status_code}, status=e.status_code
+        )
 
-    except requests.exceptions.RequestException as e:
-        return JsonResponse({"error": str(e)}, status=500)
+    redirect_url = exchange_data.get("redirect_url")
+    if redirect_url:
+        return redirect(redirect_url)
+    return JsonResponse({"error": "Missing redirect URL in response"}, status=500)
 
 
 def payment_success(request: HttpRequest) -> HttpResponse:
@@ -236,3 +288,42 @@ def payment_failed(request: HttpRequest) -> HttpResponse:
     Renders the payment failed page if the payment was unsuccessful.
     """
     return render(request, "payment/payment-failed.html")
+
+
+@staff_member_required
+def export_orders_view(request: HttpRequest) -> HttpResponse:
+    """
+    Streams the order export for accounting as CSV or JSON Lines.
+
+    Accepts `format` (csv or jsonl), `since` and `until` (YYYY-MM-DD) and
+    `paid` (true or false) query parameters.
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": "Unsupported export format"}, status=400)
+
+    dates: Dict[str, Optional[datetime.date]] = {}
+    for name in ("since", "until"):
+        value = request.GET.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return JsonResponse(
+                {"error": f"'{name}' must be a date in YYYY-MM-DD format"}, status=400
+            )
+
+    paid = request.GET.get("paid")
+    queryset = filter_orders(
+        date_from=dates["since"],
+        date_to=dates["until"],
+        is_paid=None if paid is None else paid.lower() in ("1", "true", "yes"),
+    )
+
+    content_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(
+        export_orders(export_format, queryset), content_type=content_type
+    )
+    response["Content-Disposition"] = f'attachment; filename="orders.{export_format}"'
+    return response
@@ -2,6 +2,7 @@ import json
 from typing import Any, Dict
 
 import stripe
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -9,8 +10,18 @@ from payment.models import Order
 from stripe import SignatureVerificationError
 
 
+async def _mark_order_paid(order_id: Any) -> HttpResponse:
+    """
+    Mark the order as paid, answering 404 if it does not exist.
+    """
+    if not await Order.objects.filter(id=order_id).aexists():
+        return HttpResponse(status=404)
+    await sync_to_async(Order.mark_paid)([order_id])
+    return HttpResponse(status=200)
+
+
 @csrf_exempt
-def stripe_webhook(request: HttpRequest) -> HttpResponse:
+async def stripe_webhook(request: HttpRequest) -> HttpResponse:
     """
     Handle Stripe webhook events for payment processing, specifically listening to
     'checkout.session.completed' events to mark orders as paid.
@@ -39,19 +50,13 @@ def stripe_webhook(request: HttpRequest) -> HttpResponse:
         if session.get("mode") == "payment" and session.get("payment_status") == "paid":
             order_id = session.get("client_reference_id")
             if order_id:
-                try:
-                    order = Order.objects.get(id=order_id)
-                    order.is_paid = True
-                    order.save()
-                except Order.DoesNotExist:
-                    # Order does not exist; return a 404 response.
-                    return HttpResponse(status=404)
+                return await _mark_order_paid(order_id)
 
     return HttpResponse(status=200)
 
 
 @csrf_exempt
-def bitpay_webhook(request: HttpRequest) -> HttpResponse:
+async def bitpay_webhook(request: HttpRequest) -> HttpResponse:
     """
     Handles BitPay webhook events, updating the order status if payment is confirmed.
     """
@@ -61,11 +66,6 @@ def bitpay_webhook(request: HttpRequest) -> HttpResponse:
     if status == "paid":
         order_id = data["data"].get("orderId")
         if order_id:
-            try:
-                order = Order.objects.get(id=order_id)
-                order.is_paid = True
-                order.save()
-            except Order.DoesNotExist:
-                return HttpResponse(status=404)
+            return await _mark_order_paid(order_id)
 
     return HttpResponse(status=200)
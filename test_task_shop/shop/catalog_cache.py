@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = "catalog:version"
+# Set while read replicas may still serve the catalog from before a change
+CATALOG_LAGGING_KEY = "catalog:replicas_lagging_until"
+
+_state = threading.local()
+
+
+def get_catalog_version() -> int:
+    """
+    Return the current catalog version used to key cached catalog data.
+    """
+    return cache.get_or_set(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def catalog_cache_key(*parts: Any) -> str:
+    """
+    Build a cache key that is invalidated whenever the catalog changes.
+    """
+    return ":".join(["catalog", str(get_catalog_version()), *map(str, parts)])
+
+
+def get_cached(*parts: Any) -> Any:
+    """
+    Return the cached catalog value stored under the key parts, if any.
+    """
+    return cache.get(catalog_cache_key(*parts))
+
+
+def set_cached(value: Any, *parts: Any) -> None:
+    """
+    Cache a catalog value for `CATALOG_CACHE_TTL` seconds.
+
+    Within the replica lag window after a change, the value may have been
+    read from a replica that missed the change, so it is only kept until
+    the window ends.
+    """
+    timeout = settings.CATALOG_CACHE_TTL
+    lagging_until = (
+        cache.get(CATALOG_LAGGING_KEY) if settings.DATABASE_REPLICAS else None
+    )
+    if lagging_until is not None:
+        timeout = min(timeout, max(1, math.ceil(lagging_until - time.time())))
+    cache.set(catalog_cache_key(*parts), value, timeout)
+
+
+def _increment_version() -> None:
+    """
+    Move to a new catalog version, orphaning every cached catalog entry.
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 2, timeout=None)
+    if settings.DATABASE_REPLICAS:
+        window = settings.DATABASE_REPLICA_LAG_WINDOW
+        cache.set(CATALOG_LAGGING_KEY, time.time() + window, math.ceil(window))
+
+
+def bump_catalog_version() -> None:
+    """
+    Invalidate cached catalog data once the current transaction commits.
+
+    Inside `batched_invalidation()` the bump is deferred until the block exits,
+    so a batch of changes invalidates the caches only once.
+    """
+    if getattr(_state, "depth", 0):
+        _state.pending = True
+        return
+    transaction.on_commit(_increment_version)
+
+
+@contextmanager
+def batched_invalidation() -> Iterator[None]:
+    """
+    Coalesce every catalog invalidation inside the block into a single bump.
+    """
+    _state.depth = getattr(_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if not _state.depth and getattr(_state, "pending", False):
+            _state.pending = False
+            transaction.on_commit(_increment_version)
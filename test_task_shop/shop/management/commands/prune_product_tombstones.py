@@ -0,0 +1,34 @@
+import argparse
+import datetime
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from shop.models import ProductTombstone
+
+
+class Command(BaseCommand):
+    """
+    Delete product tombstones that catalog mirrors no longer need.
+    """
+
+    help = (
+        "Delete product tombstones older than the sync retention window. "
+        "Mirrors with older sync tokens receive the full catalog instead."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.CATALOG_TOMBSTONE_RETENTION_DAYS,
+            help="Keep tombstones created within this many days.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["days"] < 1:
+            raise CommandError("--days must be positive")
+        before = timezone.now() - datetime.timedelta(days=options["days"])
+        deleted = ProductTombstone.prune(before)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones."))
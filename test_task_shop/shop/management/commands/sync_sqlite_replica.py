@@ -0,0 +1,64 @@
+import argparse
+import sqlite3
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from test_task_shop.database import SQLITE_ENGINE
+
+
+class Command(BaseCommand):
+    """
+    Copy the SQLite primary into SQLite stand-in replicas.
+    """
+
+    help = (
+        "Copy the SQLite primary database into every SQLite replica of "
+        "DATABASE_REPLICA_URLS with SQLite's online backup, once or every "
+        "--interval seconds. Lets the replica router be tried locally; the "
+        "interval plays the part of the replication lag."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Seconds between copies; copy once when 0.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["interval"] < 0:
+            raise CommandError("--interval must not be negative")
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replicas = [
+            connections[alias].settings_dict["NAME"]
+            for alias in settings.DATABASE_REPLICAS
+            if connections[alias].settings_dict["ENGINE"] == SQLITE_ENGINE
+        ]
+        if primary["ENGINE"] != SQLITE_ENGINE or not replicas:
+            raise CommandError(
+                "Needs a SQLite primary and SQLite replicas in DATABASE_REPLICA_URLS"
+            )
+
+        while True:
+            started = time.monotonic()
+            source = sqlite3.connect(primary["NAME"])
+            try:
+                for name in replicas:
+                    target = sqlite3.connect(name)
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(
+                f"Copied to {len(replicas)} replicas "
+                f"in {(time.monotonic() - started) * 1000:.0f}ms"
+            )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -1,3 +1,4 @@
+import datetime
 from decimal import Decimal
 from typing import Any
 
@@ -5,8 +6,12 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.db.models import QuerySet
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
+# Condition of the partial indexes that serve the public catalog.
+AVAILABLE = models.Q(is_available=True)
+
 
 class ProductManage(models.Manager):
     """
@@ -108,6 +113,54 @@ class Product(models.Model):
 
     class Meta:
         ordering = ["-create_at"]
+        # Back the product API filters: listings only cover available
+        # products, so the indexes are partial, and are ordered by recency or
+        # price, optionally narrowed by category, brand or discount.
+        indexes = [
+            models.Index(
+                fields=["create_at", "id"],
+                condition=AVAILABLE,
+                name="product_avail_created_idx",
+            ),
+            models.Index(
+                fields=["price", "id"],
+                condition=AVAILABLE,
+                name="product_avail_price_idx",
+            ),
+            models.Index(
+                fields=["category", "create_at", "id"],
+                condition=AVAILABLE,
+                name="product_category_created_idx",
+            ),
+            models.Index(
+                fields=["category", "price", "id"],
+                condition=AVAILABLE,
+                name="product_category_price_idx",
+            ),
+            models.Index(
+                fields=["brand", "create_at", "id"],
+                condition=AVAILABLE,
+                name="product_brand_created_idx",
+            ),
+            models.Index(
+                fields=["brand", "price", "id"],
+                condition=AVAILABLE,
+                name="product_brand_price_idx",
+            ),
+            models.Index(
+                fields=["create_at", "id"],
+                condition=AVAILABLE & models.Q(discount__gt=0),
+                name="product_discount_created_idx",
+            ),
+            models.Index(
+                fields=["price", "id"],
+                condition=AVAILABLE & models.Q(discount__gt=0),
+                name="product_discount_price_idx",
+            ),
+            # Backs the delta sync, which also reads products that became
+            # unavailable, so this one covers every row.
+            models.Index(fields=["update_at", "id"], name="product_updated_idx"),
+        ]
 
     def get_discounted_price(self) -> Decimal:
         """
@@ -131,3 +184,29 @@ class Product(models.Model):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+
+
+class ProductTombstone(models.Model):
+    """
+    Records a deleted product so catalog mirrors can drop it on their next sync.
+    """
+
+    product_id = models.PositiveBigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["deleted_at"]
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the tombstone.
+        """
+        return f"Product {self.product_id} deleted at {self.deleted_at}"
+
+    @classmethod
+    def prune(cls, before: datetime.datetime) -> int:
+        """
+        Delete tombstones older than `before` and return how many were removed.
+        """
+        deleted, _ = cls.objects.filter(deleted_at__lt=before).delete()
+        return deleted
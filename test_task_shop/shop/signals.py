@@ -0,0 +1,27 @@
+from typing import Any
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from shop.catalog_cache import bump_catalog_version
+from shop.models import Category, Product, ProductTombstone
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender: Any, **kwargs: Any) -> None:
+    """
+    Signal handler that invalidates cached catalog data when products
+    or categories change.
+    """
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Product)
+def record_tombstone(sender: Any, instance: Product, **kwargs: Any) -> None:
+    """
+    Signal handler that leaves a tombstone for deleted products so catalog
+    mirrors syncing through `products/changes/` learn about the deletion.
+    """
+    ProductTombstone.objects.create(product_id=instance.pk)
@@ -1,8 +1,9 @@
 from typing import Any, Dict
 
+from asgiref.sync import sync_to_async
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import aget_object_or_404, render
 from django.views.generic import ListView
 
 from .models import Category, Product
@@ -23,31 +24,36 @@ class ProductListView(ListView):
         Retrieve the queryset of available products, with optional sorting by price.
         """
         queryset = Product.available.all()
-        sort_order = self.request.GET.get('sort', 'asc')
+        sort_order = self.request.GET.get("sort", "asc")
 
-        if sort_order == 'desc':
-            queryset = queryset.order_by('-price')
+        if sort_order == "desc":
+            queryset = queryset.order_by("-price")
         else:
-            queryset = queryset.order_by('price')
+            queryset = queryset.order_by("price")
 
         return queryset
 
 
-def product_detail(request: HttpRequest, slug: str) -> HttpResponse:
+async def product_detail(request: HttpRequest, slug: str) -> HttpResponse:
     """
     View to display the details of a specific product.
+
+    The products are read with the async ORM; the template is rendered in a
+    worker thread because the context processors query the database.
     """
-    product = get_object_or_404(Product, slug=slug)
-    random_products = Product.available.order_by("?")[:4]
+    product = await aget_object_or_404(Product, slug=slug)
+    random_products = [item async for item in Product.available.order_by("?")[:4]]
     context: Dict[str, Any] = {"product": product, "products": random_products}
-    return render(request, "shop/product_detail.html", context)
+    return await sync_to_async(render)(request, "shop/product_detail.html", context)
 
 
-def category_list(request: HttpRequest, slug: str) -> HttpResponse:
+async def category_list(request: HttpRequest, slug: str) -> HttpResponse:
     """
     View to display the products in a specific category.
+
+    Reads like `product_detail`: async ORM queries, rendering in a thread.
     """
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.available.filter(category=category)
+    category = await aget_object_or_404(Category, slug=slug)
+    products = [item async for item in Product.available.filter(category=category)]
     context = {"category": category, "products": products}
-    return render(request, "shop/category_list.html", context)
+    return await sync_to_async(render)(request, "shop/category_list.html", context)
@@ -8,9 +8,38 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
+from typing import Any, Awaitable, Callable, Dict
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_task_shop.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+async def lifespan(receive: Receive, send: Send) -> None:
+    """
+    Open the pooled payment provider session on startup and close it on
+    shutdown; Django itself only serves HTTP and websocket scopes.
+    """
+    from payment.http import close_client_session, open_client_session
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await open_client_session()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_client_session()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
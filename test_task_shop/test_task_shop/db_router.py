@@ -0,0 +1,91 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Type
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Model
+
+
+@dataclass
+class RoutingState:
+    """
+    Routing of the reads inside a `replica_reads()` block.
+
+    `wrote` is set by the first write, after which every read goes to the
+    primary so the block sees its own changes.
+    """
+
+    pinned: bool = False
+    wrote: bool = False
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar("replica_routing", default=None)
+
+
+def replica_alias() -> str:
+    """
+    Pick a replica for a read, or the primary when none is configured.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return DEFAULT_DB_ALIAS
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+@contextmanager
+def replica_reads(pinned: bool = False) -> Iterator[RoutingState]:
+    """
+    Let the catalog reads inside the block go to a replica.
+
+    `ReplicaRoutingMiddleware` opens this block around every request.
+    Outside of it, for example in management commands, every read goes to
+    the primary. With `pinned`, reads stay on the primary inside the block
+    too.
+    """
+    state = RoutingState(pinned=pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends catalog reads to the read replicas and everything else to the primary.
+
+    Reads of models in `DATABASE_REPLICA_APPS` go to a random alias of
+    `DATABASE_REPLICAS` inside `replica_reads()`, unless the block was
+    pinned, has already written, or the primary is inside a transaction.
+    Reads that must see committed data at once, such as sessions, carts,
+    orders and the payment webhooks, keep using the primary.
+    """
+
+    def db_for_read(self, model: Type[Model], **hints: Any) -> Optional[str]:
+        state = _state.get()
+        if (
+            state is None
+            or state.pinned
+            or state.wrote
+            or not settings.DATABASE_REPLICAS
+            or model._meta.app_label not in settings.DATABASE_REPLICA_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return replica_alias()
+
+    def db_for_write(self, model: Type[Model], **hints: Any) -> str:
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints: Any) -> bool:
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db: str, app_label: str, **hints: Any) -> bool:
+        # Replicas get the schema from the primary.
+        return db not in settings.DATABASE_REPLICAS
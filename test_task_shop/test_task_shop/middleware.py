@@ -0,0 +1,368 @@
+import gzip
+import hashlib
+import math
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+from test_task_shop.db_router import replica_reads
+from test_task_shop.throttling import (
+    check_rule,
+    client_ident,
+    load_rules,
+    match_rule,
+    shed_priority,
+)
+
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(json|javascript|xml|x-ndjson)|image/svg\+xml)"
+)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick `br` or `gzip` from an Accept-Encoding header, preferring brotli.
+
+    Encodings listed with `q=0` are refused; `*` accepts both.
+    """
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a body with the given encoding at the configured level.
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with brotli or gzip, whichever the client prefers.
+
+    Only non-streaming 200 responses under `COMPRESSION_PATH_PREFIXES` whose
+    body is at least `COMPRESSION_MIN_SIZE` bytes and has a textual content
+    type are compressed; HTML pages are left alone so that CSRF tokens are
+    not exposed to BREACH.
+
+    Compressing is far slower than serving cached bytes, so compressed bodies
+    of cacheable GET responses are stored in the cache keyed by a hash of the
+    uncompressed body: repeated catalog responses are compressed once.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        # Stay async under ASGI so async views do not fall back to a thread.
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Async version of `__call__`.
+        """
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(
+        self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        """
+        Compress the response body if the request and response allow it.
+        """
+        if not self._should_compress(request, response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        body = response.content
+        if self._is_cacheable(request, response):
+            digest = hashlib.blake2b(body, digest_size=20).hexdigest()
+            key = f"compressed:{encoding}:{digest}"
+            compressed = cache.get(key)
+            if compressed is None:
+                compressed = compress(body, encoding)
+                cache.set(key, compressed, settings.COMPRESSION_CACHE_TTL)
+        else:
+            compressed = compress(body, encoding)
+
+        if len(compressed) >= len(body):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+    @staticmethod
+    def _should_compress(request: HttpRequest, response: HttpResponse) -> bool:
+        """
+        Return True if the response is eligible for compression.
+        """
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.has_header("Content-Encoding")
+            and request.path.startswith(tuple(settings.COMPRESSION_PATH_PREFIXES))
+            and bool(COMPRESSIBLE_TYPES.match(response.get("Content-Type", "")))
+            and len(response.content) >= settings.COMPRESSION_MIN_SIZE
+        )
+
+    @staticmethod
+    def _is_cacheable(request: HttpRequest, response: HttpResponse) -> bool:
+        """
+        Return True if the compressed body may be reused for other requests.
+        """
+        cache_control = response.get("Cache-Control", "")
+        return (
+            request.method in ("GET", "HEAD")
+            and "no-store" not in cache_control
+            and "private" not in cache_control
+            and len(response.content) <= settings.COMPRESSION_CACHE_MAX_SIZE
+        )
+
+
+class ThrottleMiddleware:
+    """
+    Applies the token-bucket throttles of `THROTTLE_RULES`.
+
+    Each rule has a bucket per client, so one client cannot hog an endpoint,
+    and a global bucket capping the total rate, so a burst spread over many
+    clients still cannot exhaust the workers or the payment providers'
+    quotas. Throttled requests get a 429 with `Retry-After`.
+
+    Must come after `AuthenticationMiddleware`: logged-in users are
+    throttled per account, anonymous clients per address.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        self.rules = load_rules()
+        self.store = import_string(settings.THROTTLE_STORE)()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rule = match_rule(self.rules, request)
+        if rule is not None:
+            retry_after = check_rule(
+                self.store, rule, client_ident(request, request.user)
+            )
+            if retry_after is not None:
+                return self.throttled(retry_after)
+        return self.get_response(request)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Async version of `__call__`.
+        """
+        rule = match_rule(self.rules, request)
+        if rule is not None:
+            user = await request.auser()
+            # Stores may block on a cache or database, so keep them off the loop.
+            retry_after = await sync_to_async(check_rule)(
+                self.store, rule, client_ident(request, user)
+            )
+            if retry_after is not None:
+                return self.throttled(retry_after)
+        return await self.get_response(request)
+
+    @staticmethod
+    def throttled(retry_after: int) -> HttpResponse:
+        """
+        Build the 429 response for a throttled request.
+        """
+        response = JsonResponse(
+            {
+                "detail": "Request was throttled. "
+                f"Expected available in {retry_after} seconds."
+            },
+            status=429,
+        )
+        response["Retry-After"] = str(retry_after)
+        return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Rejects low-priority requests while the process is overloaded.
+
+    Requests in flight are counted, and each priority may only start while
+    fewer than its share of `LOAD_SHEDDING_MAX_IN_FLIGHT` are running (see
+    `LOAD_SHEDDING_PRIORITIES`). Expensive checkout and cart writes are shed
+    first with a 503, leaving room for cheap catalog reads; `critical`
+    requests such as payment webhooks are never shed. Paths in
+    `LOAD_SHEDDING_EXEMPT_PATHS` spend their time waiting on events, not
+    working, so they are neither counted nor shed.
+
+    Should come first so shed requests cost as little as possible.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_exempt(request):
+            return self.get_response(request)
+        if not self.admit(request):
+            return self.shed()
+        try:
+            return self.get_response(request)
+        finally:
+            self.release()
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Async version of `__call__`.
+        """
+        if self.is_exempt(request):
+            return await self.get_response(request)
+        if not self.admit(request):
+            return self.shed()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.release()
+
+    @staticmethod
+    def is_exempt(request: HttpRequest) -> bool:
+        return request.path.startswith(tuple(settings.LOAD_SHEDDING_EXEMPT_PATHS))
+
+    def admit(self, request: HttpRequest) -> bool:
+        """
+        Count the request in if its priority still has room.
+        """
+        share = settings.LOAD_SHEDDING_PRIORITIES[shed_priority(request)]
+        with self._lock:
+            if (
+                share is not None
+                and self.in_flight >= settings.LOAD_SHEDDING_MAX_IN_FLIGHT * share
+            ):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        """
+        Count a finished request out.
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+    @staticmethod
+    def shed() -> HttpResponse:
+        """
+        Build the 503 response for a shed request.
+        """
+        response = JsonResponse(
+            {"detail": "Server is busy, please retry later."}, status=503
+        )
+        response["Retry-After"] = str(settings.LOAD_SHEDDING_RETRY_AFTER)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets the catalog reads of a request go to the read replicas.
+
+    Replicas trail the primary by up to `DATABASE_REPLICA_LAG_WINDOW`
+    seconds. Once a request writes, its remaining reads go to the primary,
+    and the response sets `DATABASE_REPLICA_PIN_COOKIE` so the same client
+    reads from the primary until the window has passed and the replicas
+    have its changes.
+
+    Should come before the session middleware so session writes count.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(pinned=self.is_pinned(request)) as state:
+            response = self.get_response(request)
+        return self.pin(response, state.wrote)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Async version of `__call__`.
+        """
+        with replica_reads(pinned=self.is_pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(response, state.wrote)
+
+    @staticmethod
+    def is_pinned(request: HttpRequest) -> bool:
+        return settings.DATABASE_REPLICA_PIN_COOKIE in request.COOKIES
+
+    @staticmethod
+    def pin(response: HttpResponse, wrote: bool) -> HttpResponse:
+        """
+        Keep the client on the primary for the lag window after a write.
+        """
+        if wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                settings.DATABASE_REPLICA_PIN_COOKIE,
+                "1",
+                max_age=math.ceil(settings.DATABASE_REPLICA_LAG_WINDOW),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 
 import environ
+from test_task_shop.database import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,14 +49,19 @@ INSTALLED_APPS = [
     "account",
     "cart",
     "payment",
+    "api",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "test_task_shop.middleware.LoadSheddingMiddleware",
+    "test_task_shop.middleware.CompressionMiddleware",
+    "test_task_shop.middleware.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "test_task_shop.middleware.ThrottleMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -87,12 +93,108 @@ WSGI_APPLICATION = "test_task_shop.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DATABASE_URL picks SQLite (sqlite:///<path>) or PostgreSQL
+# (postgres://<user>:<password>@<host>:<port>/<name>); see database_config
+# for the connection options of each.
+
+DATABASE_URL = env("DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+DATABASE_PROFILE = {
+    "tuned": env.bool("DATABASE_SQLITE_TUNING", default=True),
+    "busy_timeout": env.float("DATABASE_BUSY_TIMEOUT", default=20),
+    "mmap_size": env.int("DATABASE_SQLITE_MMAP_SIZE", default=256 * 1024 * 1024),
+    "pool": env.bool("DATABASE_POOL", default=True),
+    "pool_min_size": env.int("DATABASE_POOL_MIN_SIZE", default=2),
+    "pool_max_size": env.int("DATABASE_POOL_MAX_SIZE", default=20),
+    "pool_timeout": env.float("DATABASE_POOL_TIMEOUT", default=10),
+    "conn_max_age": env.int("DATABASE_CONN_MAX_AGE", default=60),
+}
+DATABASES = {"default": database_config(DATABASE_URL, **DATABASE_PROFILE)}
+
+# Read replicas (comma-separated URLs in DATABASE_REPLICA_URLS) serve the
+# reads of DATABASE_REPLICA_APPS; tests read them from the primary.
+
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), start=1):
+    DATABASES[f"replica_{number}"] = {
+        **database_config(url, **DATABASE_PROFILE),
+        "TEST": {"MIRROR": "default"},
     }
+    DATABASE_REPLICAS.append(f"replica_{number}")
+DATABASE_ROUTERS = ["test_task_shop.db_router.ReplicaRouter"]
+DATABASE_REPLICA_APPS = ["shop"]
+# Longest replication lag expected; clients that wrote read the primary this long
+DATABASE_REPLICA_LAG_WINDOW = env.float("DATABASE_REPLICA_LAG_WINDOW", default=5)
+DATABASE_REPLICA_PIN_COOKIE = "read_primary"
+
+# Catalog caching
+
+CATALOG_CACHE_TTL = env.int("CATALOG_CACHE_TTL", default=300)
+PRODUCT_BULK_MAX_ITEMS = env.int("PRODUCT_BULK_MAX_ITEMS", default=5000)
+# Seconds re-sent by every catalog sync to cover transactions still in flight
+CATALOG_SYNC_OVERLAP = env.int("CATALOG_SYNC_OVERLAP", default=5)
+CATALOG_TOMBSTONE_RETENTION_DAYS = env.int(
+    "CATALOG_TOMBSTONE_RETENTION_DAYS", default=30
+)
+
+# Django REST framework
+
+REST_FRAMEWORK = {
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.DefaultCursorPagination",
+    "PAGE_SIZE": env.int("API_PAGE_SIZE", default=50),
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+# Response compression
+
+COMPRESSION_PATH_PREFIXES = ["/v1/api/"]
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=1024)
+COMPRESSION_BROTLI_QUALITY = env.int("COMPRESSION_BROTLI_QUALITY", default=5)
+COMPRESSION_GZIP_LEVEL = env.int("COMPRESSION_GZIP_LEVEL", default=6)
+COMPRESSION_CACHE_TTL = env.int("COMPRESSION_CACHE_TTL", default=300)
+COMPRESSION_CACHE_MAX_SIZE = 2 * 1024 * 1024
+
+# Throttling and load shedding
+
+THROTTLE_STORE = "test_task_shop.throttling.InMemoryTokenBucketStore"
+THROTTLE_TRUST_X_FORWARDED_FOR = env.bool(
+    "THROTTLE_TRUST_X_FORWARDED_FOR", default=False
+)
+THROTTLE_RULES = {
+    "checkout": {
+        "paths": ["/v1/api/checkout/", "/payment/complete_order/"],
+        "rate": env.str("THROTTLE_CHECKOUT_RATE", default="10/min"),
+        "burst": 5,
+        "global_rate": env.str("THROTTLE_CHECKOUT_GLOBAL_RATE", default="20/s"),
+        "global_burst": 50,
+    },
+    "cart": {
+        "paths": ["/cart/add/", "/cart/update/", "/cart/delete/"],
+        "rate": env.str("THROTTLE_CART_RATE", default="60/min"),
+        "burst": 20,
+        "global_rate": env.str("THROTTLE_CART_GLOBAL_RATE", default="200/s"),
+        "global_burst": 400,
+    },
 }
+LOAD_SHEDDING_MAX_IN_FLIGHT = env.int("LOAD_SHEDDING_MAX_IN_FLIGHT", default=100)
+# Share of LOAD_SHEDDING_MAX_IN_FLIGHT a priority may start under; None never sheds
+LOAD_SHEDDING_PRIORITIES = {"critical": None, "high": 1.0, "normal": 0.7, "low": 0.4}
+# Path prefixes checked in order; other reads are "high", other writes "normal"
+LOAD_SHEDDING_RULES = [
+    ("/payment/webhook-", "critical"),
+    ("/payment/export/", "low"),
+    ("/v1/api/products/bulk/", "low"),
+]
+# Long-poll and event-stream endpoints, which mostly wait idle
+LOAD_SHEDDING_EXEMPT_PATHS = ["/v1/api/orders/"]
+LOAD_SHEDDING_RETRY_AFTER = 1
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -139,6 +241,11 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Idempotency keys for checkout endpoints
+
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60)
+IDEMPOTENCY_WAIT_TIMEOUT = env.int("IDEMPOTENCY_WAIT_TIMEOUT", default=60)
+
 # Stripe
 
 STRIPE_PUBLISHABLE_KEY = env("STRIPE_PUBLISHABLE_KEY")
@@ -152,4 +259,25 @@ BITPAY_SECRET = env("BITPAY_SECRET")
 # Simple Swap
 
 SIMPLE_SWAP = env("SIMPLE_SWAP")
+SIMPLE_SWAP_QUOTE_TTL = env.int("SIMPLE_SWAP_QUOTE_TTL", default=60)
 BTC_ADDRESS = env("BTC_ADDRESS")
+
+# Outgoing payment provider requests made by the async checkout
+
+PAYMENT_HTTP_TIMEOUT = env.int("PAYMENT_HTTP_TIMEOUT", default=10)
+PAYMENT_HTTP_POOL_SIZE = env.int("PAYMENT_HTTP_POOL_SIZE", default=100)
+
+# Order status push (v1/api/orders/<id>/status/)
+
+ORDER_EVENTS_BACKEND = "payment.events.LocalOrderEventBackend"
+ORDER_STATUS_LONG_POLL_TIMEOUT = env.int("ORDER_STATUS_LONG_POLL_TIMEOUT", default=30)
+ORDER_STATUS_STREAM_TIMEOUT = env.int("ORDER_STATUS_STREAM_TIMEOUT", default=300)
+ORDER_STATUS_KEEPALIVE = 15
+# Seconds an EventSource waits before reconnecting
+ORDER_STATUS_SSE_RETRY = 3
+
+# Admin bot token for the paid-order feed (v1/api/paid-orders/) and bulk product
+# writes (v1/api/products/bulk/); both are closed to it when empty
+
+ORDER_FEED_TOKEN = env("ORDER_FEED_TOKEN", default="")
+ORDER_FEED_MAX_BATCH = 500
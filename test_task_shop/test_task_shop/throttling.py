@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from django.conf import settings
+from django.http import HttpRequest
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def parse_rate(rate: str) -> float:
+    """
+    Convert a rate such as `10/min` or `20/s` into tokens per second.
+    """
+    num, _, period = rate.partition("/")
+    try:
+        return int(num) / PERIODS[period.strip()[0].lower()]
+    except (ValueError, KeyError, IndexError):
+        raise ValueError(f"Invalid throttle rate {rate!r}") from None
+
+
+class TokenBucketStore(Protocol):
+    """
+    Storage for token buckets, shared by every worker that should share limits.
+    """
+
+    def consume(self, key: str, rate: float, capacity: float) -> float:
+        """
+        Take one token from the bucket under `key`.
+
+        Return 0 if a token was taken, otherwise the seconds until one is
+        available.
+        """
+        ...
+
+
+class InMemoryTokenBucketStore:
+    """
+    Token buckets held in process memory.
+
+    Limits are per process, so with several workers each one enforces its own
+    share; a shared store implementing `TokenBucketStore` lifts that. Buckets
+    unused for longest are evicted past `max_keys`, which only forgets spent
+    tokens: an evicted bucket comes back full.
+    """
+
+    def __init__(self, max_keys: int = 10_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+@dataclass(frozen=True)
+class ThrottleRule:
+    """
+    Per-client and global token buckets guarding a set of paths.
+    """
+
+    name: str
+    paths: Tuple[str, ...]
+    rate: float
+    burst: int
+    global_rate: float
+    global_burst: int
+
+    @classmethod
+    def from_settings(cls, name: str, config: Dict[str, Any]) -> "ThrottleRule":
+        """
+        Build a rule from one entry of `THROTTLE_RULES`.
+        """
+        return cls(
+            name=name,
+            paths=tuple(config["paths"]),
+            rate=parse_rate(config["rate"]),
+            burst=config["burst"],
+            global_rate=parse_rate(config["global_rate"]),
+            global_burst=config["global_burst"],
+        )
+
+
+def load_rules() -> List[ThrottleRule]:
+    """
+    Return the throttle rules configured in `THROTTLE_RULES`.
+    """
+    return [
+        ThrottleRule.from_settings(name, config)
+        for name, config in settings.THROTTLE_RULES.items()
+    ]
+
+
+def match_rule(
+    rules: List[ThrottleRule], request: HttpRequest
+) -> Optional[ThrottleRule]:
+    """
+    Return the rule throttling the request, if any.
+
+    Only unsafe methods are throttled: these are the requests that write
+    orders and carts or call the payment providers.
+    """
+    if request.method in SAFE_METHODS:
+        return None
+    for rule in rules:
+        if request.path in rule.paths:
+            return rule
+    return None
+
+
+def check_rule(
+    store: TokenBucketStore, rule: ThrottleRule, client: str
+) -> Optional[int]:
+    """
+    Take a token for `client` and one from the rule's global bucket.
+
+    Return None if the request may proceed, otherwise the seconds to put in
+    `Retry-After`. The client bucket is checked first so that a client over
+    its own limit does not drain the global bucket for everybody else.
+    """
+    wait = store.consume(f"throttle:{rule.name}:{client}", rule.rate, rule.burst)
+    if not wait:
+        wait = store.consume(
+            f"throttle:{rule.name}:global", rule.global_rate, rule.global_burst
+        )
+    if not wait:
+        return None
+    return max(1, math.ceil(wait))
+
+
+def client_ident(request: HttpRequest, user: Any) -> str:
+    """
+    Identify the client: the user if logged in, otherwise the remote address.
+    """
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    if settings.THROTTLE_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return "ip:" + forwarded.split(",")[0].strip()
+    return "ip:" + request.META.get("REMOTE_ADDR", "")
+
+
+def shed_priority(request: HttpRequest) -> str:
+    """
+    Classify the request for load shedding.
+
+    `LOAD_SHEDDING_RULES` is checked in order; unmatched reads are `high`
+    so that catalog pages keep serving, and unmatched writes are `normal`.
+    """
+    for prefix, priority in settings.LOAD_SHEDDING_RULES:
+        if request.path.startswith(prefix):
+            return priority
+    return "high" if request.method in SAFE_METHODS else "normal"